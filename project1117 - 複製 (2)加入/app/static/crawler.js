@@ -862,7 +862,9 @@ async function showProductComparison(productIndex) {
   
   // 異步載入相關商品
   try {
-    const result = await findSimilarProducts(product);
+    const result = await findSimilarProducts(product, preview => {
+      updateModalWithRelatedProducts(product, preview.similarProducts, preview);
+    });
     updateModalWithRelatedProducts(product, result.similarProducts, result);
   } catch (error) {
     console.error('載入相關商品失敗:', error);
@@ -884,10 +886,65 @@ async function showProductComparison(productIndex) {
   }
 }
 
-// 尋找相關商品
-async function findSimilarProducts(product) {
+// 以 Server-Sent Events 串流比較：各平台爬取完成時先以本地預排序的候選呼叫 onPreview，AI 比對完成後 resolve
+function streamSimilarProducts(product, onPreview) {
+  return new Promise((resolve, reject) => {
+    const params = new URLSearchParams({
+      productName: product.title,
+      platform: product.platform || '',
+      price: product.price || 0
+    });
+    const source = new EventSource(`/api/products/compare/stream?${params}`);
+    let finished = false;
+    
+    source.addEventListener('preview', event => {
+      const data = JSON.parse(event.data);
+      if (!finished && onPreview && data.similarProducts && data.similarProducts.length > 0) {
+        onPreview({
+          similarProducts: data.similarProducts,
+          totalCandidates: data.totalCandidates || 0,
+          preview: true
+        });
+      }
+    });
+    
+    source.addEventListener('result', event => {
+      finished = true;
+      source.close();
+      const data = JSON.parse(event.data);
+      resolve({
+        similarProducts: data.similarProducts || [],
+        totalCandidates: data.totalCandidates || 0,
+        totalMatches: data.totalMatches || 0,
+        message: data.message
+      });
+    });
+    
+    // 伺服器推送的 error 事件帶有 data；連線失敗或中斷時沒有（此時 EventSource 會自動重連，需要主動關閉）
+    source.addEventListener('error', event => {
+      source.close();
+      if (finished) return;
+      finished = true;
+      const error = new Error(event.data ? JSON.parse(event.data).error : '串流連線中斷');
+      error.fromServer = Boolean(event.data);
+      reject(error);
+    });
+  });
+}
+
+// 尋找相關商品（onPreview 會在 AI 比對完成前收到初步結果）
+async function findSimilarProducts(product, onPreview = null) {
   console.log('開始尋找相關商品:', product.title);
   
+  if (window.EventSource) {
+    try {
+      return await streamSimilarProducts(product, onPreview);
+    } catch (error) {
+      if (error.fromServer) throw error;
+      console.warn('串流比較失敗，改用一般比較:', error);
+    }
+  }
+  
   try {
     const requestData = {
       productName: product.title,
@@ -950,8 +1007,10 @@ function updateModalWithRelatedProducts(originalProduct, relatedProducts, result
         console.log('第一個相關商品的圖片URL:', relatedProducts[0].image_url);
     }
     
-    // 顯示統計資訊
-    const stats = result.totalCandidates ? 
+    // 顯示統計資訊（串流預覽時 AI 尚未完成比對）
+    const stats = result.preview ?
+        `（已從各平台取得 ${result.totalCandidates} 個候選商品，AI 比對中...）` :
+        result.totalCandidates ? 
         `（從 ${result.totalCandidates} 個候選商品中找到 ${result.totalMatches || 0} 個匹配）` : '';
     
     if (!relatedProducts || relatedProducts.length === 0) {
@@ -1025,7 +1084,9 @@ function updateModalWithRelatedProducts(originalProduct, relatedProducts, result
     ` : '';
     
     relatedSection.innerHTML = `
-        <h5><i class="fas fa-layer-group text-success me-2"></i>找到 ${relatedProducts.length} 個相關商品</h5>
+        ${result.preview ?
+            `<h5><span class="spinner-border spinner-border-sm text-primary me-2" role="status"></span>初步找到 ${relatedProducts.length} 個可能相關的商品</h5>` :
+            `<h5><i class="fas fa-layer-group text-success me-2"></i>找到 ${relatedProducts.length} 個相關商品</h5>`}
         ${stats ? `<small class="text-muted mb-3 d-block">${stats}</small>` : ''}
         <div class="row">
             ${relatedHTML}
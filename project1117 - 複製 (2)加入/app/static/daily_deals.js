@@ -62,6 +62,9 @@ function updatePlatformDescription(platform) {
     }
 }
 
+// 每頁筆數（後端上限為 500）
+const DAILY_DEALS_PAGE_SIZE = 500;
+
 // 載入每日促銷資料
 async function loadDailyDeals(platform = 'all', force_sync = false) {
     console.log('載入每日促銷資料，平台:', platform);
@@ -71,17 +74,40 @@ async function loadDailyDeals(platform = 'all', force_sync = false) {
     showSyncStatus('正在檢查GitHub最新資料...', 'info');
     
     try {
-        const url = `/api/daily-deals${platform !== 'all' ? `?platform=${platform}` : ''}${force_sync ? (platform !== 'all' ? '&' : '?') + 'auto_sync=true' : ''}`;
-        console.log('請求 URL:', url);
+        // 後端每次最多回傳 DAILY_DEALS_PAGE_SIZE 筆，依 next_cursor 逐頁取完
+        const params = new URLSearchParams({ limit: DAILY_DEALS_PAGE_SIZE });
+        if (platform !== 'all') params.set('platform', platform);
+        if (force_sync) params.set('auto_sync', 'true');
         
-        const response = await fetch(url);
-        const data = await response.json();
+        let data = null;
+        const pageDeals = [];
+        let after = null;
+        do {
+            if (after) {
+                params.set('after', after);
+                params.set('auto_sync', 'false');  // 同步只需在第一頁檢查
+            }
+            const url = `/api/daily-deals?${params.toString()}`;
+            console.log('請求 URL:', url);
+            
+            const response = await fetch(url);
+            const page = await response.json();
+            if (page.status !== 'success') {
+                data = page;
+                break;
+            }
+            pageDeals.push(...page.daily_deals);
+            // 總數與同步狀態以第一頁為準
+            data = data || page;
+            after = page.next_cursor;
+        } while (after);
+        if (data.status === 'success') data.daily_deals = pageDeals;
         
         console.log('API 回應:', data);
         
-        // 顯示同步結果
-        if (data.sync_performed) {
-            showSyncStatus('✅ 已從GitHub獲取最新資料', 'success');
+        // 顯示同步結果（同步在背景進行，不會延遲這次載入）
+        if (data.sync_in_progress) {
+            showSyncStatus('🔄 正在背景從GitHub更新資料，稍後重新整理即可看到最新內容', 'info');
         } else {
             showSyncStatus('📊 使用本地資料（已是最新）', 'info');
         }
@@ -439,7 +465,9 @@ async function showProductDetail(productIndex) {
     
     // 異步載入相關商品
     try {
-        const result = await findRelatedProducts(product);
+        const result = await findRelatedProducts(product, preview => {
+            updateModalWithRelatedProducts(product, preview.products, preview);
+        });
         updateModalWithRelatedProducts(product, result.products, result);
     } catch (error) {
         console.error('載入相關商品失敗:', error);
@@ -461,10 +489,90 @@ async function showProductDetail(productIndex) {
     }
 }
 
-// 尋找相關商品
-async function findRelatedProducts(product) {
+// 讀取背景預先比對的結果（尚未比對時返回 null）
+async function loadPrecomputedMatches(product) {
+    if (!product.id) return null;
+    try {
+        const response = await fetch(`/api/daily-deals/${product.id}/matches`);
+        if (!response.ok) return null;
+        const data = await response.json();
+        console.log('使用預先比對結果:', data.computedAt);
+        return {
+            products: data.similarProducts || [],
+            totalCandidates: data.totalCandidates || 0,
+            totalMatches: data.totalMatches || 0,
+            message: data.message
+        };
+    } catch (error) {
+        console.warn('讀取預先比對結果失敗，改用即時比較:', error);
+        return null;
+    }
+}
+
+// 以 Server-Sent Events 串流比較：各平台爬取完成時先以本地預排序的候選呼叫 onPreview，AI 比對完成後 resolve
+function streamRelatedProducts(product, onPreview) {
+    return new Promise((resolve, reject) => {
+        const params = new URLSearchParams({
+            productName: product.title,
+            platform: product.source_platform || '',
+            price: product.price || 0
+        });
+        const source = new EventSource(`/api/products/compare/stream?${params}`);
+        let finished = false;
+        
+        source.addEventListener('preview', event => {
+            const data = JSON.parse(event.data);
+            if (!finished && onPreview && data.similarProducts && data.similarProducts.length > 0) {
+                onPreview({
+                    products: data.similarProducts,
+                    totalCandidates: data.totalCandidates || 0,
+                    preview: true
+                });
+            }
+        });
+        
+        source.addEventListener('result', event => {
+            finished = true;
+            source.close();
+            const data = JSON.parse(event.data);
+            resolve({
+                products: data.similarProducts || [],
+                totalCandidates: data.totalCandidates || 0,
+                totalMatches: data.totalMatches || 0,
+                message: data.message
+            });
+        });
+        
+        // 伺服器推送的 error 事件帶有 data；連線失敗或中斷時沒有（此時 EventSource 會自動重連，需要主動關閉）
+        source.addEventListener('error', event => {
+            source.close();
+            if (finished) return;
+            finished = true;
+            const error = new Error(event.data ? JSON.parse(event.data).error : '串流連線中斷');
+            error.fromServer = Boolean(event.data);
+            reject(error);
+        });
+    });
+}
+
+// 尋找相關商品（onPreview 會在 AI 比對完成前收到初步結果）
+async function findRelatedProducts(product, onPreview = null) {
     console.log('開始尋找相關商品:', product.title);
     
+    const precomputed = await loadPrecomputedMatches(product);
+    if (precomputed) {
+        return precomputed;
+    }
+    
+    if (window.EventSource) {
+        try {
+            return await streamRelatedProducts(product, onPreview);
+        } catch (error) {
+            if (error.fromServer) throw error;
+            console.warn('串流比較失敗，改用一般比較:', error);
+        }
+    }
+    
     try {
         const requestData = {
             productName: product.title,
@@ -527,8 +635,10 @@ function updateModalWithRelatedProducts(originalProduct, relatedProducts, result
         console.log('第一個相關商品的圖片URL:', relatedProducts[0].image_url);
     }
     
-    // 顯示統計資訊
-    const stats = result.totalCandidates ? 
+    // 顯示統計資訊（串流預覽時 AI 尚未完成比對）
+    const stats = result.preview ?
+        `（已從各平台取得 ${result.totalCandidates} 個候選商品，AI 比對中...）` :
+        result.totalCandidates ? 
         `（從 ${result.totalCandidates} 個候選商品中找到 ${result.totalMatches || 0} 個匹配）` : '';
     
     if (!relatedProducts || relatedProducts.length === 0) {
@@ -602,7 +712,9 @@ function updateModalWithRelatedProducts(originalProduct, relatedProducts, result
     ` : '';
     
     relatedSection.innerHTML = `
-        <h5><i class="fas fa-layer-group text-success me-2"></i>找到 ${relatedProducts.length} 個相關商品</h5>
+        ${result.preview ?
+            `<h5><span class="spinner-border spinner-border-sm text-primary me-2" role="status"></span>初步找到 ${relatedProducts.length} 個可能相關的商品</h5>` :
+            `<h5><i class="fas fa-layer-group text-success me-2"></i>找到 ${relatedProducts.length} 個相關商品</h5>`}
         ${stats ? `<small class="text-muted mb-3 d-block">${stats}</small>` : ''}
         <div class="row">
             ${relatedHTML}
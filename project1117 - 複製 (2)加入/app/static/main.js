@@ -56,7 +56,7 @@ async function loadPlatforms() {
 // 載入每日促銷統計
 async function loadDailyDealsStats() {
   try {
-    const response = await fetch("/api/daily-deals");
+    const response = await fetch("/api/daily-deals?limit=1");  // 只需要總數，不用取回商品列表
     const data = await response.json();
 
     if (data.status === "success") {
@@ -830,6 +830,27 @@ function updateSelectAllCheckbox() {
     }
 }
 
+// 輪詢背景刪除（或歸檔）任務直到結束
+async function waitForPurgeJob(job, endpoint = '/api/database/purge') {
+    while (job && (job.status === 'pending' || job.status === 'running')) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const response = await fetch(`${endpoint}/${job.job_id}`);
+        const data = await response.json();
+        if (data.status !== 'success') {
+            break;
+        }
+        job = data.job;
+    }
+    return job;
+}
+
+function purgeStatusText(job) {
+    if (job.status === 'completed') return '清理完成';
+    if (job.status === 'cancelled') return '清理已取消';
+    if (job.status === 'failed') return `清理失敗（${job.error}）`;
+    return '清理進行中';
+}
+
 // 清理舊資料
 async function cleanOldSessions(days) {
     if (!confirm(`確定要刪除 ${days} 天前的所有搜尋資料嗎？`)) {
@@ -844,7 +865,8 @@ async function cleanOldSessions(days) {
         const data = await response.json();
         
         if (data.status === 'success') {
-            alert(`成功清理了 ${data.deleted_sessions || 0} 個搜尋會話和 ${data.deleted_products || 0} 個商品`);
+            const job = await waitForPurgeJob(data.job);
+            alert(`${purgeStatusText(job)}：清理了 ${job.sessions_deleted || 0} 個搜尋會話和 ${job.products_deleted || 0} 個商品`);
             loadResults();
         } else {
             alert('清理失敗: ' + data.error);
@@ -855,6 +877,35 @@ async function cleanOldSessions(days) {
     }
 }
 
+// 歸檔舊資料（移出資料庫但仍可查看）
+async function archiveOldSessions(days) {
+    if (!confirm(`確定要將 ${days} 天前的搜尋資料移到歸檔檔案嗎？歸檔後仍可開啟查看。`)) {
+        return;
+    }
+
+    try {
+        const response = await fetch(`/api/database/archive/${days}`, {
+            method: 'POST'
+        });
+        
+        const data = await response.json();
+        
+        if (data.status === 'success') {
+            const job = await waitForPurgeJob(data.job, '/api/database/archive/jobs');
+            const statusText = job.status === 'completed' ? '歸檔完成'
+                : job.status === 'cancelled' ? '歸檔已取消'
+                : job.status === 'failed' ? `歸檔失敗（${job.error}）` : '歸檔進行中';
+            alert(`${statusText}：歸檔了 ${job.sessions_archived || 0} 個搜尋會話和 ${job.products_archived || 0} 個商品`);
+            loadResults();
+        } else {
+            alert('歸檔失敗: ' + data.error);
+        }
+    } catch (error) {
+        console.error('歸檔資料時出錯:', error);
+        alert('歸檔時發生錯誤');
+    }
+}
+
 // 清理空的搜尋結果
 async function cleanEmptySessions() {
     if (!confirm('確定要刪除所有沒有商品的搜尋結果嗎？')) {
@@ -869,7 +920,8 @@ async function cleanEmptySessions() {
         const data = await response.json();
         
         if (data.status === 'success') {
-            alert(`成功清理了 ${data.deleted_sessions || 0} 個空的搜尋會話`);
+            const job = await waitForPurgeJob(data.job);
+            alert(`${purgeStatusText(job)}：清理了 ${job.sessions_deleted || 0} 個空的搜尋會話`);
             loadResults();
         } else {
             alert('清理失敗: ' + data.error);
@@ -890,7 +942,7 @@ async function optimizeDatabase() {
         const data = await response.json();
         
         if (data.status === 'success') {
-            alert('資料庫優化完成！');
+            alert(data.message || '已排入資料庫維護');
         } else {
             alert('優化失敗: ' + data.error);
         }
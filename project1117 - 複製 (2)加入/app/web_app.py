@@ -3,13 +3,14 @@
 使用Flask和SQLite建立Web介面來顯示和管理爬蟲結果
 """
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 import os
 import json
 import sys
 import importlib.util
 import re
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
 from threading import Thread
 
 # 添加路徑到sys.path
@@ -17,11 +18,23 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
 from core.crawler_manager import CrawlerManager
-from core.product_filter import ProductFilter
-from core.database import get_db_connection, init_db
-from core.github_sync import auto_sync_if_needed, download_latest_database
+from core.product_filter import FilterError, ProductFilter
+from core.archive import get_archive_manager, list_archived_sessions
+from core.backup import create_backup, list_backups, restore_backup
+from core.database import get_db_connection, init_db, read_snapshot
+from core.db_writer import get_db_writer
+from core.delta_sync import encode_changeset, produce_changeset
+from core.embeddings import get_embedding_syncer
+from core.llm_gateway import get_llm_gateway
+from core.llm_metrics import get_llm_metrics
+from core.maintenance import get_maintenance_scheduler
+from core.minhash import find_similar, get_title_indexer
+from core.purge import get_purge_manager
+from core.github_sync import CHANNEL_DATABASE, load_sync_state
+from core.sync_scheduler import get_sync_scheduler
 from core.services.product_comparison_service import ProductComparisonService
 from core.services.daily_deals_service import DailyDealsService
+from core.services.deal_match_service import DealMatchService
 from core.services.database_service import DatabaseService
 
 try:
@@ -80,6 +93,10 @@ def dict_from_rows(rows):
     """將 sqlite3.Row 物件列表轉換為字典列表"""
     return [dict(row) for row in rows]
 
+def is_paginated_request():
+    """請求是否帶有 keyset 分頁參數（limit 或 after）"""
+    return 'limit' in request.args or 'after' in request.args
+
 def build_live_search_keyword(title: str) -> str:
     """清理商品標題並產生即時爬取使用的關鍵詞"""
     if not title:
@@ -106,93 +123,109 @@ def build_live_search_keyword(title: str) -> str:
 
     return search_keyword
 
-def get_live_candidate_products(target_product):
-    """改為即時爬取候選商品，不再使用資料庫快取"""
-    try:
-        search_keyword = build_live_search_keyword(target_product.get('title', ''))
-        if not search_keyword:
-            return []
+# 即時比較時爬取候選商品的平台
+LIVE_CRAWL_PLATFORMS = ['carrefour', 'pchome', 'yahoo', 'routn']
 
-        candidate_products = []
-        seen_urls = set()
-        crawl_platforms = ['carrefour', 'pchome', 'yahoo', 'routn']
+def iter_live_candidate_batches(target_product):
+    """
+    同時即時爬取各平台的候選商品（不使用資料庫快取）
 
-        for platform in crawl_platforms:
-            try:
-                crawl_result = crawler_manager.run_single_crawler(
-                    platform=platform,
-                    keyword=search_keyword,
-                    max_products=30,
-                    min_price=0,
-                    max_price=999999
-                )
+    每個平台爬取完成時產生 (平台, 候選商品列表, 錯誤訊息)；不同平台的重複 URL 只保留先完成的一筆。
+    """
+    search_keyword = build_live_search_keyword(target_product.get('title', ''))
+    if not search_keyword:
+        return
 
-                if crawl_result['status'] == 'success' and crawl_result['products']:
-                    for product in crawl_result['products']:
-                        url = product.get('url', '')
-                        if url and url in seen_urls:
-                            continue
-                        if url:
-                            seen_urls.add(url)
-
-                        candidate_product = {
-                            'title': product.get('title') or product.get('name', ''),
-                            'platform': platform,
-                            'price': product.get('price', 0),
-                            'url': url,
-                            'image_url': product.get('image_url', ''),
-                            'source_table': 'live_crawl'
-                        }
-                        candidate_products.append(candidate_product)
+    seen_urls = set()
+    executor = ThreadPoolExecutor(max_workers=len(LIVE_CRAWL_PLATFORMS))
+    try:
+        futures = {
+            executor.submit(
+                crawler_manager.run_single_crawler,
+                platform=platform,
+                keyword=search_keyword,
+                max_products=30,
+                min_price=0,
+                max_price=999999
+            ): platform
+            for platform in LIVE_CRAWL_PLATFORMS
+        }
 
+        for future in as_completed(futures):
+            platform = futures[future]
+            try:
+                crawl_result = future.result()
             except Exception as crawl_error:
                 print(f"爬取 {platform} 時發生錯誤: {crawl_error}")
+                yield platform, [], str(crawl_error)
                 continue
 
-        print(f"⚡ 即時爬取取得 {len(candidate_products)} 個候選商品")
-        return candidate_products
-
+            candidate_products = []
+            if crawl_result['status'] == 'success' and crawl_result['products']:
+                for product in crawl_result['products']:
+                    url = product.get('url', '')
+                    if url and url in seen_urls:
+                        continue
+                    if url:
+                        seen_urls.add(url)
+
+                    candidate_products.append({
+                        'title': product.get('title') or product.get('name', ''),
+                        'platform': platform,
+                        'price': product.get('price', 0),
+                        'url': url,
+                        'image_url': product.get('image_url', ''),
+                        'source_table': 'live_crawl'
+                    })
+            yield platform, candidate_products, crawl_result.get('error')
+    finally:
+        # 用戶端中途斷線時不再等待尚未開始的爬取
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def compare_products_live_events(target_product):
+    """
+    即時比較的事件流程，依序產生 (事件名稱, 資料)：
+
+    - candidates：每個平台爬取完成時，該平台的候選商品
+    - preview：目前所有候選以本地 BM25 預排序的前幾名（不呼叫 AI）
+    - result：AI 比對結果（格式與 compare_products_live 的回傳值相同），AI 有匹配結果時寫入比較快取
+    """
+    print("快取中沒有結果，直接進行即時候選爬取...")
+    candidate_products = []
+    try:
+        for platform, candidates, error in iter_live_candidate_batches(target_product):
+            candidate_products.extend(candidates)
+            yield 'candidates', {
+                'platform': platform,
+                'products': candidates,
+                'error': error,
+                'totalCandidates': len(candidate_products)
+            }
+            if candidates:
+                yield 'preview', {
+                    'similarProducts': product_comparison_service.preview_candidates(target_product, candidate_products),
+                    'totalCandidates': len(candidate_products)
+                }
     except Exception as e:
         print(f"即時爬取候選商品時發生錯誤: {e}")
-        return []
-
-def compare_products_live(target_product):
-    """直接透過即時爬取比對商品，不依賴快取"""
-    print("快取中沒有結果，直接進行即時候選爬取...")
-    candidate_products = get_live_candidate_products(target_product)
+    print(f"⚡ 即時爬取取得 {len(candidate_products)} 個候選商品")
 
     if not candidate_products:
         print("警告: 沒有候選商品可供比較")
-        return {
+        yield 'result', {
             'similarProducts': [],
             'totalCandidates': 0,
             'message': '沒有候選商品可供比較'
         }
+        return
 
     print("開始調用 AI 進行商品比較...")
     matches = product_comparison_service.compare_products(target_product, candidate_products)
     print(f"AI 回傳 {len(matches)} 個匹配結果")
 
-    similar_products = []
-    for match in matches:
-        similarity = match.get('similarity', 0)
-        if similarity >= 0.80:
-            try:
-                product_index = match['index']
-                if 0 <= product_index < len(candidate_products):
-                    product = candidate_products[product_index]
-                    product['similarity'] = similarity
-                    product['reason'] = match.get('reason', '')
-                    product['confidence'] = match.get('confidence', '')
-                    product['category'] = match.get('category', '')
-                    similar_products.append(product)
-            except (IndexError, KeyError) as parse_error:
-                print(f"解析比較結果時發生錯誤: {parse_error}")
-                continue
-
-    similar_products.sort(key=lambda x: x.get('similarity', 0), reverse=True)
+    similar_products = product_comparison_service.build_similar_products(matches, candidate_products)
 
-    return {
+    result = {
         'similarProducts': similar_products,
         'totalCandidates': len(candidate_products),
         'totalMatches': len(matches),
@@ -200,9 +233,28 @@ def compare_products_live(target_product):
         'source': 'live'
     }
 
+    # AI 呼叫失敗時 compare_products 也會返回空列表，因此只快取有匹配結果的比較
+    if matches:
+        try:
+            search_keyword = build_live_search_keyword(target_product.get('title', ''))
+            product_comparison_service.store_comparison(target_product, search_keyword, result)
+        except Exception as cache_error:
+            print(f"寫入比較快取失敗: {cache_error}")
+
+    yield 'result', result
+
+def compare_products_live(target_product):
+    """即時爬取候選商品並比對，等待整個流程完成後返回 result 事件的資料"""
+    result = None
+    for event, data in compare_products_live_events(target_product):
+        if event == 'result':
+            result = data
+    return result
+
 # --- 初始化服務 ---
 product_comparison_service = ProductComparisonService(model)
-daily_deals_service = DailyDealsService(crawler_manager)
+deal_match_service = DealMatchService(product_comparison_service)
+daily_deals_service = DailyDealsService(crawler_manager, deal_match_service)
 database_service = DatabaseService()
 
 # 爬蟲狀態追蹤（兼容舊代碼）
@@ -213,7 +265,8 @@ crawler_status = daily_deals_service.get_status()
 def index():
     # 直接在服務器端獲取數據並傳給模板
     try:
-        sessions = database_service.get_crawl_sessions()
+        # 首頁只需伺服器端渲染最新一頁，完整列表由前端透過 /api/results 載入
+        sessions = database_service.get_crawl_sessions_page(limit=100)['items']
         print(f"🔍 首頁載入: 找到 {len(sessions)} 個會話")
         if sessions:
             print(f"最新會話: {sessions[0]['keyword']} - {sessions[0]['total_products']} 個商品")
@@ -319,13 +372,27 @@ def start_crawl():
 
 @app.route('/api/results')
 def get_results():
-    """從資料庫獲取所有爬蟲任務結果"""
+    """從資料庫獲取爬蟲任務結果（帶 limit / after 參數時使用 keyset 分頁）"""
     try:
+        if is_paginated_request():
+            page = database_service.get_crawl_sessions_page(
+                limit=request.args.get('limit', type=int),
+                after=request.args.get('after')
+            )
+            return jsonify({
+                'files': page['items'], # 'files' for frontend compatibility
+                'next_cursor': page['next_cursor'],
+                'has_more': page['has_more'],
+                'status': 'success'
+            })
+
         sessions = database_service.get_crawl_sessions()
         return jsonify({
             'files': sessions, # 'files' for frontend compatibility
             'status': 'success'
         })
+    except ValueError as e:
+        return jsonify({'error': str(e), 'status': 'error'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -335,13 +402,38 @@ def get_result_detail(session_id):
     try:
         print(f"🔍 API 詳情請求: session_id={session_id}")
         
-        # 獲取統計信息
-        stats = database_service.get_session_detail(session_id)
+        # 已歸檔的任務從歸檔檔案讀回
+        archived = database_service.get_archived_session(session_id)
+        
+        # 獲取統計信息與商品列表（帶 limit / after 參數時只取一頁）
+        page = None
+        if archived is not None:
+            stats = archived['statistics']
+            print(f"📦 任務 {session_id} 已歸檔，從歸檔檔案讀取")
+            if is_paginated_request():
+                page = database_service.page_archived_products(
+                    archived['products'],
+                    limit=request.args.get('limit', type=int),
+                    after=request.args.get('after')
+                )
+                products = page['items']
+            else:
+                products = archived['products']
+        else:
+            # 統計與商品在同一個讀取快照中查詢，數量不會因背景寫入而不一致
+            with read_snapshot() as snapshot:
+                stats = database_service.get_session_detail(session_id, conn=snapshot)
+                if is_paginated_request():
+                    page = database_service.get_session_products_page(
+                        session_id,
+                        limit=request.args.get('limit', type=int),
+                        after=request.args.get('after'),
+                        conn=snapshot
+                    )
+                    products = page['items']
+                else:
+                    products = snapshot.execute('SELECT * FROM products WHERE session_id = ? ORDER BY price', (session_id,)).fetchall()
         print(f"📊 統計信息: {stats}")
-        
-        # 獲取商品列表
-        conn = get_db_connection()
-        products = conn.execute('SELECT * FROM products WHERE session_id = ? ORDER BY price', (session_id,)).fetchall()
         print(f"🛍️ 找到 {len(products)} 個商品")
         
         # 組織成前端期望的格式
@@ -365,10 +457,8 @@ def get_result_detail(session_id):
             results[platform]['products'].append(dict(product))
             results[platform]['total_products'] += 1
         
-        conn.close()
-        
         # 返回前端期望的格式
-        return jsonify({
+        response = {
             'status': 'success',
             'data': {
                 'session': {
@@ -382,37 +472,77 @@ def get_result_detail(session_id):
             'results': results,  # 保留原有格式以防其他地方需要
             'statistics': stats,
             'filename': f'crawler_results_session_{session_id}.json',
-            'message': f'載入會話 {session_id} 的結果，共 {len(products)} 個商品'
-        })
+            'message': f'載入會話 {session_id} 的結果，共 {len(products)} 個商品',
+            'archived': archived is not None
+        }
+        if page is not None:
+            # 分頁時商品總數與平台以預先計算的統計為準
+            response['data']['session']['total_products'] = stats['price_stats']['total']
+            response['data']['session']['platforms'] = list(stats['platforms'].keys())
+            response['next_cursor'] = page['next_cursor']
+            response['has_more'] = page['has_more']
+        return jsonify(response)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'status': 'error'}), 400
     except Exception as e:
         print(f"獲取會話詳情錯誤: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e), 'status': 'error'}), 500
 
+@app.route('/api/statistics/<int:session_id>')
+def get_session_statistics(session_id):
+    """獲取特定任務的統計資料（讀取預先計算的 session_stats）"""
+    try:
+        stats = database_service.get_session_detail(session_id)
+        return jsonify({
+            'status': 'success',
+            'statistics': stats
+        })
+    except Exception as e:
+        return jsonify({'error': str(e), 'status': 'error'}), 404
+
 @app.route('/api/daily-deals')
 def get_daily_deals():
-    """從資料庫獲取每日促銷結果，自動檢查GitHub更新"""
+    """從資料庫獲取每日促銷結果（立即讀取本地資料，過期時在背景向GitHub更新）"""
     platform_filter = request.args.get('platform', 'all')
     auto_sync = request.args.get('auto_sync', 'true').lower() == 'true'
     
     try:
-        # 如果啟用自動同步，先檢查是否需要從GitHub更新資料
-        sync_performed = False
-        if auto_sync:
-            try:
-                # 檢查資料是否需要更新（超過1小時就同步）
-                updated = auto_sync_if_needed(max_age_hours=1)
-                if updated:
-                    sync_performed = True
-                    print("✅ 每日促銷API：已從GitHub同步最新資料")
-            except Exception as sync_error:
-                print(f"⚠️ 每日促銷API：GitHub同步失敗，使用本地資料: {sync_error}")
-        
-        result = database_service.get_daily_deals(platform_filter)
+        # 不在請求中等待網路：資料過期時只要求背景同步，這次先回傳本地資料
+        sync_scheduler = get_sync_scheduler()
+        sync_triggered = auto_sync and sync_scheduler.refresh_if_stale()
+        
+        result = database_service.get_daily_deals(
+            platform_filter,
+            limit=request.args.get('limit', type=int),
+            after=request.args.get('after')
+        )
         result['status'] = 'success'
-        result['sync_performed'] = sync_performed
+        result['sync_in_progress'] = sync_triggered or sync_scheduler.syncing
+        result['last_sync'] = sync_scheduler.last_success
         return jsonify(result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/daily-deals/changes')
+def get_daily_deals_changes():
+    """daily_deals 增量變更集（lzma 壓縮），供其他站台以 core.delta_sync.pull_changes 同步"""
+    since = request.args.get('since') or None
+    try:
+        with read_snapshot() as conn:
+            changeset = produce_changeset(conn, since)
+        return Response(
+            encode_changeset(changeset),
+            mimetype='application/x-xz',
+            headers={
+                'X-Changeset-Kind': changeset['kind'],
+                'X-Changeset-Watermark': changeset['watermark'] or '',
+                'X-Changeset-Rows': str(changeset['row_count']),
+            }
+        )
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -422,6 +552,28 @@ def update_daily_deals():
     result = daily_deals_service.start_update()
     return jsonify(result)
 
+@app.route('/api/daily-deals/<int:deal_id>/matches')
+def get_deal_matches(deal_id):
+    """讀取每日促銷商品的預先比對結果（尚未比對時返回 404，前端改用即時比較）"""
+    try:
+        result = deal_match_service.get_deal_matches(deal_id)
+        if result is None:
+            return jsonify({'error': '此商品尚未完成預先比對'}), 404
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/daily-deals/matches', methods=['GET'])
+def get_deal_matches_status():
+    """每日促銷預先比對的執行狀態"""
+    return jsonify(deal_match_service.get_status())
+
+@app.route('/api/daily-deals/matches', methods=['POST'])
+def start_deal_matches():
+    """手動開始每日促銷預先比對"""
+    result = deal_match_service.start()
+    return jsonify(result), 202 if result['status'] == 'success' else 409 if result['status'] == 'warning' else 503
+
 @app.route('/api/products/compare', methods=['POST'])
 def compare_products_api():
     """商品比較 API，直接觸發即時爬取"""
@@ -437,6 +589,18 @@ def compare_products_api():
         
         print(f"目標商品: {target_product_name} | {target_platform} | ${target_price}")
         
+        target_product = {
+            'title': target_product_name,
+            'platform': target_platform,
+            'price': target_price
+        }
+
+        # 先查比較快取，命中時不需要爬取與呼叫 AI
+        cached = product_comparison_service.get_cached_comparison(target_product)
+        if cached:
+            print(f"=== 商品比較 API 完成 (快取，建立於 {cached['cachedAt']}) ===")
+            return jsonify(cached)
+
         if not GEMINI_AVAILABLE:
             print("錯誤: Gemini 不可用")
             return jsonify({'error': 'Gemini 套件未安裝'}), 503
@@ -445,12 +609,6 @@ def compare_products_api():
             print("錯誤: Gemini 模型未配置")
             return jsonify({'error': 'Gemini API 未配置或 API 金鑰無效'}), 503
         
-        target_product = {
-            'title': target_product_name,
-            'platform': target_platform,
-            'price': target_price
-        }
-        
         result = compare_products_live(target_product)
         
         print("=== 商品比較 API 完成 (即時爬取) ===")
@@ -462,6 +620,104 @@ def compare_products_api():
         traceback.print_exc()
         return jsonify({'error': f'商品比較失敗: {str(e)}'}), 500
 
+@app.route('/api/products/compare/stream')
+def compare_products_stream_api():
+    """
+    商品比較的串流版本（Server-Sent Events），參數與 /api/products/compare 相同但放在查詢字串
+
+    依序推送 candidates（每個平台爬取完成時）、preview（本地預排序）與 result（AI 比對結果）事件；
+    命中比較快取時直接推送 result，發生錯誤時推送 error。
+    """
+    target_product = {
+        'title': request.args.get('productName', ''),
+        'platform': request.args.get('platform', ''),
+        'price': request.args.get('price', 0, type=float)
+    }
+    if not target_product['title']:
+        return jsonify({'error': '請提供 productName'}), 400
+
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    def generate():
+        try:
+            cached = product_comparison_service.get_cached_comparison(target_product)
+            if cached:
+                yield sse('result', cached)
+                return
+
+            if not GEMINI_AVAILABLE or not model:
+                yield sse('error', {'error': 'Gemini API 未配置或 API 金鑰無效'})
+                return
+
+            for event, data in compare_products_live_events(target_product):
+                yield sse(event, data)
+        except Exception as e:
+            print(f"串流商品比較發生錯誤: {e}")
+            yield sse('error', {'error': f'商品比較失敗: {str(e)}'})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/products/similar', methods=['GET'])
+def similar_products_api():
+    """
+    從歷史資料中找出標題相近的商品（不爬取、不呼叫 AI）
+
+    method=lsh（預設）查詢歷史商品與每日促銷的 MinHash/LSH 索引；
+    method=embedding 查詢歷史商品的標題向量索引
+    """
+    title = request.args.get('title', '').strip()
+    if not title:
+        return jsonify({'error': '請提供商品標題'}), 400
+    try:
+        k = min(max(int(request.args.get('k', 10)), 1), 50)
+        exclude_platform = request.args.get('exclude_platform') or None
+        if request.args.get('method') == 'embedding':
+            matches = product_comparison_service.find_history_candidates({'title': title}, k, exclude_platform)
+        else:
+            matches = find_similar(title, k, exclude_platform=exclude_platform)
+        return jsonify({'success': True, 'title': title, 'similarProducts': matches, 'source': 'history'})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/metrics/llm')
+def llm_metrics_api():
+    """Gemini 呼叫的 token、延遲、費用估計與直方圖（可用 window 秒數與 feature 參數限定範圍）"""
+    try:
+        window = request.args.get('window', type=float)
+        feature = request.args.get('feature') or None
+        return jsonify({
+            'success': True,
+            'metrics': get_llm_metrics().snapshot(window, feature),
+            'cache': get_llm_gateway().get_stats(),
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/products/compare/cache', methods=['GET'])
+def comparison_cache_metrics():
+    """比較快取的命中率與筆數"""
+    try:
+        return jsonify({'success': True, 'metrics': product_comparison_service.get_cache_metrics()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/products/compare/cache', methods=['DELETE'])
+def invalidate_comparison_cache_api():
+    """使比較快取失效；可用 keyword 或 productName 參數限定範圍，未指定時清除全部"""
+    try:
+        deleted = product_comparison_service.invalidate_cache(
+            search_keyword=request.args.get('keyword'),
+            target_title=request.args.get('productName')
+        )
+        return jsonify({'success': True, 'deleted': deleted})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/products/filter', methods=['POST'])
 def filter_products_api():
     """商品過濾 API - 使用 ProductFilter 過濾指定 session 的商品"""
@@ -482,6 +738,12 @@ def filter_products_api():
             'statistics': stats
         })
         
+    except FilterError as e:
+        print(f"商品過濾未完成: {e}")
+        return jsonify({
+            'error': f'商品過濾未完成，未標記任何商品，請稍後重試: {str(e)}',
+            'failed_chunks': e.failed_chunks
+        }), 502
     except Exception as e:
         print(f"商品過濾錯誤: {e}")
         return jsonify({'error': f'商品過濾失敗: {str(e)}'}), 500
@@ -566,7 +828,8 @@ def debug_info():
         'message': '伺服器運行正常',
         'available_crawlers': crawler_manager.list_crawlers(),
         'product_filter_available': PRODUCT_FILTER_AVAILABLE,
-        'gemini_available': GEMINI_AVAILABLE
+        'gemini_available': GEMINI_AVAILABLE,
+        'db_writer': get_db_writer().get_status()
     })
 
 @app.route('/api/debug/daily-deals')
@@ -593,16 +856,27 @@ def sync_github_data():
     try:
         print("🔄 開始從GitHub同步最新資料...")
         
-        # 強制下載最新資料庫
-        success = download_latest_database()
+        # 條件式下載最新資料庫（遠端未變更時不會重新下載；與背景同步共用鎖）
+        result = get_sync_scheduler().sync_now()
         
-        if success:
+        if result['status'] == 'not_modified':
+            return jsonify({
+                'status': 'success',
+                'updated': False,
+                'version': result['version'],
+                'message': '✅ 本地資料已是GitHub上的最新版本',
+                'sync_time': datetime.now().isoformat()
+            })
+        
+        if result['status'] == 'updated':
             # 重新初始化資料庫服務以使用新資料
             global database_service
             database_service = DatabaseService()
             
             return jsonify({
                 'status': 'success',
+                'updated': True,
+                'version': result['version'],
                 'message': '✅ 成功從GitHub同步最新資料',
                 'sync_time': datetime.now().isoformat()
             })
@@ -626,25 +900,34 @@ def check_github_sync():
         from core.github_sync import check_database_update_time
         
         update_time = check_database_update_time()
+        scheduler_status = get_sync_scheduler().get_status()
         
         if update_time:
-            # 計算資料庫年齡
+            # 計算資料庫年齡（以最後一次確認遠端的時間為準，遠端未變更時檔案不會被改寫）
+            sync_state = load_sync_state().get(CHANNEL_DATABASE, {})
+            if sync_state.get('checked_at'):
+                update_time = max(update_time, datetime.fromisoformat(sync_state['checked_at']))
             now = datetime.now()
             age_hours = (now - update_time).total_seconds() / 3600
             
-            needs_sync = age_hours > 1  # 如果超過1小時就建議同步
+            # 背景同步正常運作時不需要手動同步
+            needs_sync = age_hours > 1 and (not scheduler_status['running'] or scheduler_status['consecutive_failures'] > 0)
             
             return jsonify({
                 'status': 'success',
                 'last_update': update_time.isoformat(),
                 'age_hours': round(age_hours, 2),
                 'needs_sync': needs_sync,
+                'remote_version': sync_state.get('applied_version'),
+                'last_checked': sync_state.get('checked_at'),
+                'scheduler': scheduler_status,
                 'message': f'資料庫最後更新於 {age_hours:.1f} 小時前'
             })
         else:
             return jsonify({
                 'status': 'error',
                 'needs_sync': True,
+                'scheduler': scheduler_status,
                 'message': '本地資料庫不存在，需要同步'
             })
             
@@ -660,31 +943,13 @@ def check_github_sync():
 def delete_session(session_id):
     """刪除指定的搜尋會話及其所有商品"""
     try:
-        conn = get_db_connection()
-        
-        # 獲取會話信息（用於返回訊息）
-        session = conn.execute('SELECT keyword FROM crawl_sessions WHERE id = ?', (session_id,)).fetchone()
-        if not session:
-            conn.close()
+        result = database_service.delete_session(session_id)
+        if result is None:
             return jsonify({'status': 'error', 'error': '找不到指定的會話'}), 404
         
-        keyword = session['keyword']
-        
-        # 計算要刪除的商品數量
-        product_count = conn.execute('SELECT COUNT(*) as count FROM products WHERE session_id = ?', (session_id,)).fetchone()['count']
-        
-        # 刪除商品
-        conn.execute('DELETE FROM products WHERE session_id = ?', (session_id,))
-        
-        # 刪除會話
-        conn.execute('DELETE FROM crawl_sessions WHERE id = ?', (session_id,))
-        
-        conn.commit()
-        conn.close()
-        
         return jsonify({
             'status': 'success',
-            'message': f'已刪除關鍵字「{keyword}」的搜尋結果，共清理了 {product_count} 個商品'
+            'message': f'已刪除關鍵字「{result["keyword"]}」的搜尋結果，共清理了 {result["deleted_products"]} 個商品'
         })
         
     except Exception as e:
@@ -692,167 +957,221 @@ def delete_session(session_id):
 
 @app.route('/api/database/clean/<int:days>', methods=['POST'])
 def clean_old_sessions(days):
-    """清理指定天數前的舊資料"""
+    """清理指定天數前的舊資料（背景分段刪除，立即返回任務 ID）"""
     try:
-        conn = get_db_connection()
-        
         # 計算日期 (DATETIME 格式)
-        cutoff_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        cutoff_date = cutoff_date.replace(day=cutoff_date.day - days)
+        cutoff_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
         cutoff_str = cutoff_date.strftime('%Y-%m-%d %H:%M:%S')
         
-        # 獲取要刪除的會話
-        old_sessions = conn.execute('SELECT id FROM crawl_sessions WHERE crawl_time < ?', (cutoff_str,)).fetchall()
-        session_ids = [s['id'] for s in old_sessions]
+        job = get_purge_manager().purge_sessions_before(cutoff_str)
         
-        if not session_ids:
-            conn.close()
-            return jsonify({
-                'status': 'success',
-                'deleted_sessions': 0,
-                'deleted_products': 0,
-                'message': f'沒有找到 {days} 天前的資料'
-            })
+        return jsonify({
+            'status': 'success',
+            'job': job.to_dict(),
+            'message': f'已開始清理 {days} 天前的 {len(job.session_ids)} 個搜尋會話'
+        }), 202
         
-        # 計算要刪除的商品數量
-        placeholders = ','.join('?' * len(session_ids))
-        product_count = conn.execute(f'SELECT COUNT(*) as count FROM products WHERE session_id IN ({placeholders})', session_ids).fetchone()['count']
+    except Exception as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 500
+
+@app.route('/api/database/purge')
+def list_purge_jobs():
+    """列出背景刪除任務"""
+    return jsonify({
+        'status': 'success',
+        'jobs': get_purge_manager().list_jobs()
+    })
+
+@app.route('/api/database/purge/<job_id>')
+def get_purge_job(job_id):
+    """查詢背景刪除任務的進度"""
+    job = get_purge_manager().get_job(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'error': '找不到指定的刪除任務'}), 404
+    return jsonify({'status': 'success', 'job': job.to_dict()})
+
+@app.route('/api/database/purge/<job_id>/cancel', methods=['POST'])
+def cancel_purge_job(job_id):
+    """取消背景刪除任務（已刪除的部分不會還原）"""
+    job = get_purge_manager().get_job(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'error': '找不到指定的刪除任務'}), 404
+    job.cancel()
+    return jsonify({'status': 'success', 'job': job.to_dict()})
+
+@app.route('/api/database/archive/<int:days>', methods=['POST'])
+def archive_old_sessions(days):
+    """將指定天數前的任務移到壓縮歸檔檔案（背景執行，立即返回任務 ID；歸檔後仍可透過 /api/result/<id> 讀取）"""
+    try:
+        cutoff_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+        cutoff_str = cutoff_date.strftime('%Y-%m-%d %H:%M:%S')
         
-        # 刪除商品
-        conn.execute(f'DELETE FROM products WHERE session_id IN ({placeholders})', session_ids)
+        job = get_archive_manager().archive_sessions_before(cutoff_str)
         
-        # 刪除會話
-        conn.execute(f'DELETE FROM crawl_sessions WHERE id IN ({placeholders})', session_ids)
+        if not job.sessions:
+            message = f'沒有找到 {days} 天前的資料'
+        else:
+            message = f'已開始歸檔 {days} 天前的 {len(job.sessions)} 個任務'
         
-        conn.commit()
-        conn.close()
+        return jsonify({
+            'status': 'success',
+            'job': job.to_dict(),
+            'message': message
+        }), 202
         
+    except Exception as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 500
+
+@app.route('/api/database/archive/jobs')
+def list_archive_jobs():
+    """列出背景歸檔任務"""
+    return jsonify({
+        'status': 'success',
+        'jobs': get_archive_manager().list_jobs()
+    })
+
+@app.route('/api/database/archive/jobs/<job_id>')
+def get_archive_job(job_id):
+    """查詢背景歸檔任務的進度"""
+    job = get_archive_manager().get_job(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'error': '找不到指定的歸檔任務'}), 404
+    return jsonify({'status': 'success', 'job': job.to_dict()})
+
+@app.route('/api/database/archive/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_archive_job(job_id):
+    """取消背景歸檔任務（已歸檔的任務不會還原）"""
+    job = get_archive_manager().get_job(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'error': '找不到指定的歸檔任務'}), 404
+    job.cancel()
+    return jsonify({'status': 'success', 'job': job.to_dict()})
+
+@app.route('/api/archive')
+def get_archived_sessions():
+    """列出已歸檔的任務"""
+    try:
+        sessions = list_archived_sessions()
         return jsonify({
             'status': 'success',
-            'deleted_sessions': len(session_ids),
-            'deleted_products': product_count,
-            'message': f'成功清理了 {days} 天前的資料'
+            'sessions': sessions,
+            'total_sessions': len(sessions),
+            'total_products': sum(s['total_products'] or 0 for s in sessions),
+            # 同一個月份分區檔包含多個任務，檔案大小只計算一次
+            'archive_bytes': sum({s['archive_path']: s['file_size'] or 0 for s in sessions}.values())
         })
-        
     except Exception as e:
         return jsonify({'status': 'error', 'error': str(e)}), 500
 
 @app.route('/api/database/clean-empty', methods=['POST'])
 def clean_empty_sessions():
-    """清理沒有商品的空會話"""
+    """清理沒有商品的空會話（背景分段刪除，立即返回任務 ID）"""
     try:
-        conn = get_db_connection()
-        
-        # 找到沒有商品的會話
-        empty_sessions = conn.execute('''
-            SELECT cs.id, cs.keyword 
-            FROM crawl_sessions cs 
-            LEFT JOIN products p ON cs.id = p.session_id 
-            WHERE p.session_id IS NULL
-        ''').fetchall()
-        
-        if not empty_sessions:
-            conn.close()
-            return jsonify({
-                'status': 'success',
-                'deleted_sessions': 0,
-                'message': '沒有找到空的搜尋會話'
-            })
-        
-        # 刪除空會話
-        session_ids = [s['id'] for s in empty_sessions]
-        placeholders = ','.join('?' * len(session_ids))
-        conn.execute(f'DELETE FROM crawl_sessions WHERE id IN ({placeholders})', session_ids)
-        
-        conn.commit()
-        conn.close()
+        job = get_purge_manager().purge_empty_sessions()
         
         return jsonify({
             'status': 'success',
-            'deleted_sessions': len(session_ids),
-            'message': f'成功清理了 {len(session_ids)} 個空的搜尋會話'
-        })
+            'job': job.to_dict(),
+            'message': f'已開始清理 {len(job.session_ids)} 個空的搜尋會話'
+        }), 202
         
     except Exception as e:
         return jsonify({'status': 'error', 'error': str(e)}), 500
 
 @app.route('/api/database/optimize', methods=['POST'])
 def optimize_database():
-    """優化資料庫，重建索引和壓縮檔案"""
+    """要求背景維護排程儘快執行一次維護（不在請求中執行 VACUUM，不會卡住其他路由）"""
     try:
-        conn = get_db_connection()
-        
-        # 執行 VACUUM 來壓縮資料庫
-        conn.execute('VACUUM')
-        
-        # 重建索引（如果有的話）
-        conn.execute('REINDEX')
-        
-        # 分析表格以優化查詢計劃
-        conn.execute('ANALYZE')
-        
-        conn.close()
+        scheduler = get_maintenance_scheduler()
+        scheduler.trigger()
         
         return jsonify({
             'status': 'success',
-            'message': '資料庫優化完成，已壓縮檔案並重建索引'
+            'message': '已排入資料庫維護，將在背景分段回收空間並更新統計',
+            'maintenance': scheduler.get_status()
         })
         
     except Exception as e:
         return jsonify({'status': 'error', 'error': str(e)}), 500
 
+@app.route('/api/database/maintenance')
+def get_database_maintenance_status():
+    """資料庫維護狀態：排程、最近一次執行與 freelist / 碎片指標"""
+    try:
+        return jsonify({
+            'status': 'success',
+            'maintenance': get_maintenance_scheduler().get_status()
+        })
+    except Exception as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 500
+
+@app.route('/api/database/maintenance/auto-vacuum', methods=['POST'])
+def enable_incremental_auto_vacuum():
+    """把既有資料庫切換為 auto_vacuum=INCREMENTAL（一次性完整 VACUUM，期間暫停寫入，需明確呼叫）"""
+    try:
+        result = get_maintenance_scheduler().enable_incremental_auto_vacuum()
+        return jsonify({
+            'status': 'success',
+            'message': '已切換為 INCREMENTAL auto_vacuum' if result['converted'] else '資料庫已經是 INCREMENTAL auto_vacuum',
+            **result
+        })
+    except Exception as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 500
+
 @app.route('/api/database/backup', methods=['POST'])
 def backup_database():
-    """建立資料庫備份"""
+    """建立資料庫備份（線上備份，內容未變時不重複保存）"""
     try:
-        import shutil
-        from core.database import DB_PATH
-        
-        # 產生備份檔名
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_filename = f'crawler_data_backup_{timestamp}.db'
-        backup_dir = os.path.join(project_root, 'data')
-        backup_path = os.path.join(backup_dir, backup_filename)
+        backup = create_backup(label='manual')
         
-        # 確保備份目錄存在
-        os.makedirs(backup_dir, exist_ok=True)
-        
-        # 複製資料庫檔案
-        shutil.copy2(DB_PATH, backup_path)
+        if backup['deduplicated']:
+            message = f'資料庫內容未變動，沿用既有備份: {backup["file"]}'
+        else:
+            message = f'資料庫備份已建立: {backup["file"]}'
         
         return jsonify({
             'status': 'success',
-            'backup_file': backup_path,
-            'message': f'資料庫備份已建立: {backup_filename}'
+            'backup_file': backup['path'],
+            'backup': backup,
+            'message': message
         })
         
     except Exception as e:
         return jsonify({'status': 'error', 'error': str(e)}), 500
 
+@app.route('/api/database/backups')
+def get_database_backups():
+    """列出現有的資料庫備份"""
+    try:
+        return jsonify({
+            'status': 'success',
+            'backups': list_backups()
+        })
+    except Exception as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 500
+
+@app.route('/api/database/backups/<backup_id>/restore', methods=['POST'])
+def restore_database_backup(backup_id):
+    """從指定備份還原資料庫（還原前會自動建立一份備份）"""
+    try:
+        result = restore_backup(backup_id)
+        return jsonify({
+            'status': 'success',
+            'restored': result['restored'],
+            'safety_backup': result['safety_backup'],
+            'message': f'已從備份 {result["restored"]["file"]} 還原資料庫'
+        })
+    except ValueError as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 500
+
 @app.route('/api/database/stats')
 def get_database_stats():
     """獲取資料庫統計資訊"""
     try:
-        conn = get_db_connection()
-        
-        # 基本統計
-        total_sessions = conn.execute('SELECT COUNT(*) as count FROM crawl_sessions').fetchone()['count']
-        total_products = conn.execute('SELECT COUNT(*) as count FROM products').fetchone()['count']
-        empty_sessions = conn.execute('''
-            SELECT COUNT(*) as count 
-            FROM crawl_sessions cs 
-            LEFT JOIN products p ON cs.id = p.session_id 
-            WHERE p.session_id IS NULL
-        ''').fetchone()['count']
-        
-        # 日期範圍
-        date_range = conn.execute('''
-            SELECT 
-                MIN(crawl_time) as oldest,
-                MAX(crawl_time) as newest
-            FROM crawl_sessions
-            WHERE crawl_time IS NOT NULL
-        ''').fetchone()
+        # 任務數、商品數、空任務數與日期範圍以單一彙總查詢取得（啟用唯讀副本時改讀副本）
+        overview = database_service.get_database_overview()
         
         # 資料庫檔案大小
         from core.database import DB_PATH
@@ -881,17 +1200,15 @@ def get_database_stats():
                     return "未知"
             return "無資料"
         
-        oldest_date = format_datetime(date_range['oldest']) if date_range['oldest'] else "無資料"
-        newest_date = format_datetime(date_range['newest']) if date_range['newest'] else "無資料"
-        
-        conn.close()
+        oldest_date = format_datetime(overview.oldest_session) if overview.oldest_session else "無資料"
+        newest_date = format_datetime(overview.newest_session) if overview.newest_session else "無資料"
         
         return jsonify({
             'status': 'success',
             'stats': {
-                'total_sessions': total_sessions,
-                'total_products': total_products,
-                'empty_sessions': empty_sessions,
+                'total_sessions': overview.total_sessions,
+                'total_products': overview.total_products,
+                'empty_sessions': overview.empty_sessions,
                 'db_size': size_str,
                 'oldest_session_date': oldest_date,
                 'latest_session_date': newest_date
@@ -908,6 +1225,10 @@ if __name__ == '__main__':
         db.DB_PATH = os.path.join(project_root, 'data', 'crawler_data.db')
         
         init_db() # 確保資料庫和資料表已建立
+        get_maintenance_scheduler().start()
+        get_title_indexer().start()
+        get_embedding_syncer().start()
+        get_sync_scheduler().start()
         print("爬蟲結果展示網站啟動中...")
         print("請訪問: http://localhost:5000")
         print("按 Ctrl+C 停止伺服器")
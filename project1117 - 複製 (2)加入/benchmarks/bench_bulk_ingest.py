@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+商品批量寫入效能測試
+以合成的爬蟲結果測量 CrawlerManager._save_results_to_db 的寫入速度（列/秒）
+
+用法:
+    python benchmarks/bench_bulk_ingest.py              # 10k、100k、1M
+    python benchmarks/bench_bulk_ingest.py 10000 50000  # 自訂數量
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# 添加專案根目錄到Python路徑
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+import core.database as database
+from core.crawler_manager import CrawlerManager
+
+PLATFORMS = ['pchome', 'yahoo', 'carrefour', 'routn']
+
+
+def make_results(total_products):
+    """產生平均分配到各平台的合成爬蟲結果（每 1000 筆含 1 筆缺少 URL 的商品）"""
+    per_platform = total_products // len(PLATFORMS)
+    results = {}
+    for platform in PLATFORMS:
+        products = []
+        for i in range(per_platform):
+            products.append({
+                'title': f'{platform} 測試商品 {i} 藍牙耳機 降噪 無線',
+                'price': str(100 + (i * 37) % 50000) if i % 3 else 100 + (i * 37) % 50000,
+                'url': '' if i % 1000 == 999 else f'https://example.com/{platform}/item/{i}',
+                'image_url': f'https://img.example.com/{platform}/{i}.jpg',
+            })
+        results[platform] = {'status': 'success', 'products': products}
+    return results
+
+
+def run_benchmark(total_products):
+    """在暫存資料庫上執行一次寫入並返回 (列數, 秒數)"""
+    tmpdir = tempfile.mkdtemp(prefix='bench_ingest_')
+    database.DB_PATH = os.path.join(tmpdir, 'crawler_data.db')
+    database.init_db()
+
+    # 不載入真正的爬蟲，只使用寫入路徑
+    manager = CrawlerManager(crawlers_dir=tmpdir)
+    results = make_results(total_products)
+
+    start = time.perf_counter()
+    manager._save_results_to_db('benchmark', results, PLATFORMS)
+    elapsed = time.perf_counter() - start
+
+    # WAL 模式下還會留下 -wal/-shm 檔案，整個暫存目錄一起刪除
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    return manager.last_ingest_summary, elapsed
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    rows = []
+    for size in sizes:
+        print(f"\n=== {size:,} 個商品 ===")
+        summary, elapsed = run_benchmark(size)
+        rows.append((size, summary['inserted'], elapsed, summary['inserted'] / elapsed))
+
+    print("\n商品數量      插入列數      耗時(秒)     列/秒")
+    for size, inserted, elapsed, rate in rows:
+        print(f"{size:>10,}  {inserted:>10,}  {elapsed:>10.2f}  {rate:>12,.0f}")
+
+
+if __name__ == '__main__':
+    main()
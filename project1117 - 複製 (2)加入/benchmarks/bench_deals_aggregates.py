@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+每日促銷彙總查詢效能測試
+在合成的 daily_deals 表上比較「全部載入 Python 再計數」與 core.queries 的 SQL 彙總，
+量測耗時與 Python 記憶體峰值（tracemalloc）
+
+用法:
+    python benchmarks/bench_deals_aggregates.py            # 1,000,000 筆
+    python benchmarks/bench_deals_aggregates.py 200000     # 自訂數量
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# 添加專案根目錄到Python路徑
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+import core.database as database
+from core.queries import daily_deals_by_platform, daily_deals_status, recent_daily_deals
+
+PLATFORMS = ['pchome', 'yahoo', 'carrefour', 'routn', 'momo', 'etmall']
+
+
+def populate(total_deals):
+    """建立暫存資料庫並寫入合成的促銷商品（約 5% 已過期）"""
+    conn = database.get_db_connection()
+    rows = (
+        (
+            PLATFORMS[i % len(PLATFORMS)],
+            f'促銷商品 {i} 藍牙耳機 降噪 無線',
+            100 + (i * 37) % 50000,
+            200 + (i * 37) % 60000,
+            round((i % 70) / 100, 2),
+            f'https://example.com/deal/{i}',
+            f'https://img.example.com/deal/{i}.jpg',
+            f'2026-01-{1 + i % 28:02d}T{i % 24:02d}:00:00',
+            1 if i % 20 == 0 else 0,
+        )
+        for i in range(total_deals)
+    )
+    conn.executemany(
+        """
+        INSERT INTO daily_deals (platform, title, price, original_price, discount_percent,
+                                 url, image_url, crawl_time, is_expired)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        rows
+    )
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+
+def load_all_and_count(conn):
+    """舊做法：載入所有有效商品後在 Python 中計數"""
+    deals = conn.execute("SELECT * FROM daily_deals WHERE is_expired = 0 ORDER BY crawl_time DESC").fetchall()
+    platform_counts = {}
+    latest_updates = {}
+    for deal in deals:
+        platform = deal['platform']
+        platform_counts[platform] = platform_counts.get(platform, 0) + 1
+        if platform not in latest_updates or deal['crawl_time'] > latest_updates[platform]:
+            latest_updates[platform] = deal['crawl_time']
+    return len(deals), platform_counts, latest_updates, [dict(d) for d in deals[:10]]
+
+
+def sql_aggregates(conn):
+    """新做法：SQL 彙總 + LIMIT"""
+    summary = daily_deals_by_platform(conn)
+    status = daily_deals_status(conn)
+    recent = recent_daily_deals(conn, limit=10)
+    return summary.total_deals, {p.platform: p.deal_count for p in summary.platforms}, status, recent
+
+
+def measure(func):
+    """返回 (結果, 秒數, Python 記憶體峰值 MB)"""
+    conn = database.get_db_connection()
+    try:
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = func(conn)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        conn.close()
+    return result, elapsed, peak / (1024 * 1024)
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    tmpdir = tempfile.mkdtemp(prefix='bench_deals_')
+    database.DB_PATH = os.path.join(tmpdir, 'crawler_data.db')
+    try:
+        database.init_db()
+        print(f"\n=== 寫入 {total:,} 筆 daily_deals ===")
+        start = time.perf_counter()
+        populate(total)
+        print(f"寫入耗時 {time.perf_counter() - start:.1f} 秒")
+
+        old_result, old_time, old_peak = measure(load_all_and_count)
+        new_result, new_time, new_peak = measure(sql_aggregates)
+        assert old_result[0] == new_result[0], '總數不一致'
+        assert old_result[1] == new_result[1], '平台計數不一致'
+
+        print("\n做法                  耗時(秒)   記憶體峰值(MB)")
+        print(f"{'載入後 Python 計數':<18} {old_time:>10.3f} {old_peak:>14.1f}")
+        print(f"{'SQL 彙總':<20} {new_time:>10.3f} {new_peak:>14.1f}")
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
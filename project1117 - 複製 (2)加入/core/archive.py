@@ -0,0 +1,436 @@
+"""
+冷資料歸檔模組
+把超過指定時間的爬取任務從即時資料庫移到依月份分區的壓縮欄式檔案：
+
+    data/archive/YYYY-MM/part-<時間>-<序號>.json.xz
+
+同一個月份的任務（每次最多 MAX_SESSIONS_PER_PART 個）寫進同一個分區檔，
+商品以欄為單位儲存（每個欄位一個陣列，含 session_id），並附上各任務的資料與統計，
+再以標準函式庫的 lzma 壓縮。Parquet/Arrow 不是本專案的相依套件，所以用欄式 JSON + xz 代替。
+
+歸檔以背景任務執行（與 core.purge 相同，可查詢進度與取消）：
+
+1. 在唯讀快照中讀出一個分區的任務、商品與統計，組成欄式內容並壓縮寫檔（不佔用寫入執行緒）
+2. 每個任務再以一個短的寫入工作確認商品沒有變動後，記錄 archived_sessions 並刪除即時資料；
+   有變動的任務保留在資料庫中，下次歸檔時再處理
+
+archived_sessions 表記錄任務所在的檔案，讓 /api/result/<id> 可以在任務已不在即時資料庫時讀回歸檔內容。
+"""
+
+import json
+import lzma
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import core.database as database
+from core.database import read_snapshot
+from core.db_writer import get_db_writer
+from core.embeddings import remove_from_embedding_index
+from core.minhash import delete_session_titles
+from core.session_stats import delete_session_stats, get_session_stats
+
+# 歸檔檔案格式版本（欄位配置改變時遞增）
+ARCHIVE_FORMAT_VERSION = 1
+
+# 歸檔根目錄名稱（與資料庫檔案放在同一個目錄下）
+ARCHIVE_DIRNAME = 'archive'
+
+# 商品欄位（依 products 表順序）
+PRODUCT_COLUMNS = ('id', 'session_id', 'platform', 'title', 'price', 'url', 'image_url', 'is_filtered_out')
+
+# 每個分區檔最多包含的任務數（限制建檔時的記憶體用量）
+MAX_SESSIONS_PER_PART = 500
+
+# 每個任務的刪除工作之間讓出的時間（秒），讓其他寫入工作有機會插隊
+DELETE_PAUSE_SECONDS = 0.01
+
+# 讀取時快取的已解壓分區檔數量
+LOADED_PART_CACHE_SIZE = 2
+
+# 保留在記憶體中的已結束任務數
+MAX_FINISHED_JOBS = 20
+
+
+def get_archive_dir() -> str:
+    """歸檔根目錄（跟隨目前的 DB_PATH）"""
+    return os.path.join(os.path.dirname(database.DB_PATH), ARCHIVE_DIRNAME)
+
+
+def _partition_for(crawl_time) -> str:
+    """依爬取時間決定月份分區（YYYY-MM），無法解析時歸入 unknown"""
+    try:
+        return datetime.fromisoformat(str(crawl_time)).strftime('%Y-%m')
+    except ValueError:
+        return 'unknown'
+
+
+def _to_columns(rows) -> Dict[str, List]:
+    """將商品列轉為欄式結構"""
+    return {column: [row[column] for row in rows] for column in PRODUCT_COLUMNS}
+
+
+def _from_columns(columns: Dict[str, List], positions=None) -> List[Dict]:
+    """將欄式結構（或其中 positions 指定的列）還原為商品字典列表"""
+    names = list(columns.keys())
+    if positions is None:
+        return [dict(zip(names, values)) for values in zip(*(columns[name] for name in names))]
+    return [{name: columns[name][i] for name in names} for i in positions]
+
+
+def _product_checksum(conn, session_id: int) -> Tuple[int, int]:
+    """任務商品的 (數量, 被過濾數)，用來確認歸檔後到刪除前商品沒有變動"""
+    row = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(is_filtered_out), 0) FROM products WHERE session_id = ?",
+        (session_id,)
+    ).fetchone()
+    return row[0], row[1]
+
+
+def _build_partition(session_ids: List[int]) -> Optional[Dict]:
+    """在唯讀快照中讀出一批任務，組成分區檔的內容（任務都不存在時返回 None）"""
+    with read_snapshot() as conn:
+        sessions = []
+        statistics = {}
+        checksums = {}
+        for session_id in session_ids:
+            session = conn.execute('SELECT * FROM crawl_sessions WHERE id = ?', (session_id,)).fetchone()
+            if session is None:
+                continue
+            sessions.append(dict(session))
+            statistics[str(session_id)] = get_session_stats(conn, session_id)
+            checksums[session_id] = _product_checksum(conn, session_id)
+        if not sessions:
+            return None
+
+        placeholders = ','.join('?' * len(sessions))
+        products = conn.execute(
+            f"""
+            SELECT {', '.join(PRODUCT_COLUMNS)} FROM products
+            WHERE session_id IN ({placeholders})
+            ORDER BY session_id, price, id
+            """,
+            [session['id'] for session in sessions]
+        ).fetchall()
+
+    return {
+        'payload': {
+            'format': ARCHIVE_FORMAT_VERSION,
+            'sessions': sessions,
+            'statistics': statistics,
+            'product_count': len(products),
+            'products': _to_columns(products),
+        },
+        'checksums': checksums,
+    }
+
+
+def _write_archive_file(relative_path: str, payload: Dict) -> int:
+    """先寫入暫存檔再改名，避免留下寫到一半的歸檔檔案；返回檔案大小"""
+    path = os.path.join(get_archive_dir(), relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with lzma.open(tmp_path, 'wt', encoding='utf-8', preset=6) as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def _remove_archive_file(relative_path: str):
+    try:
+        os.remove(os.path.join(get_archive_dir(), relative_path))
+    except FileNotFoundError:
+        pass
+
+
+def _delete_archived_session(conn, session: Dict, relative_path: str, file_size: int,
+                             checksum: Tuple[int, int]) -> Optional[List[int]]:
+    """
+    寫入工作：確認商品與歸檔內容一致後，記錄歸檔索引並從即時資料庫刪除任務
+
+    Returns:
+        List[int] | None: 刪除的商品 ID；任務已不存在或商品有變動時返回 None（不刪除）
+    """
+    session_id = session['id']
+    if conn.execute('SELECT 1 FROM crawl_sessions WHERE id = ?', (session_id,)).fetchone() is None:
+        return None
+    if _product_checksum(conn, session_id) != checksum:
+        return None
+
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO archived_sessions (
+            session_id, keyword, crawl_time, total_products, platforms,
+            archive_path, file_size, archived_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            session_id, session['keyword'], session['crawl_time'], checksum[0],
+            session['platforms'], relative_path, file_size, datetime.now().isoformat()
+        )
+    )
+    product_ids = [row[0] for row in conn.execute('SELECT id FROM products WHERE session_id = ?', (session_id,))]
+    delete_session_titles(conn.cursor(), [session_id])
+    conn.execute('DELETE FROM products WHERE session_id = ?', (session_id,))
+    conn.execute('DELETE FROM crawl_sessions WHERE id = ?', (session_id,))
+    delete_session_stats(conn.cursor(), [session_id])
+    return product_ids
+
+
+class ArchiveJob:
+    """一個背景歸檔任務的狀態與進度"""
+
+    def __init__(self, description: str, sessions: List[Tuple[int, str]]):
+        self.id = uuid.uuid4().hex[:12]
+        self.description = description
+        self.sessions = sessions   # (任務 ID, 月份分區)
+        self.status = 'pending'
+        self.sessions_archived = 0
+        self.sessions_skipped = 0
+        self.products_archived = 0
+        self.partitions_written = 0
+        self.archive_bytes = 0
+        self.error = None
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self._done.is_set()
+
+    def cancel(self):
+        """要求取消（目前這個任務處理完後停止）"""
+        self._cancel.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """等待任務結束，返回是否已結束"""
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> Dict:
+        total = len(self.sessions)
+        processed = self.sessions_archived + self.sessions_skipped
+        return {
+            'job_id': self.id,
+            'description': self.description,
+            'status': self.status,
+            'sessions_total': total,
+            'sessions_archived': self.sessions_archived,
+            'sessions_skipped': self.sessions_skipped,
+            'products_archived': self.products_archived,
+            'partitions_written': self.partitions_written,
+            'archive_bytes': self.archive_bytes,
+            'progress': round(processed / total * 100, 1) if total else 100.0,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+    def _parts(self):
+        """依月份分區分組，每組最多 MAX_SESSIONS_PER_PART 個任務"""
+        by_partition: 'OrderedDict[str, List[int]]' = OrderedDict()
+        for session_id, partition in self.sessions:
+            by_partition.setdefault(partition, []).append(session_id)
+        for partition, session_ids in by_partition.items():
+            for offset in range(0, len(session_ids), MAX_SESSIONS_PER_PART):
+                yield partition, session_ids[offset:offset + MAX_SESSIONS_PER_PART]
+
+    def _archive_part(self, writer, partition: str, session_ids: List[int]):
+        built = _build_partition(session_ids)
+        if built is None:
+            self.sessions_skipped += len(session_ids)
+            return
+
+        payload = built['payload']
+        relative_path = os.path.join(
+            partition, f"part-{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}.json.xz"
+        )
+        file_size = _write_archive_file(relative_path, payload)
+
+        archived = 0
+        for session in payload['sessions']:
+            if self._cancel.is_set():
+                break
+            product_ids = writer.execute(
+                _delete_archived_session, session, relative_path, file_size, built['checksums'][session['id']]
+            )
+            if product_ids is None:
+                self.sessions_skipped += 1
+            else:
+                # 交易提交後才移除向量（memmap 不會隨交易回滾）
+                remove_from_embedding_index(product_ids)
+                archived += 1
+                self.sessions_archived += 1
+                self.products_archived += len(product_ids)
+            time.sleep(DELETE_PAUSE_SECONDS)
+        self.sessions_skipped += len(session_ids) - len(payload['sessions'])
+
+        if archived:
+            self.partitions_written += 1
+            self.archive_bytes += file_size
+        else:
+            # 沒有任何任務以這個檔案為準，不留下孤兒檔案
+            _remove_archive_file(relative_path)
+
+    def run(self):
+        """依月份分區歸檔；壓縮寫檔在寫入執行緒之外，刪除則是每個任務一個短交易"""
+        writer = get_db_writer()
+        self.status = 'running'
+        self.started_at = datetime.now().isoformat()
+        try:
+            for partition, session_ids in self._parts():
+                if self._cancel.is_set():
+                    self.status = 'cancelled'
+                    return
+                self._archive_part(writer, partition, session_ids)
+            self.status = 'cancelled' if self._cancel.is_set() else 'completed'
+        except Exception as e:
+            self.status = 'failed'
+            self.error = str(e)
+            print(f"❌ 背景歸檔任務 {self.id} 失敗: {e}")
+        finally:
+            self.finished_at = datetime.now().isoformat()
+            self._done.set()
+            print(f"📦 背景歸檔任務 {self.id}（{self.description}）{self.status}："
+                  f"{self.sessions_archived} 個任務、{self.products_archived} 個商品，"
+                  f"{self.partitions_written} 個分區檔（{self.archive_bytes / 1024:.1f} KB）")
+
+
+class ArchiveManager:
+    """建立與追蹤背景歸檔任務"""
+
+    def __init__(self):
+        self._jobs: Dict[str, ArchiveJob] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, description: str, sessions: List[Tuple[int, str]]) -> ArchiveJob:
+        job = ArchiveJob(description, sessions)
+        with self._lock:
+            self._jobs[job.id] = job
+            finished = [j for j in self._jobs.values() if j.finished]
+            for old in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+                del self._jobs[old.id]
+        threading.Thread(target=job.run, name=f'archive-{job.id}', daemon=True).start()
+        return job
+
+    def archive_sessions_before(self, cutoff_str: str) -> ArchiveJob:
+        """
+        歸檔指定時間之前的所有任務
+
+        Args:
+            cutoff_str (str): 'YYYY-MM-DD HH:MM:SS' 格式的截止時間
+        """
+        with read_snapshot() as conn:
+            rows = conn.execute(
+                'SELECT id, crawl_time FROM crawl_sessions WHERE crawl_time < ? ORDER BY crawl_time, id',
+                (cutoff_str,)
+            ).fetchall()
+        return self._start(f'歸檔 {cutoff_str} 之前的資料',
+                           [(row['id'], _partition_for(row['crawl_time'])) for row in rows])
+
+    def archive_session(self, session_id: int) -> ArchiveJob:
+        """歸檔單一任務"""
+        with read_snapshot() as conn:
+            row = conn.execute('SELECT id, crawl_time FROM crawl_sessions WHERE id = ?', (session_id,)).fetchone()
+        sessions = [(row['id'], _partition_for(row['crawl_time']))] if row else []
+        return self._start(f'歸檔任務 {session_id}', sessions)
+
+    def get_job(self, job_id: str) -> Optional[ArchiveJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict() for job in sorted(jobs, key=lambda j: j.created_at, reverse=True)]
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_archive_manager() -> ArchiveManager:
+    """取得全域共用的背景歸檔管理器"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ArchiveManager()
+        return _manager
+
+
+def get_archived_session_info(session_id: int) -> Optional[Dict]:
+    """查詢任務的歸檔索引，未歸檔時返回 None"""
+    conn = database.get_db_connection()
+    try:
+        row = conn.execute('SELECT * FROM archived_sessions WHERE session_id = ?', (session_id,)).fetchone()
+    finally:
+        conn.close()
+    return dict(row) if row else None
+
+
+def list_archived_sessions() -> List[Dict]:
+    """列出所有已歸檔的任務（由新到舊）"""
+    conn = database.get_db_connection()
+    try:
+        rows = conn.execute('SELECT * FROM archived_sessions ORDER BY crawl_time DESC').fetchall()
+    finally:
+        conn.close()
+    return [dict(row) for row in rows]
+
+
+_loaded_parts: 'OrderedDict[Tuple[str, float], Dict]' = OrderedDict()
+_loaded_parts_lock = threading.Lock()
+
+
+def _load_archive_file(path: str) -> Dict:
+    """解壓並解析歸檔檔案（同一個分區檔的多個任務常被連續開啟，保留最近的幾個）"""
+    key = (path, os.path.getmtime(path))
+    with _loaded_parts_lock:
+        if key in _loaded_parts:
+            _loaded_parts.move_to_end(key)
+            return _loaded_parts[key]
+
+    with lzma.open(path, 'rt', encoding='utf-8') as f:
+        payload = json.load(f)
+
+    with _loaded_parts_lock:
+        _loaded_parts[key] = payload
+        while len(_loaded_parts) > LOADED_PART_CACHE_SIZE:
+            _loaded_parts.popitem(last=False)
+    return payload
+
+
+def load_archived_session(session_id: int) -> Optional[Dict]:
+    """
+    讀回已歸檔的任務
+
+    Returns:
+        Dict | None: session、statistics 與 products（依 price, id 排序），未歸檔時返回 None
+    """
+    info = get_archived_session_info(session_id)
+    if info is None:
+        return None
+
+    path = os.path.join(get_archive_dir(), info['archive_path'])
+    if not os.path.exists(path):
+        raise FileNotFoundError(f'找不到任務 {session_id} 的歸檔檔案: {path}')
+
+    payload = _load_archive_file(path)
+    session = next((s for s in payload['sessions'] if s['id'] == session_id), None)
+    if session is None:
+        raise KeyError(f'歸檔檔案 {info["archive_path"]} 中沒有任務 {session_id}')
+    columns = payload['products']
+    positions = [i for i, sid in enumerate(columns['session_id']) if sid == session_id]
+    return {
+        'session': session,
+        'statistics': payload['statistics'].get(str(session_id)),
+        'products': _from_columns(columns, positions),
+        'archived_at': info['archived_at'],
+    }
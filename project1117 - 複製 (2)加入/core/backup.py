@@ -0,0 +1,215 @@
+"""
+線上資料庫備份模組
+以 sqlite3 的 backup API 分段複製頁面建立一致的備份，不需要停止寫入：
+
+- 每次只複製固定數量的頁面並短暫讓出，寫入執行緒不會被長時間擋住
+- 備份完成後計算 SHA-256，內容與既有備份相同時不重複保存
+- 依保留策略清除舊備份（最近 N 份 + 每日一份）
+- 支援從備份還原（透過寫入執行緒在沒有其他寫入時進行）
+
+備份檔與 manifest.json 存放在資料庫同目錄下的 backups/ 目錄。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import core.database as database
+from core.db_writer import get_db_writer
+
+BACKUP_DIRNAME = 'backups'
+MANIFEST_FILENAME = 'manifest.json'
+
+# 每一步複製的頁面數與步驟之間的休息時間（秒）
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.005
+
+# 保留策略：最近的 KEEP_LAST 份，加上最近 KEEP_DAILY_DAYS 天每天最新的一份
+KEEP_LAST = 10
+KEEP_DAILY_DAYS = 14
+
+_backup_lock = threading.Lock()
+
+
+def get_backup_dir(db_path: str = None) -> str:
+    """備份目錄（跟隨資料庫位置）"""
+    return os.path.join(os.path.dirname(db_path or database.DB_PATH), BACKUP_DIRNAME)
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_manifest(backup_dir: str) -> List[Dict]:
+    path = os.path.join(backup_dir, MANIFEST_FILENAME)
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    # 手動刪除的備份檔不再列出
+    return [entry for entry in entries if os.path.exists(os.path.join(backup_dir, entry['file']))]
+
+
+def _save_manifest(backup_dir: str, entries: List[Dict]):
+    path = os.path.join(backup_dir, MANIFEST_FILENAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(entries, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _copy_database(source_path: str, target_path: str, pages: int, sleep: float):
+    """以 backup API 把 source 複製到 target（target 會被覆寫）"""
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.execute(f"PRAGMA busy_timeout = {database.BUSY_TIMEOUT_MS}")
+        source.backup(target, pages=pages, sleep=sleep)
+    finally:
+        target.close()
+        source.close()
+
+
+def _apply_retention(backup_dir: str, entries: List[Dict], keep_last: int, keep_daily_days: int) -> List[Dict]:
+    """依保留策略刪除舊備份，返回保留下來的項目（由新到舊）"""
+    entries = sorted(entries, key=lambda e: e['created_at'], reverse=True)
+    keep = set(entry['id'] for entry in entries[:keep_last])
+
+    daily_cutoff = (datetime.now() - timedelta(days=keep_daily_days)).isoformat()
+    seen_days = set()
+    for entry in entries:
+        day = entry['created_at'][:10]
+        if entry['created_at'] >= daily_cutoff and day not in seen_days:
+            seen_days.add(day)
+            keep.add(entry['id'])
+
+    kept = []
+    for entry in entries:
+        if entry['id'] in keep:
+            kept.append(entry)
+            continue
+        try:
+            os.remove(os.path.join(backup_dir, entry['file']))
+            print(f"🗑️ 依保留策略刪除舊備份: {entry['file']}")
+        except OSError:
+            pass
+    return kept
+
+
+def create_backup(label: str = 'manual', db_path: str = None,
+                  pages: int = BACKUP_PAGES_PER_STEP, sleep: float = BACKUP_STEP_SLEEP,
+                  keep_last: int = KEEP_LAST, keep_daily_days: int = KEEP_DAILY_DAYS) -> Dict:
+    """
+    建立一份線上備份
+
+    Args:
+        label (str): 備份標籤（如 manual、pre-restore、pre-github-download）
+        db_path (str): 要備份的資料庫，預設為目前的 DB_PATH
+        pages (int): 每一步複製的頁面數
+        sleep (float): 每一步之間的休息秒數
+        keep_last (int): 至少保留的最近備份數
+        keep_daily_days (int): 保留每日一份備份的天數
+
+    Returns:
+        Dict: 備份項目（id、file、path、sha256、size、created_at、label），
+        內容與既有備份相同時 deduplicated 為 True 並返回既有項目
+    """
+    db_path = db_path or database.DB_PATH
+    backup_dir = get_backup_dir(db_path)
+    os.makedirs(backup_dir, exist_ok=True)
+
+    with _backup_lock:
+        created_at = datetime.now()
+        backup_id = f"crawler_data_{created_at.strftime('%Y%m%d_%H%M%S_%f')}_{label}"
+        filename = f'{backup_id}.db'
+        tmp_path = os.path.join(backup_dir, filename + '.tmp')
+
+        start_time = datetime.now()
+        try:
+            _copy_database(db_path, tmp_path, pages, sleep)
+            sha256 = _file_sha256(tmp_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        elapsed = (datetime.now() - start_time).total_seconds()
+
+        entries = _load_manifest(backup_dir)
+        duplicate = next((entry for entry in entries if entry['sha256'] == sha256), None)
+        if duplicate is not None:
+            os.remove(tmp_path)
+            print(f"♻️ 資料庫內容與備份 {duplicate['file']} 相同，略過重複備份")
+            return {**duplicate, 'path': os.path.join(backup_dir, duplicate['file']), 'deduplicated': True}
+
+        os.replace(tmp_path, os.path.join(backup_dir, filename))
+        entry = {
+            'id': backup_id,
+            'file': filename,
+            'sha256': sha256,
+            'size': os.path.getsize(os.path.join(backup_dir, filename)),
+            'created_at': created_at.isoformat(),
+            'label': label,
+        }
+        entries.append(entry)
+        entries = _apply_retention(backup_dir, entries, keep_last, keep_daily_days)
+        _save_manifest(backup_dir, entries)
+
+    print(f"💾 已建立備份 {filename}（{entry['size'] / 1024:.1f} KB，耗時 {elapsed:.2f} 秒）")
+    return {**entry, 'path': os.path.join(backup_dir, filename), 'deduplicated': False}
+
+
+def list_backups(db_path: str = None) -> List[Dict]:
+    """列出現有備份（由新到舊）"""
+    backup_dir = get_backup_dir(db_path)
+    with _backup_lock:
+        entries = _load_manifest(backup_dir)
+    return sorted(entries, key=lambda e: e['created_at'], reverse=True)
+
+
+def get_backup(backup_id: str, db_path: str = None) -> Optional[Dict]:
+    """依 ID 查詢備份項目"""
+    return next((entry for entry in list_backups(db_path) if entry['id'] == backup_id), None)
+
+
+def restore_backup(backup_id: str) -> Dict:
+    """
+    從備份還原目前的資料庫
+
+    會先驗證備份的雜湊與完整性，並在還原前自動建立一份 pre-restore 備份。
+    實際複製由寫入執行緒在關閉所有連線後進行，還原期間不會有寫入交錯。
+
+    Returns:
+        Dict: restored（還原的備份項目）與 safety_backup（還原前的備份項目）
+    """
+    entry = get_backup(backup_id)
+    if entry is None:
+        raise ValueError(f'找不到備份: {backup_id}')
+
+    backup_path = os.path.join(get_backup_dir(), entry['file'])
+    if _file_sha256(backup_path) != entry['sha256']:
+        raise ValueError(f'備份檔案內容與紀錄的雜湊不符: {entry["file"]}')
+
+    check = sqlite3.connect(backup_path)
+    try:
+        result = check.execute('PRAGMA integrity_check').fetchone()[0]
+    finally:
+        check.close()
+    if result != 'ok':
+        raise ValueError(f'備份檔案完整性檢查失敗: {result}')
+
+    safety_backup = create_backup(label='pre-restore')
+
+    db_path = database.DB_PATH
+    # 一次複製全部頁面：目標資料庫在複製期間持有寫入鎖，讀取端只會看到還原前或還原後的內容
+    get_db_writer().run_exclusive(_copy_database, backup_path, db_path, -1, 0)
+    print(f"✅ 已從備份 {entry['file']} 還原資料庫")
+
+    return {'restored': entry, 'safety_backup': safety_backup}
@@ -6,7 +6,12 @@ from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import importlib.util
 import sys
-from .database import get_db_connection
+from .db_writer import get_db_writer
+from .session_stats import refresh_session_stats
+from .bulk_ingest import prepare_products, ingest_products, format_ingest_summary
+from .embeddings import get_embedding_syncer
+from .minhash import get_title_indexer
+from .services.product_comparison_service import invalidate_comparison_cache
 
 class CrawlerManager:
     """爬蟲管理器 - 統一管理所有爬蟲的執行並存入資料庫"""
@@ -23,6 +28,7 @@ class CrawlerManager:
             crawlers_dir = os.path.join(project_root, "crawlers")
         self.crawlers_dir = crawlers_dir
         self.crawlers = {}
+        self.last_ingest_summary = None
         
         # 自動載入爬蟲
         self._load_crawlers()
@@ -181,9 +187,6 @@ class CrawlerManager:
         Returns:
             int: 新增的 session_id
         """
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         successful_crawlers = [r for r in results.values() if r.get("status") == "success"]
         failed_crawlers = len(results) - len(successful_crawlers)
         
@@ -193,81 +196,60 @@ class CrawlerManager:
         elif failed_crawlers > 0:
             status = "partial_fail"
 
-        # 1. 創建爬取 session
-        cursor.execute(
-            "INSERT INTO crawl_sessions (keyword, crawl_time, status, platforms) VALUES (?, ?, ?, ?)",
-            (keyword, datetime.now(), status, ",".join(platforms))
-        )
-        session_id = cursor.lastrowid
-        
-        # 2. 插入商品數據
-        total_products = 0
-        products_to_insert = []
-        for platform, result in results.items():
-            if result.get("status") == "success":
-                products = result.get("products", [])
-                total_products += len(products)  # 用實際商品數量而不是報告的數量
-                print(f"正在處理 {platform} 的 {len(products)} 個商品")
-                for p in products:
-                    # 檢查必要欄位是否存在
-                    title = p.get('title') or p.get('name') or "無標題商品"
-                    price = p.get('price')
-                    if not price or not isinstance(price, (int, float)):
-                        try:
-                            price = int(float(price)) if price else 0
-                        except:
-                            price = 0
-                            
-                    url = p.get('url')
-                    if not url:
-                        print(f"跳過沒有URL的商品: {title}")
-                        continue  # 跳過沒有URL的商品
-                        
-                    print(f"準備插入商品: {title[:30]}... (平台: {platform}, 價格: {price})")
-                    products_to_insert.append((
-                        session_id,
-                        platform,
-                        title,
-                        price,
-                        url,
-                        p.get('image_url') or ""
-                    ))
+        # 驗證與正規化在取得寫入鎖之前完成
+        prepared = prepare_products(results)
 
-        if products_to_insert:
-            print(f"插入 {len(products_to_insert)} 個商品到資料庫")
-            try:
-                cursor.executemany(
-                    """
-                    INSERT OR IGNORE INTO products (session_id, platform, title, price, url, image_url)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                    """,
-                    products_to_insert
-                )
-                print(f"成功插入 {cursor.rowcount} 個商品")
-            except Exception as e:
-                print(f"插入商品數據時出錯: {e}")
-                # 嘗試一個一個插入以找出問題
-                successful = 0
-                for product in products_to_insert:
-                    try:
-                        cursor.execute(
-                            "INSERT OR IGNORE INTO products (session_id, platform, title, price, url, image_url) VALUES (?, ?, ?, ?, ?, ?)",
-                            product
-                        )
-                        successful += 1
-                    except Exception as e:
-                        print(f"插入商品失敗: {e}, 商品: {product}")
-                print(f"逐個插入: 成功 {successful}/{len(products_to_insert)} 個商品")
+        def write_session(conn):
+            # 在寫入執行緒的同一交易中：建立 session、批量寫入商品、更新統計
+            cursor = conn.cursor()
 
-        # 3. 更新 session 的總商品數
-        cursor.execute(
-            "UPDATE crawl_sessions SET total_products = ? WHERE id = ?",
-            (total_products, session_id)
-        )
-        
-        conn.commit()
-        conn.close()
+            # 1. 創建爬取 session
+            cursor.execute(
+                "INSERT INTO crawl_sessions (keyword, crawl_time, status, platforms) VALUES (?, ?, ?, ?)",
+                (keyword, datetime.now(), status, ",".join(platforms))
+            )
+            session_id = cursor.lastrowid
+
+            # 2. 批量插入商品數據
+            summary = ingest_products(cursor, session_id, prepared)
+            total_products = summary['received']  # 用實際商品數量而不是報告的數量
+
+            # 3. 更新 session 的總商品數
+            cursor.execute(
+                "UPDATE crawl_sessions SET total_products = ? WHERE id = ?",
+                (total_products, session_id)
+            )
+
+            # 4. 在同一交易中更新 session 統計快取
+            refresh_session_stats(cursor, session_id)
+
+            # 5. 這個關鍵字有新的候選商品，先前的比較結果已不完整
+            #   （標題相近的目標商品的快取由背景標題索引在建立索引時失效）
+            if summary['inserted']:
+                invalidate_comparison_cache(cursor, search_keyword=keyword)
+            return session_id, summary
+
+        session_id, summary = get_db_writer().execute(write_session)
+
+        # 保留最近一次寫入的摘要（含逐筆錯誤），供呼叫端檢視
+        self.last_ingest_summary = summary
+        print(format_ingest_summary(summary))
+        if summary['errors']:
+            rejected_by_reason = {}
+            for error in summary['errors']:
+                key = (error['platform'], error['reason'])
+                rejected_by_reason[key] = rejected_by_reason.get(key, 0) + 1
+            for (platform, reason), count in rejected_by_reason.items():
+                print(f"  {platform}: {count} 個商品因「{reason}」被略過")
         
+        # 新商品在背景加入標題近似重複索引（不佔用寫入交易）
+        if summary['inserted']:
+            get_title_indexer().notify()
+
+        # 新商品在背景增量加入標題向量索引（連續寫入合併為一次同步）
+        if summary['inserted']:
+            get_embedding_syncer().notify()
+
         print(f"結果已保存至資料庫，Session ID: {session_id}")
         return session_id
 
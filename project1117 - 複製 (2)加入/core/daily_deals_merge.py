@@ -0,0 +1,225 @@
+"""
+每日促銷增量合併模組
+以 URL 為鍵將新爬取（或遠端同步）的促銷商品合併進 daily_deals：
+只更新價格/標題有變動的列、插入新商品、將消失的商品標記為過期，
+取代原本「先刪除再全部重新插入」的做法。
+
+合併函式在呼叫端的交易中執行（通常是寫入執行緒的工作），本身不 commit，也不計算標題索引：
+呼叫端提交後呼叫 core.minhash 的 get_title_indexer().notify()，新增與標題變動的促銷由背景索引處理。
+"""
+
+import sqlite3
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+# 暫存表欄位順序（與 daily_deals 相同的資料欄位）
+_INCOMING_COLUMNS = (
+    'platform', 'title', 'price', 'original_price', 'discount_percent',
+    'url', 'image_url', 'crawl_time'
+)
+
+# 判斷既有列是否需要更新：只有價格、標題等內容欄位改變，或原本已過期才寫入
+_CHANGED_CONDITION = """
+    d.title IS NOT i.title
+    OR d.price IS NOT i.price
+    OR d.original_price IS NOT i.original_price
+    OR d.discount_percent IS NOT i.discount_percent
+    OR d.image_url IS NOT i.image_url
+    OR d.platform IS NOT i.platform
+    OR d.is_expired = 1
+"""
+
+
+def _create_incoming_table(cursor):
+    """建立本次合併使用的暫存表（TEMP 表不會鎖定主資料庫）"""
+    cursor.execute("DROP TABLE IF EXISTS temp.incoming_deals")
+    cursor.execute("""
+        CREATE TEMP TABLE incoming_deals (
+            platform TEXT NOT NULL,
+            title TEXT NOT NULL,
+            price INTEGER,
+            original_price INTEGER,
+            discount_percent REAL,
+            url TEXT PRIMARY KEY,
+            image_url TEXT,
+            crawl_time DATETIME NOT NULL
+        )
+    """)
+
+
+def _normalize_deal(platform: str, deal: Dict, crawl_time: str) -> Optional[tuple]:
+    """將爬蟲回傳的商品字典轉為暫存表的一列，缺少 URL 的商品略過"""
+    url = deal.get('url')
+    if not url:
+        return None
+    return (
+        deal.get('platform') or platform,
+        deal.get('title') or deal.get('name') or '',
+        deal.get('price'),
+        deal.get('original_price'),
+        deal.get('discount_percent'),
+        url,
+        deal.get('image_url'),
+        deal.get('crawl_time') or crawl_time,
+    )
+
+
+def _stage_deals(cursor, platform: Optional[str], deals: Iterable[Dict]):
+    """將商品正規化、依 URL 去重後載入暫存表"""
+    crawl_time = datetime.now().isoformat()
+    rows = {}
+    for deal in deals:
+        row = _normalize_deal(platform, deal, crawl_time)
+        if row is not None and row[0]:
+            rows[row[5]] = row  # 同一 URL 以最後一筆為準
+
+    _create_incoming_table(cursor)
+    cursor.executemany(
+        f"INSERT INTO incoming_deals ({', '.join(_INCOMING_COLUMNS)}) VALUES ({', '.join('?' * len(_INCOMING_COLUMNS))})",
+        list(rows.values())
+    )
+
+
+def _merge_incoming(cursor, expire_platforms: Optional[List[str]]) -> Dict[str, int]:
+    """
+    將暫存表中的資料合併進 daily_deals
+
+    Args:
+        cursor: 資料庫 cursor（暫存表必須已建立在同一連線上）
+        expire_platforms: 需要將「本次未出現的商品」標記為過期的平台；
+            None 表示所有平台（完整鏡像同步）
+
+    Returns:
+        Dict[str, int]: inserted / updated / expired / unchanged 數量
+    """
+    now = datetime.now().isoformat()
+    try:
+        incoming_total = cursor.execute("SELECT COUNT(*) FROM incoming_deals").fetchone()[0]
+        inserted = cursor.execute("""
+            SELECT COUNT(*) FROM incoming_deals i
+            WHERE NOT EXISTS (SELECT 1 FROM daily_deals d WHERE d.url = i.url)
+        """).fetchone()[0]
+        updated = cursor.execute(f"""
+            SELECT COUNT(*) FROM incoming_deals i
+            JOIN daily_deals d ON d.url = i.url
+            WHERE {_CHANGED_CONDITION}
+        """).fetchone()[0]
+
+        # UPSERT：新商品插入；既有商品只有內容改變時才更新
+        cursor.execute("""
+            INSERT INTO daily_deals (
+                platform, title, price, original_price, discount_percent,
+                url, image_url, crawl_time, is_expired, updated_at
+            )
+            SELECT platform, title, price, original_price, discount_percent,
+                   url, image_url, crawl_time, 0, ?
+            FROM incoming_deals WHERE 1
+            ON CONFLICT(url) DO UPDATE SET
+                platform = excluded.platform,
+                title = excluded.title,
+                price = excluded.price,
+                original_price = excluded.original_price,
+                discount_percent = excluded.discount_percent,
+                image_url = excluded.image_url,
+                crawl_time = excluded.crawl_time,
+                is_expired = 0,
+                updated_at = excluded.updated_at
+            WHERE daily_deals.title IS NOT excluded.title
+               OR daily_deals.price IS NOT excluded.price
+               OR daily_deals.original_price IS NOT excluded.original_price
+               OR daily_deals.discount_percent IS NOT excluded.discount_percent
+               OR daily_deals.image_url IS NOT excluded.image_url
+               OR daily_deals.platform IS NOT excluded.platform
+               OR daily_deals.is_expired = 1
+        """, (now,))
+
+        # 本次沒有出現的商品標記為過期（保留資料列，不刪除）
+        expire_sql = """
+            UPDATE daily_deals SET is_expired = 1, updated_at = ?
+            WHERE is_expired = 0
+              AND url NOT IN (SELECT url FROM incoming_deals)
+        """
+        params = [now]
+        expired = 0
+        if expire_platforms is not None:
+            placeholders = ','.join('?' * len(expire_platforms))
+            expire_sql += f" AND platform IN ({placeholders})"
+            params.extend(expire_platforms)
+        if expire_platforms is None or expire_platforms:
+            expired = cursor.execute(expire_sql, params).rowcount
+
+        # 記錄每個平台的最後刷新時間，讀取端據此顯示「最後更新」
+        refreshed_platforms = expire_platforms
+        if refreshed_platforms is None:
+            refreshed_platforms = [row[0] for row in cursor.execute(
+                "SELECT DISTINCT platform FROM incoming_deals"
+            ).fetchall()]
+        cursor.executemany(
+            "INSERT OR REPLACE INTO daily_deals_refresh (platform, refreshed_at) VALUES (?, ?)",
+            [(platform, now) for platform in refreshed_platforms]
+        )
+    finally:
+        cursor.execute("DROP TABLE IF EXISTS temp.incoming_deals")
+
+    return {
+        'inserted': inserted,
+        'updated': updated,
+        'expired': expired,
+        'unchanged': incoming_total - inserted - updated,
+    }
+
+
+def merge_daily_deals(conn, platform: str, deals: Iterable[Dict]) -> Dict[str, int]:
+    """
+    將單一平台的爬蟲結果合併進 daily_deals
+
+    Args:
+        conn: 資料庫連線（處於呼叫端的交易中）
+        platform (str): 平台名稱（該平台未出現的舊商品會被標記為過期）
+        deals: 爬蟲回傳的商品字典列表
+
+    Returns:
+        Dict[str, int]: inserted / updated / expired / unchanged 數量
+    """
+    cursor = conn.cursor()
+    _stage_deals(cursor, platform, deals)
+    return _merge_incoming(cursor, [platform])
+
+
+def merge_all_daily_deals(conn, deals: Iterable[Dict]) -> Dict[str, int]:
+    """
+    以完整快照合併 daily_deals（所有平台；快照中沒有的商品都標記為過期）
+
+    Args:
+        conn: 資料庫連線（處於呼叫端的交易中）
+        deals: 含 platform 欄位的商品字典列表
+
+    Returns:
+        Dict[str, int]: inserted / updated / expired / unchanged 數量
+    """
+    cursor = conn.cursor()
+    _stage_deals(cursor, None, deals)
+    return _merge_incoming(cursor, None)
+
+
+def load_daily_deals_from_file(db_path: str) -> Optional[List[Dict]]:
+    """
+    從另一個資料庫檔案（例如 GitHub 下載的暫存檔）讀出有效的 daily_deals
+
+    Returns:
+        List[Dict] | None: 商品列表；檔案中沒有 daily_deals 表時返回 None
+    """
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        if conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='daily_deals'").fetchone() is None:
+            return None
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(daily_deals)").fetchall()}
+        select_columns = [col if col in columns else f'NULL AS {col}' for col in _INCOMING_COLUMNS]
+        where = "WHERE url IS NOT NULL"
+        if 'is_expired' in columns:
+            where += " AND is_expired = 0"
+        rows = conn.execute(f"SELECT {', '.join(select_columns)} FROM daily_deals {where}").fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
@@ -1,39 +1,309 @@
 import sqlite3
 import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
 from datetime import datetime
+from urllib.parse import quote
 
 # 設定資料庫路徑
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DB_PATH = os.path.join(project_root, 'data', 'crawler_data.db')
 
+# 連線等待寫入鎖的最長時間（毫秒）
+BUSY_TIMEOUT_MS = 5000
+
+# 唯讀副本：統計類的大量讀取可改讀定期刷新的副本檔，完全不碰即時資料庫
+READ_REPLICA_ENABLED = os.environ.get('DB_READ_REPLICA', '').lower() in ('1', 'true', 'yes')
+READ_REPLICA_MAX_AGE = float(os.environ.get('DB_READ_REPLICA_MAX_AGE', '60'))
+
+
+class PooledConnection(sqlite3.Connection):
+    """由連線池管理的連線：close() 時歸還連線池而不是真正關閉"""
+
+    def close(self):
+        pool = getattr(self, '_pool', None)
+        if pool is not None and pool.release(self):
+            return
+        super().close()
+
+
+class ConnectionPool:
+    """
+    讀取用的 SQLite 連線池
+
+    連線在 close() 時歸還並重複使用；invalidate() 會讓目前所有連線失效，
+    閒置的立即關閉，使用中的在歸還時關閉，之後取得的連線都會重新開啟檔案。
+    替換資料庫檔案時以 exclusive_access() 暫停發出連線並等待使用中的連線全部歸還。
+    """
+
+    def __init__(self, max_idle: int = 8):
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+        self._idle = []
+        # 使用中的連線（弱參照：沒有 close() 就被回收的連線不會讓 exclusive_access 永遠等待）
+        self._checked_out = weakref.WeakSet()
+        self._paused = False
+        self._generation = 0
+        self._db_path = None
+
+    def acquire(self, db_path: str) -> PooledConnection:
+        """取得一個連線（優先重用閒置連線）"""
+        with self._lock:
+            while self._paused:
+                self._released.wait()
+            if db_path != self._db_path:
+                # 資料庫路徑改變（例如測試或工具切換 DB_PATH）時捨棄舊連線
+                self._invalidate_locked()
+                self._db_path = db_path
+            conn = self._idle.pop() if self._idle else None
+
+            if conn is None:
+                # 在鎖內開啟，確保 exclusive_access 期間不會有連線開到即將被替換的舊檔案
+                conn = sqlite3.connect(db_path, factory=PooledConnection, check_same_thread=False)
+                conn.row_factory = sqlite3.Row
+                conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+                conn._pool = self
+                conn._generation = self._generation
+            self._checked_out.add(conn)
+        return conn
+
+    def release(self, conn: PooledConnection) -> bool:
+        """歸還連線；返回 False 表示連線應該被真正關閉"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._mark_released(conn)
+            return False
+        with self._lock:
+            self._checked_out.discard(conn)
+            self._released.notify_all()
+            if conn._generation != self._generation or len(self._idle) >= self.max_idle:
+                return False
+            if conn not in self._idle:
+                self._idle.append(conn)
+            return True
+
+    def _mark_released(self, conn: PooledConnection):
+        with self._lock:
+            self._checked_out.discard(conn)
+            self._released.notify_all()
+
+    def invalidate(self):
+        """讓目前所有連線失效（資料庫檔案被替換前呼叫）"""
+        with self._lock:
+            self._invalidate_locked()
+
+    @contextmanager
+    def exclusive_access(self, timeout: float = 30.0):
+        """
+        暫停發出新連線，等待使用中的連線全部歸還後執行區塊
+
+        區塊內沒有任何連線池的連線開著資料庫，可以安全地替換檔案；
+        區塊結束後恢復發出連線，之後的連線都開啟新檔案。
+
+        Raises:
+            TimeoutError: 超過 timeout 秒仍有連線未歸還（不會執行區塊）
+        """
+        with self._lock:
+            self._paused = True
+            self._invalidate_locked()
+            deadline = time.monotonic() + timeout
+            while len(self._checked_out) > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    in_use = len(self._checked_out)
+                    self._paused = False
+                    self._released.notify_all()
+                    raise TimeoutError(f'仍有 {in_use} 個資料庫連線使用中，無法取得獨佔存取')
+                # 沒有 close() 就被回收的連線不會通知，定期重新檢查
+                self._released.wait(min(remaining, 0.1))
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._paused = False
+                self._released.notify_all()
+
+    def _invalidate_locked(self):
+        self._generation += 1
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            conn._pool = None
+            conn.close()
+
+
+connection_pool = ConnectionPool()
+
+
 def get_db_connection():
-    """建立並返回資料庫連線"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """從連線池取得資料庫連線（用完請呼叫 close() 歸還）"""
+    return connection_pool.acquire(DB_PATH)
 
-def init_db():
-    """初始化資料庫，建立資料表"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # 檢查資料表是否存在，如果不存在則建立
-    cursor.execute("""
-        SELECT name FROM sqlite_master WHERE type='table' AND name='crawl_sessions'
-    """)
-    
-    if cursor.fetchone() is None:
-        print("建立資料表...")
-        create_tables(cursor)
-        conn.commit()
-        print("資料庫初始化完成。")
-    else:
-        print("資料庫表已存在，檢查是否需要更新...")
-        update_database_schema(cursor)
-        conn.commit()
-        print("資料庫檢查完成。")
-    
-    conn.close()
+
+class ReadReplica:
+    """
+    定期刷新的唯讀資料庫副本
+
+    以 backup API 從即時資料庫複製到暫存檔後改名替換，已開啟的讀取連線仍讀舊檔，
+    新連線讀到新副本。刷新由背景執行緒負責（每 max_age 秒一次），請求執行緒從不等待複製：
+    副本過期時照樣讀目前的副本，還沒有可用副本（第一次使用或即時資料庫剛被替換）時改讀即時資料庫。
+    """
+
+    def __init__(self, max_age: float = READ_REPLICA_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._refreshed_at = None
+        self._source_path = None
+        self._source_signature = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self.refresh_count = 0
+        self.last_error = None
+
+    @property
+    def path(self) -> str:
+        return os.path.splitext(DB_PATH)[0] + '.replica.db'
+
+    def is_available(self) -> bool:
+        """是否有對應目前即時資料庫的副本（可能已過期）"""
+        return (
+            self._refreshed_at is not None
+            and self._source_path == DB_PATH
+            and os.path.exists(self.path)
+        )
+
+    def is_stale(self) -> bool:
+        return not self.is_available() or time.monotonic() - self._refreshed_at > self.max_age
+
+    @staticmethod
+    def _source_signature_of(source_path: str):
+        """即時資料庫與 WAL 檔的修改時間與大小（沒有變動時不需要重新複製）"""
+        signature = []
+        for path in (source_path, source_path + '-wal'):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def refresh(self):
+        """從即時資料庫重新建立副本（在背景執行緒中呼叫；即時資料庫沒有變動時只更新時間）"""
+        with self._lock:
+            source_path, replica_path = DB_PATH, self.path
+            signature = self._source_signature_of(source_path)
+            if self.is_available() and signature == self._source_signature:
+                self._refreshed_at = time.monotonic()
+                return
+            tmp_path = replica_path + '.tmp'
+            source = sqlite3.connect(source_path)
+            target = sqlite3.connect(tmp_path)
+            try:
+                source.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+                source.backup(target, pages=1024, sleep=0.001)
+                # 副本改回 DELETE 模式，唯讀開啟時不需要 -wal / -shm 檔案
+                target.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                target.close()
+                source.close()
+            os.replace(tmp_path, replica_path)
+            self._refreshed_at = time.monotonic()
+            self._source_path = source_path
+            self._source_signature = signature
+            self.refresh_count += 1
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='db-read-replica', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        """背景刷新：副本過期（或被要求刷新）時重新複製，其餘時間等待"""
+        while True:
+            if self.is_stale():
+                try:
+                    self.refresh()
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = str(e)
+                    print(f"⚠️ 唯讀副本刷新失敗: {e}")
+            self._wakeup.wait(self.max_age)
+            self._wakeup.clear()
+
+    def invalidate(self):
+        """標記副本為不可用並要求背景刷新（即時資料庫檔案被替換後呼叫）"""
+        with self._lock:
+            self._refreshed_at = None
+        self._wakeup.set()
+
+    def connect(self):
+        """
+        開啟副本的唯讀連線（不等待刷新）
+
+        Returns:
+            sqlite3.Connection | None: 還沒有可用副本時返回 None，由呼叫端改讀即時資料庫
+        """
+        self._ensure_started()
+        if not self.is_available():
+            self._wakeup.set()
+            return None
+        conn = sqlite3.connect(f"file:{quote(self.path)}?mode=ro", uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def get_status(self) -> dict:
+        return {
+            'enabled': READ_REPLICA_ENABLED,
+            'path': self.path,
+            'max_age': self.max_age,
+            'available': self.is_available(),
+            'age_seconds': None if self._refreshed_at is None else round(time.monotonic() - self._refreshed_at, 1),
+            'refresh_count': self.refresh_count,
+            'last_error': self.last_error,
+        }
+
+
+read_replica = ReadReplica()
+
+
+@contextmanager
+def read_snapshot(prefer_replica: bool = False):
+    """
+    開啟一個唯讀快照（單一讀取交易）
+
+    區塊內的所有查詢都看到同一個時間點的資料，不會與背景寫入交錯；
+    WAL 模式下讀取交易不會阻擋寫入執行緒，也不會取得寫入鎖。
+
+    Args:
+        prefer_replica (bool): 啟用唯讀副本（DB_READ_REPLICA=1）時改讀副本，
+            適合統計類的大量查詢；副本可能落後最多約 max_age 秒，尚無副本時讀即時資料庫
+
+    Yields:
+        sqlite3.Connection: 處於讀取交易中的連線（區塊結束時自動結束交易並歸還）
+    """
+    conn = read_replica.connect() if prefer_replica and READ_REPLICA_ENABLED else None
+    if conn is None:
+        conn = get_db_connection()
+    try:
+        conn.execute("PRAGMA query_only = 1")
+        conn.execute("BEGIN")
+        # 讀取交易在第一次讀取時才真正開始，先讀一次把快照固定在此刻
+        conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+        yield conn
+    finally:
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute("PRAGMA query_only = 0")
+        except sqlite3.Error:
+            pass
+        conn.close()
 
 def create_tables(cursor):
     """建立所有資料表"""
@@ -67,6 +337,7 @@ def create_tables(cursor):
     # 為 url 欄位建立索引以加速查詢
     cursor.execute("CREATE INDEX idx_product_url ON products (url);")
     cursor.execute("CREATE INDEX idx_product_session_id ON products (session_id);")
+    create_pagination_indexes(cursor)
 
     # 每日特價商品資料表
     cursor.execute("""
@@ -79,28 +350,163 @@ def create_tables(cursor):
         discount_percent REAL,
         url TEXT UNIQUE,
         image_url TEXT,
-        crawl_time DATETIME NOT NULL
+        crawl_time DATETIME NOT NULL,
+        is_expired BOOLEAN DEFAULT 0,
+        updated_at DATETIME
     );
     """)
     cursor.execute("CREATE INDEX idx_daily_deals_platform ON daily_deals (platform);")
+    create_daily_deals_refresh_table(cursor)
+    create_daily_deals_summary_index(cursor)
+    create_delta_sync_tables(cursor)
+
+    # 商品比較結果快取表與每日促銷的預先比對結果
+    create_comparison_cache_table(cursor)
+    create_deal_matches_table(cursor)
+
+    create_session_stats_table(cursor)
+    create_archived_sessions_table(cursor)
+    create_title_index_table(cursor)
+
+def create_pagination_indexes(cursor):
+    """建立 keyset 分頁使用的複合索引"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_crawl_sessions_time_id ON crawl_sessions (crawl_time, id);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_product_session_price_id ON products (session_id, price, id);")
 
-    # 商品比較結果快取表
+def create_daily_deals_refresh_table(cursor):
+    """建立每日促銷各平台最後刷新時間表（增量合併時即使沒有資料變動也會更新）"""
     cursor.execute("""
-    CREATE TABLE product_comparison_cache (
+    CREATE TABLE IF NOT EXISTS daily_deals_refresh (
+        platform TEXT PRIMARY KEY,
+        refreshed_at DATETIME NOT NULL
+    );
+    """)
+
+def create_daily_deals_summary_index(cursor):
+    """建立每日促銷彙總用的覆蓋索引（依平台計數與取最新時間時不需回表）與列表分頁索引"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_daily_deals_active_platform ON daily_deals (is_expired, platform, crawl_time);")
+    # 每日促銷列表的 keyset 分頁（依 crawl_time, id 由新到舊）
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_daily_deals_active_time_id ON daily_deals (is_expired, crawl_time, id);")
+
+def create_delta_sync_tables(cursor):
+    """建立增量同步使用的 updated_at 索引與套用端水位線表"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_daily_deals_updated_at ON daily_deals (updated_at);")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS delta_sync_state (
+        source TEXT PRIMARY KEY,
+        watermark DATETIME,
+        kind TEXT,
+        applied_at DATETIME NOT NULL
+    );
+    """)
+
+def create_comparison_cache_table(cursor):
+    """建立商品比較結果快取表（以正規化後的目標商品標題指紋為鍵，每個目標一列）"""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS product_comparison_cache (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        target_product_id INTEGER NOT NULL,
-        similar_product_id INTEGER NOT NULL,
-        similarity REAL NOT NULL,
-        reason TEXT,
-        confidence TEXT,
-        category TEXT,
+        fingerprint TEXT NOT NULL UNIQUE,
+        normalized_title TEXT NOT NULL,
+        target_title TEXT NOT NULL,
+        search_keyword TEXT,
+        similar_products TEXT NOT NULL,
+        total_candidates INTEGER DEFAULT 0,
+        total_matches INTEGER DEFAULT 0,
+        hit_count INTEGER NOT NULL DEFAULT 0,
         cache_time DATETIME NOT NULL,
-        FOREIGN KEY (target_product_id) REFERENCES daily_deals (id),
-        FOREIGN KEY (similar_product_id) REFERENCES products (id)
+        expires_at DATETIME NOT NULL
+    );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_comparison_cache_keyword ON product_comparison_cache (search_keyword);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_comparison_cache_expires ON product_comparison_cache (expires_at);")
+
+def create_deal_matches_table(cursor):
+    """建立每日促銷預先比對結果表（每個促銷商品一列，deal_updated_at 與商品不同時需重新比對）"""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS deal_matches (
+        deal_id INTEGER PRIMARY KEY,
+        deal_updated_at DATETIME,
+        similar_products TEXT NOT NULL,
+        total_candidates INTEGER DEFAULT 0,
+        total_matches INTEGER DEFAULT 0,
+        computed_at DATETIME NOT NULL,
+        FOREIGN KEY (deal_id) REFERENCES daily_deals (id)
+    );
+    """)
+
+def migrate_comparison_cache_table(cursor):
+    """舊版 product_comparison_cache（以 daily_deals / products id 為鍵，從未被使用）改為指紋快取表"""
+    cursor.execute("PRAGMA table_info(product_comparison_cache)")
+    columns = [row[1] for row in cursor.fetchall()]
+    if columns and 'fingerprint' not in columns:
+        print("更新 product_comparison_cache 表為指紋快取結構...")
+        cursor.execute("SELECT COUNT(*) FROM product_comparison_cache")
+        if cursor.fetchone()[0]:
+            cursor.execute("ALTER TABLE product_comparison_cache RENAME TO product_comparison_cache_legacy")
+        else:
+            cursor.execute("DROP TABLE product_comparison_cache")
+        cursor.execute("DROP INDEX IF EXISTS idx_comparison_cache_target")
+        cursor.execute("DROP INDEX IF EXISTS idx_comparison_cache_similarity")
+    create_comparison_cache_table(cursor)
+
+def create_session_stats_table(cursor):
+    """建立爬取任務統計快取表（每個 session 一列，寫入商品時同步更新）"""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS session_stats (
+        session_id INTEGER PRIMARY KEY,
+        product_count INTEGER NOT NULL DEFAULT 0,
+        filtered_count INTEGER NOT NULL DEFAULT 0,
+        min_price INTEGER,
+        max_price INTEGER,
+        avg_price REAL,
+        p25_price REAL,
+        p50_price REAL,
+        p75_price REAL,
+        p90_price REAL,
+        platform_stats TEXT,
+        updated_at DATETIME NOT NULL,
+        FOREIGN KEY (session_id) REFERENCES crawl_sessions (id)
+    );
+    """)
+
+def create_archived_sessions_table(cursor):
+    """建立歸檔任務索引表（任務移出即時資料庫後仍可依 ID 找到歸檔檔案）"""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS archived_sessions (
+        session_id INTEGER PRIMARY KEY,
+        keyword TEXT NOT NULL,
+        crawl_time DATETIME NOT NULL,
+        total_products INTEGER DEFAULT 0,
+        platforms TEXT,
+        archive_path TEXT NOT NULL,
+        file_size INTEGER,
+        archived_at DATETIME NOT NULL
+    );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_archived_sessions_time ON archived_sessions (crawl_time);")
+
+def create_title_index_table(cursor):
+    """建立商品標題的 LSH bucket 索引表（core.minhash 使用；依 bucket 查詢，依來源與 ID 刪除）"""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS title_lsh_buckets (
+        bucket INTEGER NOT NULL,
+        source TEXT NOT NULL,
+        item_id INTEGER NOT NULL,
+        PRIMARY KEY (bucket, source, item_id)
+    ) WITHOUT ROWID;
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_title_lsh_item ON title_lsh_buckets (source, item_id);")
+    # 背景索引的水位線：每個來源已建立索引的最大 ID 與索引格式版本（沒有紀錄時從頭補建），
+    # 以及已重新索引的最後 updated_at（daily_deals 的標題會就地更新）
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS title_index_state (
+        source TEXT PRIMARY KEY,
+        last_id INTEGER NOT NULL,
+        version INTEGER NOT NULL,
+        updated_at DATETIME NOT NULL,
+        modified_mark TEXT
     );
     """)
-    cursor.execute("CREATE INDEX idx_comparison_cache_target ON product_comparison_cache (target_product_id);")
-    cursor.execute("CREATE INDEX idx_comparison_cache_similarity ON product_comparison_cache (similarity);")
 
 def update_database_schema(cursor):
     """更新資料庫架構（處理現有資料庫的遷移）"""
@@ -116,6 +522,36 @@ def update_database_schema(cursor):
         if 'discount_percent' not in columns:
             print("添加 discount_percent 欄位到 daily_deals 表...")
             cursor.execute("ALTER TABLE daily_deals ADD COLUMN discount_percent REAL")
+
+        if 'is_expired' not in columns:
+            print("添加 is_expired 欄位到 daily_deals 表...")
+            cursor.execute("ALTER TABLE daily_deals ADD COLUMN is_expired BOOLEAN DEFAULT 0")
+
+        if 'updated_at' not in columns:
+            print("添加 updated_at 欄位到 daily_deals 表...")
+            cursor.execute("ALTER TABLE daily_deals ADD COLUMN updated_at DATETIME")
+
+        create_daily_deals_refresh_table(cursor)
+        create_daily_deals_summary_index(cursor)
+        create_delta_sync_tables(cursor)
+        create_pagination_indexes(cursor)
+        migrate_comparison_cache_table(cursor)
+        create_deal_matches_table(cursor)
+        create_archived_sessions_table(cursor)
+
+        # 檢查 session_stats 表是否存在，不存在則建立
+        # （既有 session 的統計在第一次讀取時由 get_session_stats 補算，不在啟動時全部重算）
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='session_stats'")
+        if cursor.fetchone() is None:
+            print("建立 session_stats 統計表...")
+            create_session_stats_table(cursor)
+
+        # 標題近似重複索引：只建立資料表，既有商品由 core.minhash 的背景索引執行緒依水位線補建
+        create_title_index_table(cursor)
+        cursor.execute("PRAGMA table_info(title_index_state)")
+        if 'modified_mark' not in [row[1] for row in cursor.fetchall()]:
+            print("添加 modified_mark 欄位到 title_index_state 表...")
+            cursor.execute("ALTER TABLE title_index_state ADD COLUMN modified_mark TEXT")
             
     except Exception as e:
         print(f"更新資料庫架構時發生錯誤: {e}")
@@ -129,8 +565,16 @@ def init_db():
     cursor.execute("""
         SELECT name FROM sqlite_master WHERE type='table' AND name='crawl_sessions'
     """)
+    is_new_database = cursor.fetchone() is None
+
+    if is_new_database:
+        # 新資料庫直接使用 INCREMENTAL（必須在建立任何資料表之前設定），之後由背景維護分段回收空頁
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+    # WAL 模式：寫入執行緒提交時不會阻塞連線池中的讀取
+    cursor.execute("PRAGMA journal_mode=WAL")
     
-    if cursor.fetchone() is None:
+    if is_new_database:
         print("建立資料表...")
         create_tables(cursor)
         conn.commit()
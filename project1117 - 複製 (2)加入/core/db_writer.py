@@ -0,0 +1,248 @@
+"""
+資料庫單一寫入執行緒
+所有寫入操作（爬蟲結果、每日促銷、過濾標記、刪除任務、GitHub 同步）
+都排入同一個佇列，由專屬的寫入執行緒批次取出並以群組提交（group commit）執行，
+避免多個執行緒同時開啟寫入交易造成 `database is locked`。讀取仍使用連線池。
+"""
+
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable
+
+import core.database as database
+
+# 每次群組提交最多包含的寫入工作數
+DEFAULT_BATCH_SIZE = 64
+
+
+class _WriteTask:
+    """佇列中的一個寫入工作"""
+
+    def __init__(self, func: Callable, args: tuple, kwargs: dict, exclusive: bool = False):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.exclusive = exclusive
+        self.future = Future()
+
+
+class DatabaseWriter:
+    """單一寫入執行緒：批次取出寫入工作，每批一個交易、每個工作一個 SAVEPOINT"""
+
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._conn = None
+        self._db_path = None
+        self._last_activity = time.monotonic()
+        self.stats = {
+            'batches': 0,
+            'tasks': 0,
+            'failed_tasks': 0,
+            'largest_batch': 0,
+        }
+
+    # --- 公開介面 ---
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """
+        排入一個寫入工作
+
+        func 會在寫入執行緒中以 func(conn, *args, **kwargs) 呼叫，conn 已處於交易中；
+        func 不可自行 commit / rollback，拋出例外時只會回滾該工作本身。
+
+        Returns:
+            Future: 交易提交後才會得到 func 的返回值（或例外）
+        """
+        task = _WriteTask(func, args, kwargs)
+        if self._in_writer_thread():
+            # 寫入工作中再提交寫入：直接在目前交易中執行，避免自我等待
+            self._run_nested(task)
+            return task.future
+        self._ensure_started()
+        self._queue.put(task)
+        return task.future
+
+    def execute(self, func: Callable, *args, timeout: float = None, **kwargs) -> Any:
+        """排入寫入工作並等待結果"""
+        return self.submit(func, *args, **kwargs).result(timeout=timeout)
+
+    def run_exclusive(self, func: Callable, *args, timeout: float = None, **kwargs) -> Any:
+        """
+        在沒有任何寫入連線開啟的情況下執行 func(*args, **kwargs)
+
+        用於替換資料庫檔案：寫入執行緒會先完成排在前面的工作、關閉自己的連線並讓連線池失效，
+        執行完畢後才重新開啟連線處理後續工作。
+        """
+        task = _WriteTask(func, args, kwargs, exclusive=True)
+        if self._in_writer_thread():
+            raise RuntimeError("不能在寫入工作中執行獨佔操作")
+        self._ensure_started()
+        self._queue.put(task)
+        return task.future.result(timeout=timeout)
+
+    def idle_seconds(self) -> float:
+        """距離上一次寫入工作完成經過的秒數（佇列中仍有工作時為 0）"""
+        if not self._queue.empty():
+            return 0.0
+        return time.monotonic() - self._last_activity
+
+    def get_status(self) -> dict:
+        """寫入佇列狀態"""
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'queued': self._queue.qsize(),
+            'idle_seconds': round(self.idle_seconds(), 1),
+            **self.stats,
+        }
+
+    # --- 寫入執行緒 ---
+
+    def _in_writer_thread(self) -> bool:
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def _connect(self):
+        """開啟（或在 DB_PATH 改變時重新開啟）寫入連線"""
+        if self._conn is not None and self._db_path == database.DB_PATH:
+            return self._conn
+        self._close()
+        # isolation_level=None：交易完全由寫入執行緒以 BEGIN/COMMIT 控制
+        conn = sqlite3.connect(database.DB_PATH, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {database.BUSY_TIMEOUT_MS}")
+        self._conn = conn
+        self._db_path = database.DB_PATH
+        return conn
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except sqlite3.Error:
+                pass
+            self._conn = None
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # 盡量把已排隊的工作併入同一批，獨佔工作單獨處理
+            while len(batch) < self.batch_size and not batch[-1].exclusive:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            exclusive = batch.pop() if batch[-1].exclusive else None
+            if batch:
+                self._commit_batch(batch)
+            if exclusive is not None:
+                self._run_exclusive_task(exclusive)
+            self._last_activity = time.monotonic()
+
+    def _commit_batch(self, batch):
+        """以一個交易執行一批工作；每個工作使用 SAVEPOINT，失敗只回滾自己"""
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+        except Exception as e:
+            for task in batch:
+                task.future.set_exception(e)
+            return
+
+        outcomes = []
+        try:
+            for task in batch:
+                conn.execute("SAVEPOINT write_task")
+                try:
+                    result = task.func(conn, *task.args, **task.kwargs)
+                    conn.execute("RELEASE write_task")
+                    outcomes.append((task, True, result))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write_task")
+                    conn.execute("RELEASE write_task")
+                    outcomes.append((task, False, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            # 提交失敗或連線異常：整批回滾，所有工作都回報錯誤，下次重新開啟連線
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            self._close()
+            for task in batch:
+                task.future.set_exception(e)
+            return
+
+        self.stats['batches'] += 1
+        self.stats['tasks'] += len(batch)
+        self.stats['largest_batch'] = max(self.stats['largest_batch'], len(batch))
+        for task, ok, value in outcomes:
+            if ok:
+                task.future.set_result(value)
+            else:
+                self.stats['failed_tasks'] += 1
+                task.future.set_exception(value)
+
+    def _run_nested(self, task):
+        """
+        在寫入執行緒內巢狀提交的工作：以 SAVEPOINT 併入目前交易
+
+        Raises:
+            RuntimeError: 不在寫入交易中（例如在 run_exclusive 的工作中提交，寫入連線已關閉）
+        """
+        conn = self._conn
+        if conn is None or not conn.in_transaction:
+            raise RuntimeError("寫入連線未開啟（獨佔操作中不能提交寫入工作）")
+        conn.execute("SAVEPOINT nested_write_task")
+        try:
+            result = task.func(conn, *task.args, **task.kwargs)
+            conn.execute("RELEASE nested_write_task")
+            task.future.set_result(result)
+        except Exception as e:
+            conn.execute("ROLLBACK TO nested_write_task")
+            conn.execute("RELEASE nested_write_task")
+            task.future.set_exception(e)
+
+    def _run_exclusive_task(self, task):
+        """關閉所有連線後執行獨佔工作"""
+        try:
+            if self._conn is not None:
+                try:
+                    # 把 WAL 內容寫回主檔案，替換檔案時才不會遺失或混入舊資料
+                    self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                except sqlite3.Error:
+                    pass
+            self._close()
+            database.connection_pool.invalidate()
+            task.future.set_result(task.func(*task.args, **task.kwargs))
+        except Exception as e:
+            task.future.set_exception(e)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_db_writer() -> DatabaseWriter:
+    """取得全域共用的寫入執行緒"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = DatabaseWriter()
+        return _writer
+
+
+def write(func: Callable, *args, timeout: float = None, **kwargs) -> Any:
+    """以全域寫入執行緒執行寫入工作並等待結果（便利函式）"""
+    return get_db_writer().execute(func, *args, timeout=timeout, **kwargs)
@@ -0,0 +1,341 @@
+"""
+daily_deals 列級增量同步（delta sync）
+取代「下載整個遠端資料庫檔案只為了複製一張表」的做法：
+
+- 產生端（producer）依 updated_at 水位線輸出之後有變動的 daily_deals 列，
+  以欄式 JSON + lzma 壓縮成變更集（changeset）
+- 套用端（consumer）以 URL 為鍵 UPSERT 變更集，並在同一個交易中記錄新的水位線
+- 水位線太舊、水位線不在產生端的資料範圍內，或變動列數接近整張表時，
+  產生端改送完整快照，套用端以完整快照合併（快照中沒有的商品標記為過期）
+
+命令列用法:
+    python -m core.delta_sync produce --db data/crawler_data.db --since 2026-01-01T00:00:00 -o changes.json.xz
+    python -m core.delta_sync apply --db data/crawler_data.db changes.json.xz
+    python -m core.delta_sync pull http://host:5000/api/daily-deals/changes
+"""
+
+import argparse
+import json
+import lzma
+import os
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import core.database as database
+from core.daily_deals_merge import merge_all_daily_deals
+from core.db_writer import get_db_writer
+from core.minhash import get_title_indexer
+
+# 變更集格式版本（欄位配置改變時遞增）
+CHANGESET_FORMAT_VERSION = 1
+
+# 水位線早於這個天數時改送完整快照
+MAX_DELTA_AGE_DAYS = 7
+
+# 變動列數超過有效商品數的這個比例時，完整快照不會比增量大多少，直接送快照
+SNAPSHOT_RATIO = 0.5
+
+# 變更集中的欄位（url 為套用時的鍵；updated_at 由套用端以本地時間重新記錄）
+CHANGESET_COLUMNS = (
+    'platform', 'title', 'price', 'original_price', 'discount_percent',
+    'url', 'image_url', 'crawl_time', 'is_expired'
+)
+
+# 未指定來源名稱時使用的套用端狀態鍵
+DEFAULT_SOURCE = 'default'
+
+
+def _to_columns(rows) -> Dict[str, List]:
+    return {column: [row[column] for row in rows] for column in CHANGESET_COLUMNS}
+
+
+def _from_columns(columns: Dict[str, List]) -> List[Dict]:
+    names = list(columns.keys())
+    return [dict(zip(names, values)) for values in zip(*(columns[name] for name in names))]
+
+
+def _snapshot_reason(conn, since: Optional[str], max_age_days: float, now: datetime) -> Optional[str]:
+    """判斷是否必須改送完整快照，返回原因（None 表示可以送增量）"""
+    if not since:
+        return 'no_watermark'
+    try:
+        since_time = datetime.fromisoformat(since)
+    except ValueError:
+        return 'invalid_watermark'
+    if since_time < now - timedelta(days=max_age_days):
+        return 'watermark_too_old'
+    if since_time > now:
+        # 水位線不是這個產生端發出的（例如來自時鐘不同的其他來源）
+        return 'watermark_in_future'
+
+    changed = conn.execute("SELECT COUNT(*) FROM daily_deals WHERE updated_at >= ?", (since,)).fetchone()[0]
+    active = conn.execute("SELECT COUNT(*) FROM daily_deals WHERE is_expired = 0").fetchone()[0]
+    if active and changed > active * SNAPSHOT_RATIO:
+        return 'delta_too_large'
+    return None
+
+
+def produce_changeset(conn, since: Optional[str] = None, max_age_days: float = MAX_DELTA_AGE_DAYS) -> Dict:
+    """
+    產生 since 之後的 daily_deals 變更集
+
+    Args:
+        conn: 資料庫連線（建議在 read_snapshot 中，確保計數與資料一致）
+        since (str): 套用端上次的水位線（ISO 時間），None 表示沒有
+        max_age_days (float): 水位線早於這個天數時改送完整快照
+
+    Returns:
+        Dict: kind 為 'delta' 或 'snapshot'，watermark 為套用後應記錄的新水位線
+    """
+    now = datetime.now()
+    max_watermark = conn.execute("SELECT MAX(updated_at) FROM daily_deals").fetchone()[0]
+    reason = _snapshot_reason(conn, since, max_age_days, now)
+    columns = ', '.join(CHANGESET_COLUMNS)
+
+    if reason is None:
+        # 使用 >=：同一次合併的列共用同一個 updated_at，重送邊界上的列不會造成變動
+        rows = conn.execute(
+            f"SELECT {columns} FROM daily_deals WHERE updated_at >= ? ORDER BY updated_at, id", (since,)
+        ).fetchall()
+        refresh = conn.execute(
+            "SELECT platform, refreshed_at FROM daily_deals_refresh WHERE refreshed_at >= ?", (since,)
+        ).fetchall()
+        kind = 'delta'
+    else:
+        rows = conn.execute(
+            f"SELECT {columns} FROM daily_deals WHERE is_expired = 0 AND url IS NOT NULL ORDER BY id"
+        ).fetchall()
+        refresh = conn.execute("SELECT platform, refreshed_at FROM daily_deals_refresh").fetchall()
+        kind = 'snapshot'
+
+    return {
+        'format_version': CHANGESET_FORMAT_VERSION,
+        'kind': kind,
+        'snapshot_reason': reason,
+        'since': since,
+        # 以已提交的最大 updated_at 作為水位線：寫入依序提交，進行中的合併時間不會早於它。
+        # 全部都是沒有 updated_at 的舊資料時沒有水位線，下次仍會收到快照
+        'watermark': max_watermark or since,
+        'generated_at': now.isoformat(),
+        'row_count': len(rows),
+        'deals': _to_columns(rows),
+        'refresh': [[row[0], row[1]] for row in refresh],
+    }
+
+
+def encode_changeset(changeset: Dict) -> bytes:
+    """序列化並壓縮變更集"""
+    data = json.dumps(changeset, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return lzma.compress(data, preset=6)
+
+
+def decode_changeset(data: bytes) -> Dict:
+    """解壓縮並檢查變更集格式"""
+    changeset = json.loads(lzma.decompress(data).decode('utf-8'))
+    if changeset.get('format_version') != CHANGESET_FORMAT_VERSION:
+        raise ValueError(f"不支援的變更集格式版本: {changeset.get('format_version')}")
+    if changeset.get('kind') not in ('delta', 'snapshot'):
+        raise ValueError(f"未知的變更集類型: {changeset.get('kind')}")
+    return changeset
+
+
+def get_watermark(conn, source: str = DEFAULT_SOURCE) -> Optional[str]:
+    """套用端記錄的水位線（沒有紀錄時返回 None）"""
+    row = conn.execute("SELECT watermark FROM delta_sync_state WHERE source = ?", (source,)).fetchone()
+    return row[0] if row else None
+
+
+def _upsert_delta(cursor, deals: List[Dict]) -> Dict[str, int]:
+    """以 URL 為鍵套用增量列（保留遠端的過期狀態），只寫入內容有變動的列（標題索引由背景索引依 updated_at 更新）"""
+    now = datetime.now().isoformat()
+    inserted = updated = 0
+    for deal in deals:
+        if not deal.get('url'):
+            continue
+        exists = cursor.execute("SELECT 1 FROM daily_deals WHERE url = ?", (deal['url'],)).fetchone() is not None
+        cursor.execute("""
+            INSERT INTO daily_deals (
+                platform, title, price, original_price, discount_percent,
+                url, image_url, crawl_time, is_expired, updated_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                platform = excluded.platform,
+                title = excluded.title,
+                price = excluded.price,
+                original_price = excluded.original_price,
+                discount_percent = excluded.discount_percent,
+                image_url = excluded.image_url,
+                crawl_time = excluded.crawl_time,
+                is_expired = excluded.is_expired,
+                updated_at = excluded.updated_at
+            WHERE daily_deals.title IS NOT excluded.title
+               OR daily_deals.price IS NOT excluded.price
+               OR daily_deals.original_price IS NOT excluded.original_price
+               OR daily_deals.discount_percent IS NOT excluded.discount_percent
+               OR daily_deals.image_url IS NOT excluded.image_url
+               OR daily_deals.platform IS NOT excluded.platform
+               OR daily_deals.is_expired IS NOT excluded.is_expired
+        """, (
+            deal['platform'], deal['title'], deal['price'], deal['original_price'],
+            deal['discount_percent'], deal['url'], deal['image_url'], deal['crawl_time'],
+            1 if deal['is_expired'] else 0, now,
+        ))
+        if not exists:
+            inserted += 1
+        elif cursor.rowcount:
+            updated += 1
+    return {'inserted': inserted, 'updated': updated, 'unchanged': len(deals) - inserted - updated}
+
+
+def apply_changeset(conn, changeset: Dict, source: str = DEFAULT_SOURCE) -> Dict:
+    """
+    套用變更集（在呼叫端的交易中執行，本身不 commit）
+
+    Args:
+        conn: 資料庫連線（通常是寫入執行緒的工作）
+        changeset (Dict): decode_changeset 的結果
+        source (str): 來源名稱，水位線依來源分別記錄
+
+    Returns:
+        Dict: kind、各項數量與新的水位線
+    """
+    cursor = conn.cursor()
+    deals = _from_columns(changeset['deals'])
+
+    if changeset['kind'] == 'snapshot':
+        counts = merge_all_daily_deals(conn, [deal for deal in deals if not deal['is_expired']])
+    else:
+        counts = _upsert_delta(cursor, deals)
+
+    # 平台刷新時間只往前推進
+    for platform, refreshed_at in changeset['refresh']:
+        cursor.execute("""
+            INSERT INTO daily_deals_refresh (platform, refreshed_at) VALUES (?, ?)
+            ON CONFLICT(platform) DO UPDATE SET refreshed_at = excluded.refreshed_at
+            WHERE excluded.refreshed_at > daily_deals_refresh.refreshed_at
+        """, (platform, refreshed_at))
+
+    cursor.execute("""
+        INSERT OR REPLACE INTO delta_sync_state (source, watermark, kind, applied_at)
+        VALUES (?, ?, ?, ?)
+    """, (source, changeset['watermark'], changeset['kind'], datetime.now().isoformat()))
+
+    return {'kind': changeset['kind'], 'watermark': changeset['watermark'], **counts}
+
+
+def pull_changes(url: str, source: Optional[str] = None, db_path: Optional[str] = None, timeout: float = 30) -> Dict:
+    """
+    從產生端 HTTP 端點取得並套用變更集
+
+    端點需接受 since 查詢參數並回傳 encode_changeset 的內容，
+    例如本專案的 /api/daily-deals/changes。
+
+    Args:
+        url (str): 變更集端點
+        source (str): 水位線的來源名稱，預設為 url
+        db_path (str): 要套用的資料庫，預設為目前的 DB_PATH（經由寫入執行緒）
+
+    Returns:
+        Dict: apply_changeset 的結果，另含 bytes（傳輸的位元組數）
+    """
+    import requests
+
+    source = source or url
+    db_path = db_path or database.DB_PATH
+    live = os.path.abspath(db_path) == os.path.abspath(database.DB_PATH)
+
+    if live:
+        with database.read_snapshot() as conn:
+            since = get_watermark(conn, source)
+    else:
+        conn = sqlite3.connect(db_path)
+        try:
+            since = get_watermark(conn, source)
+        finally:
+            conn.close()
+
+    response = requests.get(url, params={'since': since} if since else None, timeout=timeout)
+    response.raise_for_status()
+    changeset = decode_changeset(response.content)
+
+    if live:
+        result = get_db_writer().execute(apply_changeset, changeset, source)
+        # 新增與標題變動的促銷在背景建立索引
+        get_title_indexer().notify()
+    else:
+        conn = sqlite3.connect(db_path)
+        try:
+            result = apply_changeset(conn, changeset, source)
+            conn.commit()
+        finally:
+            conn.close()
+
+    result['bytes'] = len(response.content)
+    print(f"🔄 daily_deals {changeset['kind']} 同步完成（{result['bytes']} bytes）："
+          f"新增 {result.get('inserted', 0)}、更新 {result.get('updated', 0)}、水位線 {result['watermark']}")
+    return result
+
+
+def _open_with_schema(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    database.update_database_schema(conn.cursor())
+    return conn
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='daily_deals 列級增量同步')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    produce = sub.add_parser('produce', help='輸出水位線之後的變更集')
+    produce.add_argument('--db', default=database.DB_PATH)
+    produce.add_argument('--since', default=None, help='上次的水位線（ISO 時間）')
+    produce.add_argument('--max-age-days', type=float, default=MAX_DELTA_AGE_DAYS)
+    produce.add_argument('-o', '--output', required=True)
+
+    apply = sub.add_parser('apply', help='套用變更集檔案')
+    apply.add_argument('--db', default=database.DB_PATH)
+    apply.add_argument('--source', default=DEFAULT_SOURCE)
+    apply.add_argument('changeset')
+
+    pull = sub.add_parser('pull', help='從 HTTP 端點取得並套用變更集')
+    pull.add_argument('--db', default=database.DB_PATH)
+    pull.add_argument('--source', default=None)
+    pull.add_argument('url')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'produce':
+        conn = _open_with_schema(args.db)
+        try:
+            changeset = produce_changeset(conn, args.since, args.max_age_days)
+        finally:
+            conn.close()
+        data = encode_changeset(changeset)
+        with open(args.output, 'wb') as f:
+            f.write(data)
+        print(f"✅ 已輸出 {changeset['kind']} 變更集：{changeset['row_count']} 列，{len(data)} bytes，"
+              f"水位線 {changeset['watermark']}")
+    elif args.command == 'apply':
+        with open(args.changeset, 'rb') as f:
+            changeset = decode_changeset(f.read())
+        conn = _open_with_schema(args.db)
+        try:
+            result = apply_changeset(conn, changeset, args.source)
+            conn.commit()
+        finally:
+            conn.close()
+        print(f"✅ 已套用 {result['kind']} 變更集：{result}")
+    else:
+        conn = _open_with_schema(args.db)
+        conn.commit()
+        conn.close()
+        database.DB_PATH = args.db
+        pull_changes(args.url, args.source, args.db)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,544 @@
+"""
+商品標題的雜湊向量與近似最近鄰（IVF）索引
+只用 CPU 與 NumPy，不需要模型，也不需要額外的向量資料庫：
+
+- 標題的詞、相鄰詞組與字元 n-gram 以雜湊技巧（feature hashing）投影成 EMBEDDING_DIM 維向量並正規化
+- 向量存在與資料庫同目錄的 NumPy memmap 中，第 i 列對應 ids[i] 的商品 ID（只附加，不重寫）
+- 向量數達到 IVF_MIN_VECTORS 後以 k-means 訓練 IVF 分群，查詢只掃描最接近的 NPROBE 群；
+  之前以及分群前都是暴力內積
+- 商品寫入後由背景的 EmbeddingSyncer 以 sync() 增量加入 ID 大於索引最大值的商品（短時間內多次寫入只同步一次），
+  爬蟲寫入與查詢都不等待向量化與 IVF 訓練；資料庫被整個替換（ID 倒退）時自動重建
+- 刪除或歸檔商品時以 remove() 將向量標記為已刪除（分群編號設為 DELETED_LIST），查詢與訓練都會略過；
+  標記的列不回收，直到索引重建
+
+NumPy 是選用套件，未安裝時 get_embedding_index() 返回 None，呼叫端改用 core.minhash。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import core.database as database
+from core.ranking import char_ngrams, word_tokens
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+    print("Warning: numpy not installed. Title embedding index will be disabled.")
+
+# 索引檔案格式版本（向量化方式改變時遞增，舊索引會被重建）
+INDEX_FORMAT_VERSION = 1
+
+# 向量維度與各類特徵的權重
+EMBEDDING_DIM = 256
+WORD_WEIGHT = 1.0
+WORD_BIGRAM_WEIGHT = 0.7
+CHAR_NGRAM_WEIGHT = 0.4
+
+# memmap 的初始容量（列數），不足時加倍
+INITIAL_CAPACITY = 4096
+
+# IVF 參數
+IVF_MIN_VECTORS = 2000        # 向量數達到此值才訓練分群，之前使用暴力搜尋
+IVF_RETRAIN_GROWTH = 4        # 向量數成長為訓練時的幾倍後重新訓練
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_SIZE = 20000
+NPROBE = 8
+
+# 索引目錄名稱（與資料庫檔案放在同一個目錄下）與增量同步每批列數
+EMBEDDINGS_DIRNAME = 'embeddings'
+SYNC_BATCH_SIZE = 5000
+
+# 背景同步：收到通知後等待的秒數（合併連續的寫入）與沒有通知時的檢查間隔
+SYNC_DEBOUNCE_SECONDS = 2
+SYNC_POLL_SECONDS = 300
+
+# 已刪除向量的分群編號（未訓練前的向量為 -1）
+DELETED_LIST = -2
+
+_META_FILENAME = 'meta.json'
+_VECTORS_FILENAME = 'vectors.f32'
+_IDS_FILENAME = 'ids.i64'
+_LISTS_FILENAME = 'lists.i32'
+_CENTROIDS_FILENAME = 'centroids.npy'
+
+
+def get_embeddings_dir(db_path: str = None) -> str:
+    """向量索引目錄（跟隨資料庫位置）"""
+    return os.path.join(os.path.dirname(db_path or database.DB_PATH), EMBEDDINGS_DIRNAME)
+
+
+def _title_features(title: str) -> List[Tuple[str, float]]:
+    """標題的（特徵, 權重）：詞、相鄰詞組與字元 n-gram，以前綴區分類別避免互相碰撞"""
+    words = word_tokens(title)
+    features = [('w:' + word, WORD_WEIGHT) for word in words]
+    features.extend(('b:' + a + ' ' + b, WORD_BIGRAM_WEIGHT) for a, b in zip(words, words[1:]))
+    features.extend(('c:' + gram, CHAR_NGRAM_WEIGHT) for gram in char_ngrams(title))
+    return features
+
+
+def embed_titles(titles: Sequence[str], dim: int = EMBEDDING_DIM):
+    """
+    將標題轉為 L2 正規化的雜湊向量
+
+    Returns:
+        np.ndarray: (len(titles), dim) 的 float32 陣列；沒有任何特徵的標題為零向量
+    """
+    vectors = np.zeros((len(titles), dim), dtype=np.float32)
+    for row, title in enumerate(titles):
+        for feature, weight in _title_features(title):
+            digest = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+            sign = 1.0 if (digest >> 63) & 1 else -1.0
+            vectors[row, digest % dim] += sign * weight
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+class EmbeddingIndex:
+    """以 memmap 儲存、可增量加入的標題向量 IVF 索引"""
+
+    def __init__(self, directory: str, dim: int = EMBEDDING_DIM):
+        self.directory = directory
+        self.dim = dim
+        self._lock = threading.RLock()        # 只在讀寫 memmap 與中繼資料的短時間內持有
+        self._train_lock = threading.Lock()   # 同時只進行一次 k-means 訓練
+        self._generation = 0                  # reset() 時遞增，讓進行中的訓練結果作廢
+        self._vectors = None
+        self._ids = None
+        self._lists = None
+        self._centroids = None
+        self._inverted = None  # (依群排序的列號, 各群起點)；加入向量後延遲重建
+        self.meta = None
+        os.makedirs(directory, exist_ok=True)
+        self._open()
+
+    # --- 檔案與容量 ---
+
+    def _path(self, filename: str) -> str:
+        return os.path.join(self.directory, filename)
+
+    def _empty_meta(self) -> Dict:
+        return {
+            'version': INDEX_FORMAT_VERSION, 'dim': self.dim, 'count': 0, 'capacity': 0,
+            'max_id': 0, 'trained_count': 0, 'deleted': 0, 'updated_at': None,
+        }
+
+    def _save_meta(self):
+        self.meta['updated_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        tmp_path = self._path(_META_FILENAME + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, self._path(_META_FILENAME))
+
+    def _map(self, filename: str, dtype, shape):
+        return np.memmap(self._path(filename), dtype=dtype, mode='r+', shape=shape)
+
+    def _close_maps(self):
+        for array in (self._vectors, self._ids, self._lists):
+            if array is not None:
+                array.flush()
+        self._vectors = self._ids = self._lists = None
+
+    def _open(self):
+        """載入既有索引；格式或維度不符、檔案不完整時重新開始"""
+        meta = None
+        try:
+            with open(self._path(_META_FILENAME), encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            pass
+        if not meta or meta.get('version') != INDEX_FORMAT_VERSION or meta.get('dim') != self.dim:
+            meta = self._empty_meta()
+        self.meta = meta
+        self._centroids = None
+        self._inverted = None
+        try:
+            self._allocate(max(meta['capacity'], INITIAL_CAPACITY))
+            if meta['trained_count'] and os.path.exists(self._path(_CENTROIDS_FILENAME)):
+                self._centroids = np.load(self._path(_CENTROIDS_FILENAME))
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 向量索引損毀，重新建立: {e}")
+            self.reset()
+
+    def _allocate(self, capacity: int):
+        """確保三個 memmap 檔案至少有 capacity 列（檔案只會變大，既有內容保留）"""
+        self._close_maps()
+        for filename, itemsize in ((_VECTORS_FILENAME, 4 * self.dim), (_IDS_FILENAME, 8), (_LISTS_FILENAME, 4)):
+            path = self._path(filename)
+            with open(path, 'ab') as f:
+                if f.tell() < capacity * itemsize:
+                    f.truncate(capacity * itemsize)
+        self._vectors = self._map(_VECTORS_FILENAME, np.float32, (capacity, self.dim))
+        self._ids = self._map(_IDS_FILENAME, np.int64, (capacity,))
+        self._lists = self._map(_LISTS_FILENAME, np.int32, (capacity,))
+        self.meta['capacity'] = capacity
+
+    def reset(self):
+        """清空索引（資料庫被替換時使用）"""
+        with self._lock:
+            self._close_maps()
+            for filename in (_VECTORS_FILENAME, _IDS_FILENAME, _LISTS_FILENAME, _CENTROIDS_FILENAME):
+                try:
+                    os.remove(self._path(filename))
+                except FileNotFoundError:
+                    pass
+            self.meta = self._empty_meta()
+            self._centroids = None
+            self._inverted = None
+            self._generation += 1
+            self._allocate(INITIAL_CAPACITY)
+            self._save_meta()
+
+    @property
+    def count(self) -> int:
+        return self.meta['count']
+
+    # --- 寫入 ---
+
+    def add(self, product_ids: Sequence[int], titles: Sequence[str]) -> int:
+        """
+        附加商品向量（ID 不大於索引中最大 ID 的商品會被略過）
+
+        向量化與分群指派在鎖外計算，只有附加到 memmap 時持有鎖；需要（重新）訓練時在附加後於鎖外訓練。
+
+        Returns:
+            int: 實際加入的數量
+        """
+        pairs = sorted((pid, title) for pid, title in zip(product_ids, titles) if pid > self.meta['max_id'])
+        if not pairs:
+            return 0
+        vectors = embed_titles([title for _, title in pairs], self.dim)
+        centroids = self._centroids
+        lists = self._assign(vectors, centroids) if centroids is not None else None
+        with self._lock:
+            # ids 依遞增順序附加，remove() 以二分搜尋找出列號
+            keep = [i for i, (pid, _) in enumerate(pairs) if pid > self.meta['max_id']]
+            if not keep:
+                return 0
+            if len(keep) < len(pairs):
+                pairs = [pairs[i] for i in keep]
+                vectors = vectors[keep]
+                lists = lists[keep] if lists is not None else None
+            if self._centroids is not centroids:
+                # 計算期間分群被重新訓練（或重設），改用目前的分群（只有這一批，很快）
+                lists = self._assign(vectors, self._centroids) if self._centroids is not None else None
+            start = self.meta['count']
+            end = start + len(pairs)
+            if end > self.meta['capacity']:
+                self._allocate(max(end, self.meta['capacity'] * 2))
+
+            self._vectors[start:end] = vectors
+            self._ids[start:end] = [pid for pid, _ in pairs]
+            self._lists[start:end] = lists if lists is not None else -1
+            self.meta['count'] = end
+            self.meta['max_id'] = max(self.meta['max_id'], max(pid for pid, _ in pairs))
+            self._inverted = None
+            self._vectors.flush()
+            self._ids.flush()
+            self._lists.flush()
+            self._save_meta()
+            trained = self.meta['trained_count']
+            needs_training = (not trained and end >= IVF_MIN_VECTORS) or \
+                (trained and end >= trained * IVF_RETRAIN_GROWTH)
+
+        if needs_training:
+            self.train()
+        return len(pairs)
+
+    def sync(self, conn=None) -> int:
+        """
+        將資料庫中尚未建立向量的商品加入索引
+
+        每批商品在鎖外讀取與向量化，查詢只需要等待每批附加的片刻。
+
+        Args:
+            conn: 資料庫連線；None 時在 read_snapshot 中讀取
+
+        Returns:
+            int: 加入的商品數
+        """
+        if conn is None:
+            with database.read_snapshot() as snapshot:
+                return self.sync(snapshot)
+
+        max_db_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM products").fetchone()[0]
+        with self._lock:
+            if max_db_id < self.meta['max_id']:
+                print("🔄 資料庫已被替換，重建標題向量索引")
+                self.reset()
+
+        added = 0
+        while True:
+            rows = conn.execute(
+                "SELECT id, title FROM products WHERE id > ? ORDER BY id LIMIT ?",
+                (self.meta['max_id'], SYNC_BATCH_SIZE)
+            ).fetchall()
+            if not rows:
+                break
+            batch_added = self.add([row[0] for row in rows], [row[1] for row in rows])
+            if not batch_added:
+                # 另一個同步已加入這一批
+                break
+            added += batch_added
+        return added
+
+    def remove(self, product_ids: Sequence[int]) -> int:
+        """
+        將已刪除（或已歸檔）商品的向量標記為已刪除
+
+        Returns:
+            int: 標記的向量數（不在索引中的 ID 會被略過）
+        """
+        if not len(product_ids):
+            return 0
+        with self._lock:
+            count = self.meta['count']
+            if not count:
+                return 0
+            ids = np.asarray(self._ids[:count])
+            targets = np.unique(np.asarray(product_ids, dtype=np.int64))
+            rows = np.minimum(np.searchsorted(ids, targets), count - 1)
+            rows = rows[ids[rows] == targets]
+            lists = np.asarray(self._lists[:count])
+            rows = rows[lists[rows] != DELETED_LIST]
+            if not len(rows):
+                return 0
+            self._lists[rows] = DELETED_LIST
+            self._vectors[rows] = 0
+            self._lists.flush()
+            self._vectors.flush()
+            self.meta['deleted'] = self.meta.get('deleted', 0) + len(rows)
+            self._inverted = None
+            self._save_meta()
+            return len(rows)
+
+    # --- IVF ---
+
+    @staticmethod
+    def _assign(vectors, centroids):
+        """每個向量最接近的群（內積最大）"""
+        return np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+
+    def train(self):
+        """
+        以 k-means（球面，內積距離）在抽樣向量上訓練 IVF 分群，並重新指派所有向量
+
+        抽樣與指派都在複本上於鎖外計算，完成後才在鎖內換上新的分群；期間查詢照常使用舊的分群。
+        """
+        if not self._train_lock.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                generation = self._generation
+                count = self.meta['count']
+                vectors = self._vectors
+                live_rows = np.flatnonzero(np.asarray(self._lists[:count]) != DELETED_LIST)
+                nlist = int(min(256, max(8, np.sqrt(len(live_rows)))))
+                if len(live_rows) < nlist:
+                    return
+                rng = np.random.default_rng(0)
+                sample_rows = np.sort(rng.choice(live_rows, min(len(live_rows), KMEANS_SAMPLE_SIZE), replace=False))
+                sample = np.array(vectors[sample_rows])
+
+            centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+            for _ in range(KMEANS_ITERATIONS):
+                assignment = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignment, sample)
+                norms = np.linalg.norm(sums, axis=1, keepdims=True)
+                filled = norms[:, 0] > 0
+                centroids[filled] = sums[filled] / norms[filled]
+            centroids = centroids.astype(np.float32)
+
+            # 前 count 列只會附加不會改寫（刪除只改分群編號），可以在鎖外讀取
+            assignment = np.empty(count, dtype=np.int32)
+            for offset in range(0, count, SYNC_BATCH_SIZE):
+                end = min(count, offset + SYNC_BATCH_SIZE)
+                assignment[offset:end] = self._assign(np.asarray(vectors[offset:end]), centroids)
+
+            with self._lock:
+                if generation != self._generation:
+                    return
+                np.save(self._path(_CENTROIDS_FILENAME), centroids)
+                # 訓練期間被刪除的列保持刪除；訓練期間附加的列以新分群重新指派
+                current = np.asarray(self._lists[:count])
+                self._lists[:count] = np.where(current == DELETED_LIST, DELETED_LIST, assignment)
+                total = self.meta['count']
+                if total > count:
+                    current = np.asarray(self._lists[count:total])
+                    added = self._assign(np.asarray(self._vectors[count:total]), centroids)
+                    self._lists[count:total] = np.where(current == DELETED_LIST, DELETED_LIST, added)
+                self._lists.flush()
+                self._centroids = centroids
+                self.meta['trained_count'] = count
+                self._inverted = None
+                self._save_meta()
+            print(f"🧭 標題向量索引已訓練 {nlist} 個分群（{len(live_rows)} 個向量）")
+        finally:
+            self._train_lock.release()
+
+    def _inverted_lists(self):
+        """依群排序的列號與各群起點（已刪除與未指派的列排在第 0 群之前，不會被掃描）"""
+        if self._inverted is None:
+            lists = np.asarray(self._lists[:self.meta['count']])
+            order = np.argsort(lists, kind='stable')
+            starts = np.searchsorted(lists[order], np.arange(len(self._centroids) + 1))
+            self._inverted = (order, starts)
+        return self._inverted
+
+    # --- 查詢 ---
+
+    def search(self, title: str, k: int = 10, nprobe: int = NPROBE) -> List[Tuple[int, float]]:
+        """
+        找出與標題最相近的商品
+
+        Returns:
+            List[Tuple[int, float]]: (商品 ID, 餘弦相似度)，依相似度排序
+        """
+        query = embed_titles([title], self.dim)[0]
+        if not query.any():
+            return []
+        with self._lock:
+            count = self.meta['count']
+            if not count:
+                return []
+            if self._centroids is None:
+                rows = np.flatnonzero(np.asarray(self._lists[:count]) != DELETED_LIST)
+                if not len(rows):
+                    return []
+                scores = np.asarray(self._vectors[rows]) @ query
+            else:
+                order, starts = self._inverted_lists()
+                probes = np.argsort(self._centroids @ query)[::-1][:nprobe]
+                # 依列號排序後讀取，memmap 的存取較接近循序
+                rows = np.sort(np.concatenate([order[starts[c]:starts[c + 1]] for c in probes]))
+                if not len(rows):
+                    return []
+                scores = np.asarray(self._vectors[rows]) @ query
+            candidates = np.argpartition(scores, -k)[-k:] if len(scores) > k else np.arange(len(scores))
+            top = candidates[np.argsort(scores[candidates])[::-1]]
+            ids = self._ids[rows[top]]
+            return [(int(pid), float(scores[i])) for pid, i in zip(ids, top)]
+
+    def get_status(self) -> Dict:
+        return {
+            'count': self.meta['count'],
+            'max_id': self.meta['max_id'],
+            'dim': self.dim,
+            'ivf_lists': 0 if self._centroids is None else len(self._centroids),
+            'trained_count': self.meta['trained_count'],
+            'deleted': self.meta.get('deleted', 0),
+            'updated_at': self.meta['updated_at'],
+        }
+
+
+_indexes: Dict[str, EmbeddingIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_embedding_index() -> Optional[EmbeddingIndex]:
+    """取得目前資料庫對應的向量索引；未安裝 NumPy 時返回 None"""
+    if not NUMPY_AVAILABLE:
+        return None
+    directory = get_embeddings_dir()
+    with _indexes_lock:
+        if directory not in _indexes:
+            _indexes[directory] = EmbeddingIndex(directory)
+        return _indexes[directory]
+
+
+def remove_from_embedding_index(product_ids: Sequence[int]) -> int:
+    """刪除商品時一併移除向量（在刪除 title_lsh_buckets 的同一段程式中呼叫）；未安裝 NumPy 時不做任何事"""
+    index = get_embedding_index()
+    if index is None:
+        return 0
+    return index.remove(product_ids)
+
+
+class EmbeddingSyncer:
+    """在背景將新寫入的商品加入標題向量索引（收到通知後稍候再同步，合併連續的寫入）"""
+
+    def __init__(self, debounce_seconds: float = SYNC_DEBOUNCE_SECONDS, poll_seconds: float = SYNC_POLL_SECONDS):
+        self.debounce_seconds = debounce_seconds
+        self.poll_seconds = poll_seconds
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self.synced = 0
+        self.last_sync_at = None
+        self.last_error = None
+
+    def start(self):
+        """啟動背景執行緒並立即檢查一次（重複呼叫不會建立多個執行緒）；未安裝 NumPy 時不啟動"""
+        if not NUMPY_AVAILABLE:
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='embedding-syncer', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def notify(self):
+        """有新商品寫入（或資料庫被替換）時呼叫"""
+        self.start()
+
+    def run_pending(self) -> int:
+        """同步到資料庫最新的商品，返回加入的向量數"""
+        index = get_embedding_index()
+        if index is None:
+            return 0
+        with self._run_lock:
+            added = index.sync()
+            self.synced += added
+            self.last_sync_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+            return added
+
+    def _run(self):
+        while True:
+            if self._wakeup.wait(self.poll_seconds):
+                # 爬蟲一次寫入多個平台時會連續通知，稍候再同步只需一次
+                time.sleep(self.debounce_seconds)
+            self._wakeup.clear()
+            try:
+                added = self.run_pending()
+                self.last_error = None
+                if added >= SYNC_BATCH_SIZE:
+                    print(f"🧭 已將 {added} 個商品加入標題向量索引")
+            except sqlite3.OperationalError as e:
+                # 資料庫尚未初始化或暫時被鎖住，下次再試
+                self.last_error = str(e)
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"⚠️ 更新標題向量索引失敗: {e}")
+
+    def get_status(self) -> Dict:
+        index = get_embedding_index()
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'synced': self.synced,
+            'last_sync_at': self.last_sync_at,
+            'last_error': self.last_error,
+            'index': index.get_status() if index is not None else None,
+        }
+
+
+_syncer = None
+_syncer_lock = threading.Lock()
+
+
+def get_embedding_syncer() -> EmbeddingSyncer:
+    """取得全域共用的標題向量索引背景同步執行緒"""
+    global _syncer
+    with _syncer_lock:
+        if _syncer is None:
+            _syncer = EmbeddingSyncer()
+        return _syncer
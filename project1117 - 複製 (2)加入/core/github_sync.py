@@ -1,58 +1,348 @@
 """
 GitHub 資料庫同步模組
 從 GitHub 倉庫下載最新的資料庫檔案
+
+下載使用條件式請求（If-None-Match / If-Modified-Since），遠端未變更時伺服器回應 304，
+不會重新下載、備份或替換資料庫。ETag、Last-Modified 與最後套用的遠端版本記錄在
+資料庫旁的 <資料庫>.sync.json。設定 GITHUB_SYNC_DB_URL 環境變數可改用其他來源（例如本地測試伺服器）。
+設定 DAILY_DEALS_DELTA_URL 時，daily_deals 改以 core.delta_sync 的列級變更集同步，不再下載整個資料庫。
+
+下載以串流分段寫入同目錄的暫存檔（記憶體用量與資料庫大小無關），驗證大小、SHA-256
+與 PRAGMA integrity_check 後，才由寫入執行緒在關閉所有連線後以 os.replace 原子替換。
 """
 
+import hashlib
+import json
 import os
 import requests
-import shutil
 from datetime import datetime
 import sqlite3
 import tempfile
 
-def download_latest_database(github_username="yolok9453", repo_name="crawls-web", branch="master"):
+import core.database as database
+from core.backup import create_backup
+from core.daily_deals_merge import load_daily_deals_from_file, merge_all_daily_deals
+from core.database import update_database_schema
+from core.db_writer import get_db_writer
+
+
+def _migrate_database_file(db_path):
     """
-    從 GitHub 下載最新的資料庫檔案
+    對下載或同步後的資料庫檔案套用本地的資料表遷移，並切換為 WAL 模式
+
+    GitHub 上的檔案是 rollback journal 模式；WAL 設定記錄在檔案標頭中，
+    替換前先切換，替換後讀取連線才不會擋住寫入執行緒。
     """
+    conn = sqlite3.connect(db_path)
     try:
-        # GitHub raw file URL
-        db_url = f"https://raw.githubusercontent.com/{github_username}/{repo_name}/{branch}/data/crawler_data.db"
-        
-        # 本地資料庫路徑
-        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        local_db_path = os.path.join(project_root, 'data', 'crawler_data.db')
-        backup_db_path = os.path.join(project_root, 'data', f'crawler_data_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.db')
+        update_database_schema(conn.cursor())
+        conn.commit()
+        mode = conn.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+    finally:
+        conn.close()
+    if mode.lower() != 'wal':
+        raise RuntimeError(f'下載的資料庫無法切換為 WAL 模式（目前為 {mode}）')
+
+
+def _check_wal_mode(db_path):
+    """確認資料庫為 WAL 模式，不是時嘗試切換；仍無法切換時拋出例外"""
+    conn = sqlite3.connect(db_path)
+    try:
+        mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+        if mode.lower() != 'wal':
+            print(f"⚠️ 替換後的資料庫為 {mode} 模式，切換為 WAL")
+            mode = conn.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+    finally:
+        conn.close()
+    if mode.lower() != 'wal':
+        raise RuntimeError(f'替換後的資料庫無法切換為 WAL 模式（目前為 {mode}）')
+
+
+def _is_live_database(db_path):
+    """判斷路徑是否為應用程式正在使用（由寫入執行緒管理）的資料庫"""
+    return os.path.abspath(db_path) == os.path.abspath(database.DB_PATH)
+
+
+# 串流下載每次讀取的位元組數
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# 替換資料庫前等待讀取連線歸還的最長秒數
+SWAP_DRAIN_TIMEOUT = 30
+
+# 同步狀態檔的副檔名與頻道（整個資料庫 / 只合併 daily_deals）
+SYNC_STATE_SUFFIX = '.sync.json'
+CHANNEL_DATABASE = 'database'
+CHANNEL_DAILY_DEALS = 'daily_deals'
+
+
+def _default_local_db_path():
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(project_root, 'data', 'crawler_data.db')
+
+
+def get_remote_db_url(github_username="yolok9453", repo_name="crawls-web", branch="master"):
+    """遠端資料庫網址（GITHUB_SYNC_DB_URL 環境變數優先）"""
+    return os.environ.get('GITHUB_SYNC_DB_URL') or \
+        f"https://raw.githubusercontent.com/{github_username}/{repo_name}/{branch}/data/crawler_data.db"
+
+
+def _sync_state_path(local_db_path):
+    return local_db_path + SYNC_STATE_SUFFIX
+
+
+def load_sync_state(local_db_path=None):
+    """
+    讀取同步狀態
+
+    Returns:
+        dict: 以頻道為鍵，內容包含 url、etag、last_modified、applied_version、applied_at、checked_at
+    """
+    path = _sync_state_path(local_db_path or _default_local_db_path())
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ 同步狀態檔無法讀取，將重新下載: {e}")
+        return {}
+
+
+def _update_sync_state(local_db_path, channels, **fields):
+    """更新指定頻道的同步狀態（寫入暫存檔後替換）"""
+    state = load_sync_state(local_db_path)
+    for channel in channels:
+        state[channel] = {**state.get(channel, {}), **fields}
+    path = _sync_state_path(local_db_path)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _remote_version(response):
+    """以 ETag（沒有時用 Last-Modified）作為遠端版本識別"""
+    return response.headers.get('ETag') or response.headers.get('Last-Modified')
+
+
+def _conditional_get(url, local_db_path, channel):
+    """
+    帶上次的驗證資訊發送條件式請求
+
+    本地資料庫不存在或上次記錄的網址不同時改為一般請求。
+
+    Returns:
+        requests.Response 或 None（304，遠端未變更）
+    """
+    entry = load_sync_state(local_db_path).get(channel, {})
+    headers = {}
+    if os.path.exists(local_db_path) and entry.get('url') == url:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    response = requests.get(url, headers=headers, timeout=30, stream=True)
+    now = datetime.now().isoformat()
+    if response.status_code == 304:
+        response.close()
+        _update_sync_state(local_db_path, [channel], checked_at=now)
+        print(f"✅ 遠端資料庫未變更（版本 {entry.get('applied_version')}），略過下載")
+        return None
+    try:
+        response.raise_for_status()
+    except requests.exceptions.HTTPError:
+        response.close()
+        raise
+    return response
+
+
+def _stream_to_file(response, path, expected_sha256=None):
+    """
+    把回應內容分段寫入檔案，並驗證大小與 SHA-256
+
+    Args:
+        response: 以 stream=True 取得的回應
+        path (str): 目標檔案（會被覆寫）
+        expected_sha256 (str): 預期的 SHA-256，None 表示只計算不比對
+
+    Returns:
+        tuple: (位元組數, SHA-256)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+    finally:
+        response.close()
+
+    # 有內容編碼（gzip 等）時 Content-Length 是壓縮後的大小，無法直接比對
+    expected_size = response.headers.get('Content-Length')
+    if expected_size is not None and not response.headers.get('Content-Encoding') and int(expected_size) != size:
+        raise ValueError(f'下載不完整：預期 {expected_size} bytes，實際 {size} bytes')
+
+    sha256 = digest.hexdigest()
+    if expected_sha256 and sha256 != expected_sha256.lower():
+        raise ValueError(f'下載檔案的 SHA-256 不符：預期 {expected_sha256}，實際 {sha256}')
+    return size, sha256
+
+
+def _check_integrity(db_path):
+    """PRAGMA integrity_check，結果不是 ok 時拋出 ValueError"""
+    conn = sqlite3.connect(db_path)
+    try:
+        result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+    except sqlite3.DatabaseError as e:
+        result = str(e)
+    finally:
+        conn.close()
+    if result != 'ok':
+        raise ValueError(f'下載的資料庫完整性檢查失敗: {result}')
+
+
+def _remove_database_file(path):
+    """刪除資料庫檔案與其 -wal / -shm（不存在時忽略）"""
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def _swap_database_file(tmp_db_path, local_db_path):
+    """
+    寫入工作（獨佔）：等待讀取連線全部歸還後以 os.replace 原子替換資料庫檔案
+
+    替換前 WAL 必須完全清空，並刪除舊檔案留下的 -wal / -shm，否則新檔案會被套用舊檔案的 WAL 內容；
+    替換後確認新檔案仍為 WAL 模式。
+    """
+    with database.connection_pool.exclusive_access(timeout=SWAP_DRAIN_TIMEOUT):
+        conn = sqlite3.connect(local_db_path)
+        try:
+            busy = conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()[0]
+        finally:
+            conn.close()
+        if busy:
+            raise RuntimeError('仍有其他連線正在讀取資料庫，WAL 無法清空，取消替換')
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(local_db_path + suffix):
+                os.remove(local_db_path + suffix)
+        os.replace(tmp_db_path, local_db_path)
+        _check_wal_mode(local_db_path)
+    database.read_replica.invalidate()
+    # 新檔案的標題索引水位線可能落後（或沒有），由背景索引補建
+    from core.minhash import get_title_indexer
+    get_title_indexer().notify()
+    # 向量索引的列對應舊檔案的商品 ID，清空後由背景重建
+    from core.embeddings import get_embedding_index, get_embedding_syncer
+    embedding_index = get_embedding_index()
+    if embedding_index is not None:
+        embedding_index.reset()
+        get_embedding_syncer().notify()
+
+
+def _validators(url, response, size, sha256):
+    """從回應取出之後條件式請求需要的驗證資訊"""
+    return {
+        'url': url,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'applied_version': _remote_version(response),
+        'size': size,
+        'sha256': sha256,
+    }
+
+
+def _record_applied(local_db_path, channels, validators):
+    """記錄已套用的遠端版本與驗證資訊"""
+    now = datetime.now().isoformat()
+    _update_sync_state(local_db_path, channels, applied_at=now, checked_at=now, **validators)
+
+
+def sync_latest_database(github_username="yolok9453", repo_name="crawls-web", branch="master",
+                         local_db_path=None, expected_sha256=None):
+    """
+    以條件式請求同步整個資料庫
+
+    Args:
+        expected_sha256 (str): 已知的遠端檔案 SHA-256（有提供時必須相符才會替換）
+
+    Returns:
+        dict: status 為 'updated'、'not_modified' 或 'error'，並附上 version / error
+    """
+    tmp_db_path = None
+    try:
+        db_url = get_remote_db_url(github_username, repo_name, branch)
+        local_db_path = local_db_path or _default_local_db_path()
         
         # 確保目錄存在
         os.makedirs(os.path.dirname(local_db_path), exist_ok=True)
         
-        print(f"🔄 正在從 GitHub 下載最新資料庫...")
+        print(f"🔄 正在檢查 GitHub 上的最新資料庫...")
         print(f"📥 下載網址: {db_url}")
         
-        # 下載檔案
-        response = requests.get(db_url, timeout=30)
-        response.raise_for_status()
+        response = _conditional_get(db_url, local_db_path, CHANNEL_DATABASE)
+        if response is None:
+            return {'status': 'not_modified',
+                    'version': load_sync_state(local_db_path)[CHANNEL_DATABASE].get('applied_version')}
         
-        # 備份現有資料庫（如果存在）
+        # 先串流寫入同目錄的暫存檔（同一檔案系統才能原子替換），驗證後再完成遷移
+        tmp_db_path = local_db_path + '.download'
+        size, sha256 = _stream_to_file(response, tmp_db_path, expected_sha256)
+        validators = _validators(db_url, response, size, sha256)
+
+        applied = load_sync_state(local_db_path).get(CHANNEL_DATABASE, {})
+        if os.path.exists(local_db_path) and applied.get('sha256') == sha256:
+            # 版本標記改變但內容相同（例如重新上傳同一個檔案），不需要替換
+            _remove_database_file(tmp_db_path)
+            _record_applied(local_db_path, [CHANNEL_DATABASE, CHANNEL_DAILY_DEALS], validators)
+            print(f"✅ 遠端資料庫內容未變更（SHA-256 {sha256[:12]}），略過替換")
+            return {'status': 'not_modified', 'version': validators['applied_version']}
+
+        _check_integrity(tmp_db_path)
+        _migrate_database_file(tmp_db_path)
+
+        # 線上備份現有資料庫（如果存在），備份期間不會擋住寫入
         if os.path.exists(local_db_path):
-            shutil.copy2(local_db_path, backup_db_path)
-            print(f"💾 已備份現有資料庫到: {backup_db_path}")
-        
-        # 儲存新資料庫
-        with open(local_db_path, 'wb') as f:
-            f.write(response.content)
+            create_backup(label='pre-github-download', db_path=local_db_path)
+
+        if _is_live_database(local_db_path):
+            # 由寫入執行緒在關閉寫入連線後替換：連線池暫停發出連線，
+            # 使用中的讀取連線歸還後才替換，之後的連線都開啟新檔
+            get_db_writer().run_exclusive(_swap_database_file, tmp_db_path, local_db_path)
+        else:
+            _remove_database_file(local_db_path)
+            os.replace(tmp_db_path, local_db_path)
+
+        # 整個資料庫已替換，daily_deals 也同時是這個版本
+        _record_applied(local_db_path, [CHANNEL_DATABASE, CHANNEL_DAILY_DEALS], validators)
         
         print(f"✅ 成功下載資料庫到: {local_db_path}")
-        print(f"📊 檔案大小: {len(response.content)} bytes")
+        print(f"📊 檔案大小: {size} bytes（版本 {validators['applied_version']}，SHA-256 {sha256[:12]}）")
         
-        return True
+        return {'status': 'updated', 'version': validators['applied_version']}
         
     except requests.exceptions.RequestException as e:
         print(f"❌ 下載失敗 - 網路錯誤: {e}")
-        return False
+        return {'status': 'error', 'error': str(e)}
     except Exception as e:
         print(f"❌ 下載失敗 - 其他錯誤: {e}")
-        return False
+        return {'status': 'error', 'error': str(e)}
+    finally:
+        # 驗證失敗或替換前出錯時清除暫存檔，現有資料庫保持不變
+        if tmp_db_path is not None and os.path.exists(tmp_db_path):
+            _remove_database_file(tmp_db_path)
+
+def download_latest_database(github_username="yolok9453", repo_name="crawls-web", branch="master"):
+    """
+    從 GitHub 下載最新的資料庫檔案
+    返回 True 如果下載並替換了資料庫，遠端未變更（304）或失敗時返回 False
+    """
+    return sync_latest_database(github_username, repo_name, branch)['status'] == 'updated'
 
 def check_database_update_time():
     """
@@ -76,7 +366,8 @@ def check_database_update_time():
 
 def auto_sync_if_needed(max_age_hours=1):
     """
-    如果本地資料庫太舊，自動同步
+    如果距離上次檢查遠端已超過 max_age_hours，以條件式請求同步
+    （沒有檢查紀錄時以本地檔案修改時間判斷）
     返回 True 如果有下載更新，False 如果不需要更新
     """
     try:
@@ -86,15 +377,19 @@ def auto_sync_if_needed(max_age_hours=1):
             print("🔄 本地資料庫不存在，開始下載...")
             return download_latest_database()
         
+        checked_at = load_sync_state().get(CHANNEL_DATABASE, {}).get('checked_at')
+        if checked_at:
+            update_time = datetime.fromisoformat(checked_at)
+        
         # 檢查是否需要更新
         now = datetime.now()
         age_hours = (now - update_time).total_seconds() / 3600
         
         if age_hours > max_age_hours:
-            print(f"🔄 本地資料庫已 {age_hours:.1f} 小時未更新，開始同步...")
+            print(f"🔄 已 {age_hours:.1f} 小時未檢查遠端資料庫，開始同步...")
             return download_latest_database()
         else:
-            print(f"✅ 本地資料庫夠新（{age_hours:.1f} 小時前），無需同步")
+            print(f"✅ 本地資料庫夠新（{age_hours:.1f} 小時前檢查），無需同步")
             return False
             
     except Exception as e:
@@ -102,23 +397,32 @@ def auto_sync_if_needed(max_age_hours=1):
         return False
 
 
-def download_latest_daily_deals_db(github_username="yolok9453", repo_name="crawls-web", branch="master"):
+def download_latest_daily_deals_db(github_username="yolok9453", repo_name="crawls-web", branch="master",
+                                   local_db_path=None):
     """
     下載 GitHub 上的資料庫檔案到暫存並回傳暫存檔路徑（只用於擷取 daily_deals）。
-    返回暫存檔路徑或 None（失敗）。
+    返回暫存檔路徑或 None（遠端未變更或失敗）。
+    同步成功後需呼叫 sync_daily_deals_from_remote_db 才會記錄為已套用的版本。
     """
     try:
-        db_url = f"https://raw.githubusercontent.com/{github_username}/{repo_name}/{branch}/data/crawler_data.db"
+        db_url = get_remote_db_url(github_username, repo_name, branch)
+        local_db_path = local_db_path or _default_local_db_path()
         print(f"🔄 正在從 GitHub 下載資料庫（僅用於 daily_deals）: {db_url}")
 
-        response = requests.get(db_url, timeout=30)
-        response.raise_for_status()
+        response = _conditional_get(db_url, local_db_path, CHANNEL_DAILY_DEALS)
+        if response is None:
+            return None
 
         fd, tmp_path = tempfile.mkstemp(prefix="crawler_data_", suffix=".db")
         os.close(fd)
-        with open(tmp_path, 'wb') as f:
-            f.write(response.content)
+        try:
+            size, sha256 = _stream_to_file(response, tmp_path)
+            _check_integrity(tmp_path)
+        except Exception:
+            _remove_database_file(tmp_path)
+            raise
 
+        _pending_daily_deals_download[tmp_path] = _validators(db_url, response, size, sha256)
         print(f"✅ 下載完成，暫存檔: {tmp_path}")
         return tmp_path
     except requests.exceptions.RequestException as e:
@@ -129,11 +433,16 @@ def download_latest_daily_deals_db(github_username="yolok9453", repo_name="crawl
         return None
 
 
+# 已下載但尚未套用的暫存檔 → 驗證資訊，同步成功後才記錄為已套用的版本
+_pending_daily_deals_download = {}
+
+
 def sync_daily_deals_from_remote_db(remote_db_path, local_db_path=None, backup=True):
     """
     將遠端資料庫的 daily_deals 表同步到本地資料庫。
     - 會備份本地資料庫檔案（若 backup=True 且檔案存在）
-    - 同步策略：刪除 local.daily_deals 全部內容，然後從 remote.daily_deals 匯入（簡潔且可保證一致性）
+    - 同步策略：以 URL 為鍵增量合併（只更新變動的列，遠端已不存在的商品標記為過期），
+      所有變更在一個短交易內完成，讀取端不會看到空表
     返回 True/False
     """
     try:
@@ -141,42 +450,48 @@ def sync_daily_deals_from_remote_db(remote_db_path, local_db_path=None, backup=T
             project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
             local_db_path = os.path.join(project_root, 'data', 'crawler_data.db')
 
+        pending = _pending_daily_deals_download.pop(remote_db_path, None)
+
         if not os.path.exists(remote_db_path):
             print(f"❌ 遠端暫存檔不存在: {remote_db_path}")
             return False
 
-        # 備份本地資料庫
-        if backup and os.path.exists(local_db_path):
-            backup_db_path = os.path.join(os.path.dirname(local_db_path), f'crawler_data_daily_deals_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.db')
-            shutil.copy2(local_db_path, backup_db_path)
-            print(f"💾 已備份本地資料庫到: {backup_db_path}")
+        # 先在寫入交易之外讀出遠端的 daily_deals
+        remote_deals = load_daily_deals_from_file(remote_db_path)
+        if remote_deals is None:
+            print("❌ 遠端資料庫中沒有 daily_deals 表，取消同步")
+            return False
 
-        # 使用 sqlite3 attach 方式進行同步
-        conn = sqlite3.connect(local_db_path)
-        cursor = conn.cursor()
+        live = _is_live_database(local_db_path)
 
-        cursor.execute("ATTACH DATABASE ? AS remote_db", (remote_db_path,))
+        # 備份本地資料庫
+        if backup and os.path.exists(local_db_path):
+            create_backup(label='pre-daily-deals-sync', db_path=local_db_path)
 
-        # 檢查 remote 是否有 daily_deals
-        cursor.execute("SELECT name FROM remote_db.sqlite_master WHERE type='table' AND name='daily_deals'")
-        if cursor.fetchone() is None:
-            print("❌ 遠端資料庫中沒有 daily_deals 表，取消同步")
-            cursor.execute("DETACH DATABASE remote_db")
-            conn.close()
-            return False
+        def merge_remote(conn):
+            # 確保本地資料表具備增量合併所需的欄位
+            update_database_schema(conn.cursor())
+            # 增量合併：以 URL 為鍵 UPSERT，遠端已不存在的商品標記為過期
+            return merge_all_daily_deals(conn, remote_deals)
 
-        # 執行替換：先刪除 local 的 daily_deals，再從 remote 匯入
-        cursor.execute("BEGIN")
-        cursor.execute("DELETE FROM daily_deals")
-        cursor.execute(
-            "INSERT OR IGNORE INTO daily_deals (platform, title, price, url, image_url, crawl_time) SELECT platform, title, price, url, image_url, crawl_time FROM remote_db.daily_deals"
-        )
-        conn.commit()
+        if live:
+            counts = get_db_writer().execute(merge_remote)
+            # 新增與標題變動的促銷在背景建立索引
+            from core.minhash import get_title_indexer
+            get_title_indexer().notify()
+        else:
+            conn = sqlite3.connect(local_db_path)
+            try:
+                counts = merge_remote(conn)
+                conn.commit()
+            finally:
+                conn.close()
 
-        cursor.execute("DETACH DATABASE remote_db")
-        conn.close()
+        if pending is not None:
+            _record_applied(local_db_path, [CHANNEL_DAILY_DEALS], pending)
 
-        print("✅ daily_deals 同步完成")
+        print(f"✅ daily_deals 同步完成：新增 {counts['inserted']}、更新 {counts['updated']}、"
+              f"過期 {counts['expired']}、未變動 {counts['unchanged']}")
         return True
     except Exception as e:
         print(f"❌ daily_deals 同步失敗: {e}")
@@ -189,8 +504,19 @@ def auto_sync_daily_deals_if_needed(max_age_hours=1):
     """
     檢查 local daily_deals 最新的 crawl_time（若存在），或資料庫檔案最後修改時間，
     如果超過 max_age_hours，則從 GitHub 下載並同步 daily_deals。
+    設定 DAILY_DEALS_DELTA_URL 時每次都改取列級變更集（只傳輸變動的列）。
     返回 True 如果執行了同步，False 則表示不需要或失敗。
     """
+    delta_url = os.environ.get('DAILY_DEALS_DELTA_URL')
+    if delta_url:
+        try:
+            from core.delta_sync import pull_changes
+            pull_changes(delta_url)
+            return True
+        except Exception as e:
+            print(f"❌ daily_deals 增量同步失敗: {e}")
+            return False
+
     try:
         project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         local_db_path = os.path.join(project_root, 'data', 'crawler_data.db')
@@ -0,0 +1,219 @@
+"""
+Gemini 呼叫的共用閘道與磁碟快取
+商品過濾與商品比較都透過這裡呼叫 generate_content，完全相同的提示詞不會重複呼叫模型：
+
+- 快取鍵為「模型名稱 + 生成設定 + 提示詞」的 SHA-256（提示詞先合併連續空白，縮排不同不影響命中）
+- 每個回應存成與資料庫同目錄下 llm_cache/ 中的一個 JSON 檔，程式重啟後仍然有效
+- 超過 LLM_CACHE_TTL_HOURS 的回應視為過期；總大小超過 LLM_CACHE_MAX_BYTES 時淘汰最久未使用的回應
+- 呼叫端可以提供 validate，回應無法解析（例如被截斷）時不寫入快取，重試時才會真的重新呼叫模型
+- 每次呼叫（包含命中快取與失敗）都以 feature 記錄到 core.llm_metrics
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Optional
+
+import core.database as database
+from core.llm_metrics import STATUS_ERROR, STATUS_OK, STATUS_PARSE_ERROR, get_llm_metrics
+
+# 快取目錄名稱（與資料庫檔案放在同一個目錄下）
+LLM_CACHE_DIRNAME = 'llm_cache'
+
+# 回應的有效時間與快取總大小上限
+LLM_CACHE_TTL_HOURS = 72
+LLM_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def get_llm_cache_dir(db_path: str = None) -> str:
+    """LLM 回應快取目錄（跟隨資料庫位置）"""
+    return os.path.join(os.path.dirname(db_path or database.DB_PATH), LLM_CACHE_DIRNAME)
+
+
+def get_model_name(model) -> str:
+    """模型名稱（google.generativeai 的 GenerativeModel 為 'models/gemini-…'）"""
+    return getattr(model, 'model_name', None) or type(model).__name__
+
+
+def _cached_response(text: str) -> SimpleNamespace:
+    """與 generate_content 回應相容的物件（命中快取沒有消耗 token）"""
+    return SimpleNamespace(text=text, usage_metadata=SimpleNamespace(total_token_count=0), cached=True)
+
+
+class LLMGateway:
+    """共用的 generate_content 入口，附帶磁碟 LRU 快取"""
+
+    def __init__(self, cache_dir: str = None, ttl_hours: float = LLM_CACHE_TTL_HOURS,
+                 max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir or get_llm_cache_dir()
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, int]' = OrderedDict()   # 快取鍵 -> 檔案大小，依最近使用排序
+        self._total_bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'expired': 0, 'rejected': 0}
+        self._load_index()
+
+    def _load_index(self):
+        """掃描快取目錄，依檔案修改時間（命中時會更新）重建 LRU 順序"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith('.json'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[:-5], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + '.json')
+
+    @staticmethod
+    def cache_key(model_name: str, prompt: str, generation_config: Optional[Dict[str, Any]] = None) -> str:
+        normalized_prompt = _WHITESPACE_PATTERN.sub(' ', prompt).strip()
+        payload = json.dumps([model_name, generation_config or {}, normalized_prompt],
+                             ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _remove(self, key: str):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _lookup(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            try:
+                with open(self._path(key), 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                self._remove(key)
+                return None
+            if time.time() - entry['created_at'] > self.ttl_seconds:
+                self._remove(key)
+                self.stats['expired'] += 1
+                return None
+            self._entries.move_to_end(key)
+            try:
+                os.utime(self._path(key))
+            except OSError:
+                pass
+            return entry['text']
+
+    def _store(self, key: str, model_name: str, text: str, token_count: int):
+        data = json.dumps({
+            'model': model_name, 'created_at': time.time(), 'text': text, 'token_count': token_count
+        }, ensure_ascii=False).encode('utf-8')
+        with self._lock:
+            path = self._path(key)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            self.stats['stores'] += 1
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.stats['evictions'] += 1
+
+    def generate_content(self, model, prompt: str, generation_config: Optional[Dict[str, Any]] = None,
+                         validate: Optional[Callable[[str], bool]] = None,
+                         feature: str = 'unknown', attempt: int = 0):
+        """
+        呼叫 model.generate_content；相同模型、設定與提示詞的回應直接取自快取
+
+        Args:
+            model: Gemini 模型（GenerativeModel）
+            prompt: 提示詞
+            generation_config: 生成設定（也納入快取鍵）
+            validate: 判斷回應文字是否可用；返回 False 時不寫入快取（並記錄為解析失敗）
+            feature: 呼叫的功能名稱（用於指標）
+            attempt: 第幾次嘗試（0 為第一次，用於指標）
+
+        Returns:
+            模型回應；命中快取時為具有 text、usage_metadata 與 cached 屬性的物件
+        """
+        metrics = get_llm_metrics()
+        model_name = get_model_name(model)
+        key = self.cache_key(model_name, prompt, generation_config)
+        cached_text = self._lookup(key)
+        if cached_text is not None:
+            self.stats['hits'] += 1
+            metrics.record(feature, model_name, attempt=attempt, cached=True)
+            return _cached_response(cached_text)
+
+        self.stats['misses'] += 1
+        start = time.perf_counter()
+        try:
+            if generation_config:
+                response = model.generate_content(prompt, generation_config=generation_config)
+            else:
+                response = model.generate_content(prompt)
+            text = response.text
+        except Exception:
+            metrics.record(feature, model_name, latency_ms=(time.perf_counter() - start) * 1000,
+                           status=STATUS_ERROR, attempt=attempt)
+            raise
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        usage = getattr(response, 'usage_metadata', None)
+        prompt_tokens = getattr(usage, 'prompt_token_count', 0) or 0
+        output_tokens = getattr(usage, 'candidates_token_count', 0) or 0
+        valid = validate is None or validate(text)
+        metrics.record(feature, model_name, prompt_tokens, output_tokens, latency_ms,
+                       STATUS_OK if valid else STATUS_PARSE_ERROR, attempt)
+        if not valid:
+            self.stats['rejected'] += 1
+            return response
+
+        self._store(key, model_name, text, getattr(usage, 'total_token_count', 0) or 0)
+        return response
+
+    def clear(self) -> int:
+        """清除所有快取的回應，返回清除的數量"""
+        with self._lock:
+            keys = list(self._entries)
+            for key in keys:
+                self._remove(key)
+        return len(keys)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                'entries': len(self._entries),
+                'total_bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_hours': self.ttl_seconds / 3600,
+                'cache_dir': self.cache_dir,
+            }
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway() -> LLMGateway:
+    """取得全域共用的 LLM 閘道"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway()
+        return _gateway
@@ -0,0 +1,196 @@
+"""
+Gemini 呼叫的用量與延遲指標
+每次經過 LLM 閘道的呼叫（包含命中快取、失敗與重試）都記錄一筆：
+
+- 呼叫的功能（product_filter / compare / deal_matches …）、模型、輸入與輸出 token、延遲、狀態與第幾次嘗試
+- 記憶體中保留最近 ROLLING_WINDOW_SECONDS 內的紀錄，查詢時彙總成各功能的次數、token、估計費用、
+  延遲百分位數與直方圖
+- 每筆紀錄同時以精簡的 JSON Lines 附加到資料庫同目錄下的 llm_calls.jsonl（超過大小上限時輪替）
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+import core.database as database
+
+# 記憶體中保留的時間範圍與最多筆數
+ROLLING_WINDOW_SECONDS = 3600
+MAX_RECORDS = 10000
+
+# 本地紀錄檔名稱與輪替大小（輪替時保留一份 .1）
+LLM_CALL_LOG_FILENAME = 'llm_calls.jsonl'
+LLM_CALL_LOG_MAX_BYTES = 10 * 1024 * 1024
+
+# 直方圖的上界（最後一格為超過最大上界的呼叫）
+LATENCY_BUCKETS_MS = (250, 500, 1000, 2000, 5000, 10000, 20000, 40000)
+TOKEN_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+# 估計費用用的每百萬 token 價格（美元，輸入 / 輸出）；未列出的模型不估計
+MODEL_PRICING_PER_MILLION = {
+    'gemini-2.5-flash': (0.30, 2.50),
+    'gemini-1.5-flash': (0.075, 0.30),
+}
+
+# 紀錄的狀態
+STATUS_OK = 'ok'
+STATUS_ERROR = 'error'
+STATUS_PARSE_ERROR = 'parse_error'
+
+PERCENTILES = (50, 90, 99)
+
+
+def get_llm_call_log_path(db_path: str = None) -> str:
+    """LLM 呼叫紀錄檔路徑（跟隨資料庫位置）"""
+    return os.path.join(os.path.dirname(db_path or database.DB_PATH), LLM_CALL_LOG_FILENAME)
+
+
+def estimate_cost(model_name: str, prompt_tokens: int, output_tokens: int) -> Optional[float]:
+    """依 MODEL_PRICING_PER_MILLION 估計一次呼叫的費用（美元）"""
+    pricing = MODEL_PRICING_PER_MILLION.get(model_name.split('/')[-1])
+    if pricing is None:
+        return None
+    return (prompt_tokens * pricing[0] + output_tokens * pricing[1]) / 1_000_000
+
+
+def _percentile(sorted_values: List[float], pct: int) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _histogram(values: List[float], bounds) -> List[Dict]:
+    counts = [0] * (len(bounds) + 1)
+    for value in values:
+        for i, bound in enumerate(bounds):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    buckets = [{'le': bound, 'count': count} for bound, count in zip(bounds, counts)]
+    buckets.append({'le': None, 'count': counts[-1]})
+    return buckets
+
+
+class LLMMetrics:
+    """記錄並彙總 LLM 呼叫"""
+
+    def __init__(self, log_path: str = None, window_seconds: float = ROLLING_WINDOW_SECONDS,
+                 max_records: int = MAX_RECORDS):
+        self.log_path = log_path or get_llm_call_log_path()
+        self.window_seconds = window_seconds
+        self._records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+
+    def record(self, feature: str, model_name: str, prompt_tokens: int = 0, output_tokens: int = 0,
+               latency_ms: float = 0.0, status: str = STATUS_OK, attempt: int = 0, cached: bool = False):
+        """
+        記錄一次呼叫
+
+        Args:
+            feature: 呼叫的功能
+            attempt: 第幾次嘗試（0 為第一次，大於 0 為重試）
+            cached: 是否命中 LLM 回應快取（沒有實際呼叫模型）
+        """
+        entry = {
+            'ts': round(time.time(), 3),
+            'f': feature,
+            'm': model_name,
+            'pt': int(prompt_tokens or 0),
+            'ot': int(output_tokens or 0),
+            'ms': round(latency_ms, 1),
+            'st': status,
+            'r': attempt,
+            'c': int(cached),
+        }
+        with self._lock:
+            self._records.append(entry)
+        self._append_log(entry)
+
+    def _append_log(self, entry: Dict):
+        """附加到本地紀錄檔（寫入失敗不影響呼叫本身）"""
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n'
+        with self._log_lock:
+            try:
+                if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > LLM_CALL_LOG_MAX_BYTES:
+                    os.replace(self.log_path, self.log_path + '.1')
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+            except OSError as e:
+                print(f"⚠️ 無法寫入 LLM 呼叫紀錄: {e}")
+
+    def _summarize(self, records: List[Dict]) -> Dict:
+        calls = [r for r in records if not r['c']]
+        latencies = sorted(r['ms'] for r in calls)
+        prompt_tokens = sum(r['pt'] for r in calls)
+        output_tokens = sum(r['ot'] for r in calls)
+
+        cost = 0.0
+        cost_known = False
+        for r in calls:
+            call_cost = estimate_cost(r['m'], r['pt'], r['ot'])
+            if call_cost is not None:
+                cost += call_cost
+                cost_known = True
+
+        return {
+            'requests': len(records),
+            'model_calls': len(calls),
+            'cache_hits': len(records) - len(calls),
+            'retries': sum(1 for r in records if r['r'] > 0),
+            'errors': sum(1 for r in calls if r['st'] == STATUS_ERROR),
+            'parse_failures': sum(1 for r in calls if r['st'] == STATUS_PARSE_ERROR),
+            'prompt_tokens': prompt_tokens,
+            'output_tokens': output_tokens,
+            'estimated_cost_usd': round(cost, 6) if cost_known else None,
+            'latency_ms': {f'p{pct}': _percentile(latencies, pct) for pct in PERCENTILES},
+            'latency_histogram_ms': _histogram(latencies, LATENCY_BUCKETS_MS),
+            'prompt_token_histogram': _histogram([r['pt'] for r in calls], TOKEN_BUCKETS),
+        }
+
+    def snapshot(self, window_seconds: float = None, feature: str = None) -> Dict:
+        """
+        彙總時間範圍內的紀錄
+
+        Args:
+            window_seconds: 彙總範圍（預設與上限皆為 ROLLING_WINDOW_SECONDS）
+            feature: 只彙總指定功能
+
+        Returns:
+            Dict: overall 與 by_feature 的彙總結果
+        """
+        window = min(window_seconds or self.window_seconds, self.window_seconds)
+        since = time.time() - window
+        with self._lock:
+            while self._records and self._records[0]['ts'] < time.time() - self.window_seconds:
+                self._records.popleft()
+            records = [r for r in self._records if r['ts'] >= since and (feature is None or r['f'] == feature)]
+
+        by_feature: Dict[str, List[Dict]] = {}
+        for r in records:
+            by_feature.setdefault(r['f'], []).append(r)
+        return {
+            'window_seconds': window,
+            'overall': self._summarize(records),
+            'by_feature': {name: self._summarize(items) for name, items in sorted(by_feature.items())},
+            'log_path': self.log_path,
+        }
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_llm_metrics() -> LLMMetrics:
+    """取得全域共用的 LLM 呼叫指標"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = LLMMetrics()
+        return _metrics
@@ -0,0 +1,273 @@
+"""
+資料庫背景維護排程
+取代在 HTTP 請求中同步執行的 VACUUM / REINDEX / ANALYZE：
+
+- 新資料庫建立時即為 auto_vacuum=INCREMENTAL，之後以 incremental_vacuum 分小步回收空頁
+- 既有的 auto_vacuum=NONE 資料庫需要一次完整 VACUUM 才能切換，這會暫停所有寫入，
+  所以不會自動執行，只能以 enable_incremental_auto_vacuum()（/api/database/maintenance/auto-vacuum）明確要求
+- 定期執行 PRAGMA optimize（限制 analysis_limit）與 wal_checkpoint(PASSIVE)
+- 只在寫入執行緒閒置時動作，每一步都是獨立的短寫入工作，有新寫入排隊就讓出
+- 記錄 freelist、碎片比例、WAL 大小等指標供狀態 API 查詢
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+import core.database as database
+from core.db_writer import get_db_writer
+
+# auto_vacuum 模式代碼
+AUTO_VACUUM_MODES = {0: 'NONE', 1: 'FULL', 2: 'INCREMENTAL'}
+
+# 排程參數
+CHECK_INTERVAL_SECONDS = 60       # 多久檢查一次是否需要維護
+IDLE_THRESHOLD_SECONDS = 30       # 寫入執行緒閒置多久才開始維護
+CYCLE_BUDGET_SECONDS = 2.0        # 每次維護最多花費的時間
+VACUUM_PAGES_PER_STEP = 256       # 每一步 incremental_vacuum 回收的頁數
+OPTIMIZE_INTERVAL_SECONDS = 3600  # PRAGMA optimize 的最短間隔
+CHECKPOINT_INTERVAL_SECONDS = 300 # wal_checkpoint 的最短間隔
+ANALYSIS_LIMIT = 400              # PRAGMA optimize 分析每個索引時掃描的列數上限
+
+
+def collect_metrics(db_path: str = None) -> Dict:
+    """讀取資料庫的頁面、freelist 與 WAL 指標"""
+    db_path = db_path or database.DB_PATH
+    conn = sqlite3.connect(db_path)
+    try:
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+        freelist_count = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+    finally:
+        conn.close()
+
+    wal_path = db_path + '-wal'
+    return {
+        'page_size': page_size,
+        'page_count': page_count,
+        'freelist_count': freelist_count,
+        'fragmentation': round(freelist_count / page_count, 4) if page_count else 0,
+        'reclaimable_bytes': freelist_count * page_size,
+        'db_size': os.path.getsize(db_path) if os.path.exists(db_path) else 0,
+        'wal_size': os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+        'auto_vacuum': AUTO_VACUUM_MODES.get(auto_vacuum, str(auto_vacuum)),
+        'journal_mode': journal_mode,
+    }
+
+
+def _enable_incremental_auto_vacuum(db_path: str):
+    """把既有資料庫切換為 INCREMENTAL（需要一次完整 VACUUM 才會生效）"""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+
+
+def _incremental_vacuum_step(conn, pages: int) -> int:
+    """寫入工作：回收最多 pages 個空頁，返回剩餘的 freelist 頁數"""
+    # sqlite3 模組對不回傳欄位的 PRAGMA 只會 step 一次（每次只回收一頁），因此逐頁執行
+    remaining = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    for _ in range(min(int(pages), remaining)):
+        conn.execute('PRAGMA incremental_vacuum(1)')
+    return conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+def _optimize_step(conn):
+    """寫入工作：以有限的掃描量更新查詢規劃統計"""
+    conn.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+    conn.execute('PRAGMA optimize').fetchall()
+
+
+def _checkpoint(db_path: str) -> Dict:
+    """PASSIVE checkpoint：不等待讀寫，只把目前可以寫回的 WAL 內容寫回主檔案"""
+    conn = sqlite3.connect(db_path)
+    try:
+        busy, log_frames, checkpointed = conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+    finally:
+        conn.close()
+    return {'busy': busy, 'log_frames': log_frames, 'checkpointed_frames': checkpointed}
+
+
+class MaintenanceScheduler:
+    """在寫入閒置時以小步驟執行資料庫維護的背景執行緒"""
+
+    def __init__(self, check_interval: float = CHECK_INTERVAL_SECONDS,
+                 idle_threshold: float = IDLE_THRESHOLD_SECONDS,
+                 cycle_budget: float = CYCLE_BUDGET_SECONDS,
+                 vacuum_pages: int = VACUUM_PAGES_PER_STEP):
+        self.check_interval = check_interval
+        self.idle_threshold = idle_threshold
+        self.cycle_budget = cycle_budget
+        self.vacuum_pages = vacuum_pages
+        self._thread = None
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._force = False
+        self._running_cycle = False
+        self._last_optimize = 0.0
+        self._last_checkpoint = 0.0
+        self.last_run: Optional[Dict] = None
+        self.last_error: Optional[str] = None
+        self.cycles = 0
+
+    def start(self):
+        """啟動背景執行緒（重複呼叫不會建立多個執行緒）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='db-maintenance', daemon=True)
+        self._thread.start()
+        print("🧹 資料庫維護排程已啟動")
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def trigger(self):
+        """要求儘快執行一次維護（不等待寫入閒置門檻，但仍會在有寫入排隊時讓出）"""
+        self._force = True
+        self._wakeup.set()
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+
+    def enable_incremental_auto_vacuum(self) -> Dict:
+        """
+        把既有資料庫切換為 auto_vacuum=INCREMENTAL（一次性的完整 VACUUM）
+
+        VACUUM 期間寫入執行緒會暫停處理其他寫入，應在離峰時明確呼叫，維護排程不會自動執行。
+
+        Returns:
+            Dict: converted（是否執行了 VACUUM）、耗時與前後指標
+        """
+        db_path = database.DB_PATH
+        before = collect_metrics(db_path)
+        if before['auto_vacuum'] == 'INCREMENTAL':
+            return {'converted': False, 'duration': 0.0, 'before': before, 'after': before}
+
+        start = time.monotonic()
+        self._running_cycle = True
+        try:
+            get_db_writer().run_exclusive(_enable_incremental_auto_vacuum, db_path)
+        finally:
+            self._running_cycle = False
+        duration = round(time.monotonic() - start, 3)
+        after = collect_metrics(db_path)
+        print(f"🧹 已切換為 auto_vacuum=INCREMENTAL（VACUUM 耗時 {duration:.2f} 秒，"
+              f"{before['db_size'] / 1024:.0f} KB → {after['db_size'] / 1024:.0f} KB）")
+        return {'converted': True, 'duration': duration, 'before': before, 'after': after}
+
+    def get_status(self) -> Dict:
+        """維護排程狀態與目前的資料庫指標"""
+        try:
+            metrics = collect_metrics()
+        except Exception as e:
+            metrics = {'error': str(e)}
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'maintenance_in_progress': self._running_cycle,
+            # auto_vacuum 不是 INCREMENTAL 時只會 checkpoint / optimize，需要明確切換才會回收空頁
+            'auto_vacuum_conversion_required': metrics.get('auto_vacuum') not in (None, 'INCREMENTAL'),
+            'pending_trigger': self._force,
+            'cycles': self.cycles,
+            'idle_threshold_seconds': self.idle_threshold,
+            'writer_idle_seconds': round(get_db_writer().idle_seconds(), 1),
+            'metrics': metrics,
+            'last_run': self.last_run,
+            'last_error': self.last_error,
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.check_interval)
+            self._wakeup.clear()
+            if self._stop.is_set():
+                break
+
+            force = self._force
+            if not force and get_db_writer().idle_seconds() < self.idle_threshold:
+                continue
+            self._force = False
+            try:
+                self.run_cycle(force=force)
+            except Exception as e:
+                self.last_error = f'{datetime.now().isoformat()} {e}'
+                print(f"⚠️ 資料庫維護失敗: {e}")
+
+    def run_cycle(self, force: bool = False) -> Dict:
+        """
+        執行一次有時間上限的維護
+
+        Returns:
+            Dict: 本次執行的步驟、前後指標與耗時
+        """
+        writer = get_db_writer()
+        db_path = database.DB_PATH
+        start = time.monotonic()
+        deadline = start + self.cycle_budget
+        steps = []
+        self._running_cycle = True
+        try:
+            before = collect_metrics(db_path)
+
+            # 分小步回收空頁；有其他寫入排隊或超過時間預算就停下，下次再繼續
+            # （auto_vacuum 不是 INCREMENTAL 時 incremental_vacuum 沒有作用，直接略過）
+            remaining = before['freelist_count'] if before['auto_vacuum'] == 'INCREMENTAL' else 0
+            vacuum_steps = 0
+            while remaining > 0 and time.monotonic() < deadline and writer.get_status()['queued'] == 0:
+                remaining = writer.execute(_incremental_vacuum_step, self.vacuum_pages)
+                vacuum_steps += 1
+            if vacuum_steps:
+                steps.append(f'incremental_vacuum x{vacuum_steps}')
+
+            now = time.monotonic()
+            if (force or now - self._last_optimize >= OPTIMIZE_INTERVAL_SECONDS) and now < deadline:
+                writer.execute(_optimize_step)
+                self._last_optimize = time.monotonic()
+                steps.append('optimize')
+
+            checkpoint = None
+            if force or now - self._last_checkpoint >= CHECKPOINT_INTERVAL_SECONDS:
+                checkpoint = _checkpoint(db_path)
+                self._last_checkpoint = time.monotonic()
+                steps.append('wal_checkpoint')
+
+            after = collect_metrics(db_path)
+        finally:
+            self._running_cycle = False
+
+        self.cycles += 1
+        self.last_run = {
+            'finished_at': datetime.now().isoformat(),
+            'forced': force,
+            'steps': steps,
+            'duration': round(time.monotonic() - start, 3),
+            'freelist_before': before['freelist_count'],
+            'freelist_after': after['freelist_count'],
+            'db_size_before': before['db_size'],
+            'db_size_after': after['db_size'],
+            'checkpoint': checkpoint,
+        }
+        if steps:
+            print(f"🧹 資料庫維護完成: {', '.join(steps)}（freelist {before['freelist_count']} → "
+                  f"{after['freelist_count']}，耗時 {self.last_run['duration']:.2f} 秒）")
+        return self.last_run
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_maintenance_scheduler() -> MaintenanceScheduler:
+    """取得全域共用的維護排程"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = MaintenanceScheduler()
+        return _scheduler
@@ -0,0 +1,545 @@
+"""
+商品標題的 MinHash / LSH 近似重複索引
+不需要即時爬取與模型呼叫，就能從自己的歷史資料中找出其他平台的同款商品：
+
+- 商品（products）與每日促銷（daily_deals）標題的 MinHash 簽章切成 NUM_BANDS 個 band，
+  每個 band 雜湊成一個 bucket 存入 title_lsh_buckets
+- find_similar 只查詢共用 bucket 的候選，再以 n-gram Jaccard 精確排序
+
+簽章的每個值取自 shake_128 延伸輸出（每個 n-gram 一次雜湊即得到全部 NUM_PERM 個值），
+並固定為 little-endian，不同機器（例如 GitHub 同步來的資料庫）算出的 bucket 一致。
+有 NumPy 時 title_buckets_batch 以整批標題的 n-gram 表一次取最小值（結果與逐筆計算相同）。
+
+爬蟲寫入的商品不在寫入交易中建立索引：TitleIndexer 背景執行緒依 title_index_state 的水位線
+（每個來源已建立索引的最大 ID）分批讀取新商品，在寫入執行緒之外算好 bucket，
+再以短的寫入工作直接插入（新 ID 不需要先刪除）。沒有水位線或版本不同的資料庫（升級或 GitHub 同步而來）
+會由同一個背景執行緒從頭補建一次，不在 init_db 中執行。
+daily_deals 的標題會在合併時就地更新：同一個執行緒也依 modified_mark（已處理的最後 updated_at）
+重新索引水位線以內、內容有變動的促銷，合併與增量同步的寫入交易都不計算簽章。
+"""
+
+import argparse
+import hashlib
+import sqlite3
+import sys
+import threading
+from array import array
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from core.database import read_snapshot
+from core.db_writer import get_db_writer
+from core.ranking import char_ngrams
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 簽章長度與 LSH 分段：16 個 band × 4 列，Jaccard 約 0.5 以上的標題有高機率共用 bucket
+NUM_PERM = 64
+NUM_BANDS = 16
+ROWS_PER_BAND = NUM_PERM // NUM_BANDS
+
+# 查詢時最多取出的 LSH 候選數與預設的最低相似度
+MAX_LSH_CANDIDATES = 200
+DEFAULT_MIN_SIMILARITY = 0.3
+
+# 索引格式版本（簽章或 bucket 的計算方式改變時遞增，既有索引會在背景重建）
+TITLE_INDEX_VERSION = 1
+
+# 背景建立索引時每批處理的商品數，以及沒有新寫入通知時的檢查間隔（秒）
+INDEX_BATCH_SIZE = 2000
+INDEX_POLL_SECONDS = 300
+
+# 批次計算簽章時每次處理的標題數（限制 n-gram 雜湊表展開後的記憶體用量）
+SIGNATURE_CHUNK_SIZE = 2048
+
+SOURCE_PRODUCTS = 'products'
+SOURCE_DAILY_DEALS = 'daily_deals'
+# 比較快取的目標商品（item_id 為 product_comparison_cache.id，只用來找出需要失效的快取，不會被 find_similar 查詢）
+SOURCE_COMPARISON_CACHE = 'comparison_cache'
+
+# 各來源回傳給呼叫端的欄位
+_SOURCE_QUERIES = {
+    SOURCE_PRODUCTS: """
+        SELECT id, platform, title, price, url, image_url FROM products WHERE id IN ({placeholders})
+    """,
+    SOURCE_DAILY_DEALS: """
+        SELECT id, platform, title, price, original_price, discount_percent, url, image_url
+        FROM daily_deals WHERE is_expired = 0 AND id IN ({placeholders})
+    """,
+}
+
+
+def _shingles(title: str) -> set:
+    return set(char_ngrams(title))
+
+
+def minhash_signature(title: str) -> Optional[array]:
+    """
+    計算標題的 MinHash 簽章
+
+    Returns:
+        array: NUM_PERM 個 32 位元值；標題沒有任何 n-gram 時返回 None
+    """
+    hashes = []
+    for shingle in _shingles(title):
+        values = array('I', hashlib.shake_128(shingle.encode('utf-8')).digest(NUM_PERM * 4))
+        if sys.byteorder == 'big':
+            values.byteswap()
+        hashes.append(values)
+    if not hashes:
+        return None
+    return array('I', map(min, zip(*hashes)))
+
+
+def lsh_buckets(signature: array) -> List[int]:
+    """將簽章切成 band，每個 band 雜湊成一個有號 64 位元 bucket（band 編號也納入雜湊）"""
+    buckets = []
+    for band in range(NUM_BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        if sys.byteorder == 'big':
+            rows = array('I', rows)
+            rows.byteswap()
+        digest = hashlib.blake2b(band.to_bytes(2, 'little') + rows.tobytes(), digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, 'little', signed=True))
+    return buckets
+
+
+def title_buckets(title: str) -> List[int]:
+    """標題的 LSH bucket 列表（沒有 n-gram 的標題返回空列表）"""
+    signature = minhash_signature(title)
+    return lsh_buckets(signature) if signature is not None else []
+
+
+def _band_buckets(signature_bytes: bytes) -> List[int]:
+    """little-endian 簽章位元組的各 band bucket（與 lsh_buckets 相同的雜湊）"""
+    band_size = ROWS_PER_BAND * 4
+    return [
+        int.from_bytes(hashlib.blake2b(
+            band.to_bytes(2, 'little') + signature_bytes[band * band_size:(band + 1) * band_size],
+            digest_size=8
+        ).digest(), 'little', signed=True)
+        for band in range(NUM_BANDS)
+    ]
+
+
+def title_buckets_batch(titles: Sequence[str]) -> List[List[int]]:
+    """
+    一次計算多個標題的 LSH bucket（結果與逐筆呼叫 title_buckets 相同）
+
+    每個不同的 n-gram 只雜湊一次，簽章以 NumPy 的 minimum.reduceat 對整批標題一次取最小值；
+    沒有 NumPy 時退回逐筆計算。
+    """
+    if np is None:
+        return [title_buckets(title) for title in titles]
+
+    results = []
+    for offset in range(0, len(titles), SIGNATURE_CHUNK_SIZE):
+        chunk = titles[offset:offset + SIGNATURE_CHUNK_SIZE]
+        shingle_sets = [_shingles(title) for title in chunk]
+        vocabulary = {shingle: i for i, shingle in enumerate(set().union(*shingle_sets))}
+        positions = []
+        for shingles in shingle_sets:
+            positions.extend(map(vocabulary.__getitem__, shingles))
+        lengths = [len(shingles) for shingles in shingle_sets]
+        if not vocabulary:
+            results.extend([] for _ in chunk)
+            continue
+
+        digests = b''.join(hashlib.shake_128(shingle.encode('utf-8')).digest(NUM_PERM * 4)
+                           for shingle in vocabulary)
+        table = np.frombuffer(digests, dtype='<u4').reshape(len(vocabulary), NUM_PERM)
+        lengths = np.asarray(lengths)
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        nonempty = lengths > 0
+        signatures = np.minimum.reduceat(table[np.asarray(positions)], starts[nonempty], axis=0)
+        signature_bytes = signatures.astype('<u4', copy=False).tobytes()
+
+        row_size = NUM_PERM * 4
+        row = 0
+        for has_shingles in nonempty:
+            if has_shingles:
+                results.append(_band_buckets(signature_bytes[row * row_size:(row + 1) * row_size]))
+                row += 1
+            else:
+                results.append([])
+    return results
+
+
+def delete_from_index(cursor, source: str, item_ids: Sequence[int]):
+    """從索引中移除指定的商品"""
+    for offset in range(0, len(item_ids), 500):
+        chunk = list(item_ids[offset:offset + 500])
+        cursor.execute(
+            f"DELETE FROM title_lsh_buckets WHERE source = ? AND item_id IN ({','.join('?' * len(chunk))})",
+            [source, *chunk]
+        )
+
+
+def delete_session_titles(cursor, session_ids: Sequence[int]):
+    """刪除任務的商品前，先移除這些商品的索引（在同一交易中呼叫）"""
+    placeholders = ','.join('?' * len(session_ids))
+    cursor.execute(
+        f"""
+        DELETE FROM title_lsh_buckets
+        WHERE source = ? AND item_id IN (SELECT id FROM products WHERE session_id IN ({placeholders}))
+        """,
+        [SOURCE_PRODUCTS, *session_ids]
+    )
+
+
+def index_buckets(cursor, source: str, items: Iterable[Tuple[int, List[int]]]) -> int:
+    """
+    寫入（或覆蓋）已計算好 bucket 的商品索引
+
+    Args:
+        items: (商品 ID, title_buckets 的結果)
+
+    Returns:
+        int: 寫入索引的商品數
+    """
+    items = list(items)
+    if not items:
+        return 0
+    delete_from_index(cursor, source, [item_id for item_id, _ in items])
+    cursor.executemany(
+        "INSERT OR IGNORE INTO title_lsh_buckets (bucket, source, item_id) VALUES (?, ?, ?)",
+        [(bucket, source, item_id) for item_id, buckets in items for bucket in buckets]
+    )
+    return len(items)
+
+
+def insert_buckets(cursor, source: str, items: Iterable[Tuple[int, List[int]]]) -> int:
+    """
+    寫入新商品的索引（商品 ID 從未建立過索引，不需要先刪除）
+
+    依 bucket 排序後插入，讓 B-tree 依序寫入相鄰的頁面。
+
+    Returns:
+        int: 寫入索引的商品數
+    """
+    items = list(items)
+    rows = sorted((bucket, source, item_id) for item_id, buckets in items for bucket in buckets)
+    cursor.executemany(
+        "INSERT OR IGNORE INTO title_lsh_buckets (bucket, source, item_id) VALUES (?, ?, ?)", rows
+    )
+    return len(items)
+
+
+def _read_index_state(conn, source: str) -> Tuple[int, Optional[int]]:
+    """來源的 (水位線, 版本)；沒有紀錄或版本不同時水位線為 0（需要從頭建立）"""
+    row = conn.execute(
+        "SELECT last_id, version FROM title_index_state WHERE source = ?", (source,)
+    ).fetchone()
+    if row is None:
+        return 0, None
+    if row[1] != TITLE_INDEX_VERSION:
+        return 0, row[1]
+    return row[0], row[1]
+
+
+def _write_index_batch(conn, source: str, expected_last_id: int, ids: List[int],
+                       buckets: List[List[int]]) -> int:
+    """
+    寫入工作：插入一批新商品的索引並推進水位線
+
+    水位線與讀取時不同（例如資料庫被替換）時放棄這一批；讀取後已被刪除的商品不寫入索引。
+    """
+    cursor = conn.cursor()
+    last_id, version = _read_index_state(conn, source)
+    if last_id != expected_last_id:
+        return 0
+    if last_id == 0 and version is not None:
+        # 索引格式版本不同：移除舊格式的 bucket 後重建
+        cursor.execute("DELETE FROM title_lsh_buckets WHERE source = ?", (source,))
+
+    existing = {row[0] for row in cursor.execute(
+        f"SELECT id FROM {source} WHERE id BETWEEN ? AND ?", (ids[0], ids[-1])
+    ).fetchall()}
+    items = [(item_id, item_buckets) for item_id, item_buckets in zip(ids, buckets) if item_id in existing]
+    insert_buckets(cursor, source, items)
+    cursor.execute(
+        """
+        INSERT INTO title_index_state (source, last_id, version, updated_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT(source) DO UPDATE SET
+            last_id = excluded.last_id, version = excluded.version, updated_at = excluded.updated_at
+        """,
+        (source, ids[-1], TITLE_INDEX_VERSION, datetime.now().isoformat())
+    )
+
+    if source == SOURCE_PRODUCTS and items:
+        # 新商品與快取的比較目標相近時，使該比較快取失效（延遲匯入避免循環匯入）
+        from core.services.product_comparison_service import invalidate_similar_comparisons
+        invalidate_similar_comparisons(cursor, (item_buckets for _, item_buckets in items))
+    return len(items)
+
+
+def _write_modified_batch(conn, source: str, expected_mark: Optional[str], new_mark: Optional[str],
+                          ids: List[int], buckets: List[List[int]]) -> int:
+    """
+    寫入工作：覆蓋一批內容有變動的商品的索引；new_mark 不為 None 時（最後一批）推進 modified_mark
+
+    modified_mark 與讀取時不同（例如資料庫被替換）時放棄這一批；讀取後已被刪除的商品不寫入索引。
+    """
+    row = conn.execute("SELECT modified_mark FROM title_index_state WHERE source = ?", (source,)).fetchone()
+    if row is None or row[0] != expected_mark:
+        return 0
+    cursor = conn.cursor()
+    items = []
+    if ids:
+        existing = {row[0] for row in cursor.execute(
+            f"SELECT id FROM {source} WHERE id IN ({','.join('?' * len(ids))})", ids
+        ).fetchall()}
+        items = [(item_id, item_buckets) for item_id, item_buckets in zip(ids, buckets) if item_id in existing]
+        index_buckets(cursor, source, items)
+    if new_mark is not None:
+        cursor.execute(
+            "UPDATE title_index_state SET modified_mark = ?, updated_at = ? WHERE source = ?",
+            (new_mark, datetime.now().isoformat(), source)
+        )
+    return len(items)
+
+
+class TitleIndexer:
+    """在背景為新寫入的商品與促銷建立標題索引（也負責一次性的補建）"""
+
+    def __init__(self, batch_size: int = INDEX_BATCH_SIZE, poll_seconds: float = INDEX_POLL_SECONDS):
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self.indexed = 0
+        self.last_error = None
+
+    def start(self):
+        """啟動背景執行緒並立即檢查一次（重複呼叫不會建立多個執行緒）"""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='title-indexer', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def notify(self):
+        """有新商品寫入（或資料庫被替換）時呼叫"""
+        self.start()
+
+    def _index_batch(self, source: str) -> int:
+        """索引水位線之後的一批商品，返回讀到的商品數（0 表示已追上）"""
+        with read_snapshot() as conn:
+            last_id, _ = _read_index_state(conn, source)
+            rows = conn.execute(
+                f"SELECT id, title FROM {source} WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, self.batch_size)
+            ).fetchall()
+        if not rows:
+            return 0
+        # 簽章在寫入執行緒之外計算
+        buckets = title_buckets_batch([row[1] for row in rows])
+        self.indexed += get_db_writer().execute(
+            _write_index_batch, source, last_id, [row[0] for row in rows], buckets
+        )
+        return len(rows)
+
+    def _reindex_modified(self, source: str) -> int:
+        """重新索引水位線以內、modified_mark 之後內容有變動的商品（標題可能就地改變），返回寫入索引的商品數"""
+        with read_snapshot() as conn:
+            row = conn.execute(
+                "SELECT last_id, version, modified_mark FROM title_index_state WHERE source = ?", (source,)
+            ).fetchone()
+            if row is None or row[1] != TITLE_INDEX_VERSION:
+                # 還沒有索引或正在從頭補建，補建時會使用目前的標題
+                return 0
+            last_id, mark = row[0], row[2]
+            new_mark = conn.execute(f"SELECT MAX(updated_at) FROM {source}").fetchone()[0]
+            if new_mark is None or new_mark == mark:
+                return 0
+            # 第一次執行時（沒有 modified_mark）重新索引水位線以內所有有 updated_at 的商品
+            rows = conn.execute(
+                f"""
+                SELECT id, title FROM {source}
+                WHERE updated_at > ? AND id <= ? AND is_expired = 0
+                ORDER BY id
+                """,
+                (mark or '', last_id)
+            ).fetchall()
+        # 簽章在寫入執行緒之外計算
+        buckets = title_buckets_batch([row[1] for row in rows])
+        writer = get_db_writer()
+        count = 0
+        for offset in range(0, max(len(rows), 1), self.batch_size):
+            end = offset + self.batch_size
+            count += writer.execute(
+                _write_modified_batch, source, mark, new_mark if end >= len(rows) else None,
+                [row[0] for row in rows[offset:end]], buckets[offset:end]
+            )
+        self.indexed += count
+        return count
+
+    def run_pending(self) -> int:
+        """建立索引直到所有來源都追上水位線，返回寫入索引的商品數"""
+        with self._run_lock:
+            before = self.indexed
+            for source in (SOURCE_PRODUCTS, SOURCE_DAILY_DEALS):
+                if source == SOURCE_DAILY_DEALS:
+                    # 先處理就地更新的舊促銷，這次新增的促銷（ID 在水位線之後）留給下面的水位線索引
+                    self._reindex_modified(source)
+                while self._index_batch(source) > 0:
+                    pass
+            return self.indexed - before
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.poll_seconds)
+            self._wakeup.clear()
+            try:
+                count = self.run_pending()
+                self.last_error = None
+                if count >= self.batch_size:
+                    print(f"🔖 已為 {count} 個商品建立標題索引")
+            except sqlite3.OperationalError as e:
+                # 資料庫尚未初始化（沒有 title_index_state 表）或暫時被鎖住，下次再試
+                self.last_error = str(e)
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"⚠️ 建立標題索引失敗: {e}")
+
+    def get_status(self) -> Dict:
+        with read_snapshot() as conn:
+            state = {row[0]: {'last_id': row[1], 'version': row[2], 'updated_at': row[3], 'modified_mark': row[4]}
+                     for row in conn.execute(
+                         "SELECT source, last_id, version, updated_at, modified_mark FROM title_index_state"
+                     )}
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'indexed': self.indexed,
+            'state': state,
+            'last_error': self.last_error,
+        }
+
+
+_indexer = None
+_indexer_lock = threading.Lock()
+
+
+def get_title_indexer() -> TitleIndexer:
+    """取得全域共用的標題索引背景執行緒"""
+    global _indexer
+    with _indexer_lock:
+        if _indexer is None:
+            _indexer = TitleIndexer()
+        return _indexer
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def find_similar(title: str, k: int = 10,
+                 sources: Sequence[str] = (SOURCE_PRODUCTS, SOURCE_DAILY_DEALS),
+                 min_similarity: float = DEFAULT_MIN_SIMILARITY,
+                 exclude_platform: Optional[str] = None, conn=None) -> List[Dict]:
+    """
+    從歷史商品與有效促銷中找出標題相近的商品
+
+    Args:
+        title (str): 目標商品標題
+        k (int): 最多返回的商品數
+        sources: 要查詢的來源（products / daily_deals）
+        min_similarity (float): 最低 n-gram Jaccard 相似度
+        exclude_platform (str): 排除的平台（尋找「其他平台」的同款時使用）
+        conn: 資料庫連線；None 時在 read_snapshot 中查詢
+
+    Returns:
+        List[Dict]: 商品欄位加上 source 與 similarity，依相似度排序（同一 URL 只保留一筆）
+    """
+    if conn is None:
+        with read_snapshot() as snapshot:
+            return find_similar(title, k, sources, min_similarity, exclude_platform, snapshot)
+
+    buckets = title_buckets(title)
+    if not buckets:
+        return []
+
+    source_placeholders = ','.join('?' * len(sources))
+    candidates = conn.execute(
+        f"""
+        SELECT source, item_id, COUNT(*) AS shared_bands
+        FROM title_lsh_buckets
+        WHERE bucket IN ({','.join('?' * len(buckets))}) AND source IN ({source_placeholders})
+        GROUP BY source, item_id
+        ORDER BY shared_bands DESC
+        LIMIT ?
+        """,
+        [*buckets, *sources, MAX_LSH_CANDIDATES]
+    ).fetchall()
+
+    ids_by_source: Dict[str, List[int]] = {}
+    for row in candidates:
+        ids_by_source.setdefault(row[0], []).append(row[1])
+
+    query_shingles = _shingles(title)
+    results = []
+    for source, item_ids in ids_by_source.items():
+        sql = _SOURCE_QUERIES[source].format(placeholders=','.join('?' * len(item_ids)))
+        for row in conn.execute(sql, item_ids).fetchall():
+            item = dict(row)
+            if exclude_platform and item['platform'] == exclude_platform:
+                continue
+            similarity = _jaccard(query_shingles, _shingles(item['title']))
+            if similarity >= min_similarity:
+                item['source'] = source
+                item['similarity'] = round(similarity, 4)
+                results.append(item)
+
+    results.sort(key=lambda item: item['similarity'], reverse=True)
+    seen_urls = set()
+    unique = []
+    for item in results:
+        if item['url'] in seen_urls:
+            continue
+        seen_urls.add(item['url'])
+        unique.append(item)
+        if len(unique) >= k:
+            break
+    return unique
+
+
+def main(argv=None):
+    """命令列工具：補建索引或查詢相似商品"""
+    import time
+    import core.database as database
+
+    parser = argparse.ArgumentParser(description='商品標題 MinHash/LSH 索引')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('backfill', help='為水位線之後（或格式版本不同）的商品建立索引')
+    query = sub.add_parser('query', help='查詢相似商品')
+    query.add_argument('title')
+    query.add_argument('-k', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if args.command == 'backfill':
+        database.init_db()
+        count = TitleIndexer().run_pending()
+        print(f"✅ 已補建 {count} 個商品的標題索引")
+        return
+
+    conn = database.get_db_connection()
+    try:
+        start = time.perf_counter()
+        matches = find_similar(args.title, args.k, conn=conn)
+        elapsed = (time.perf_counter() - start) * 1000
+        for item in matches:
+            print(f"{item['similarity']:.2f}  [{item['source']}/{item['platform']}] {item['title']}  ${item['price']}")
+        print(f"🔍 {len(matches)} 個結果，耗時 {elapsed:.1f} ms")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+商品過濾的規則式預過濾
+在呼叫 Gemini 之前，先以確定性的規則處理結果明確的商品，只把無法判斷的標題送給模型：
+
+- 配件關鍵字：每個類別（保護殼、保護貼、充電器、維修零件、支架吊飾）一個預先編譯的正規表達式，
+  標題命中即移除；搜索關鍵字本身就是配件（例如「手機殼」）時不套用
+- 贈品用語（送、贈、附、+ …）後面的配件名稱不算命中，避免把「手機 送保護貼」當成配件；
+  標題是組合商品（超值組、配件組…）時也不以關鍵字規則移除
+- 價格異常：價格低於任務中位數 PRICE_OUTLIER_LOW_RATIO 倍的商品幾乎都是配件或零件，直接移除
+- 標題包含搜索關鍵字的每個詞、價格接近中位數、且沒有配件或「適用」等字眼的商品直接保留
+"""
+
+import re
+import statistics
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+from core.ranking import word_tokens
+
+# 移除商品的階段
+STAGE_RULE = 'rule'
+STAGE_PRICE = 'price_outlier'
+STAGE_GEMINI = 'gemini'
+
+# 各配件類別的關鍵字（標題先做 NFKC 正規化與小寫）
+ACCESSORY_PATTERNS = {
+    'case': [
+        r'手機殼', r'保護殼', r'保護套', r'防摔殼', r'軍規殼', r'透明殼', r'磁吸殼', r'皮套', r'手機套',
+        r'筆電包', r'電腦包', r'內膽包', r'耳機套', r'耳機殼', r'充電盒套', r'收納包', r'收納袋',
+        r'(?<![a-z])(?:case|cover|sleeve)(?![a-z])',
+    ],
+    'screen_protector': [
+        r'保護貼', r'保護膜', r'玻璃貼', r'螢幕貼', r'鋼化膜', r'鋼化玻璃', r'滿版貼', r'鏡頭貼', r'鏡頭保護',
+        r'包膜', r'背貼', r'鍵盤膜', r'screen\s*protector', r'tempered\s*glass',
+    ],
+    'charger': [
+        r'充電器', r'充電頭', r'充電線', r'傳輸線', r'快充線', r'快充頭', r'豆腐頭', r'變壓器', r'電源線',
+        r'充電座', r'充電盤', r'行動電源', r'轉接頭', r'轉接線', r'(?<![a-z])(?:charger|adapter)(?![a-z])',
+    ],
+    'replacement_part': [
+        r'(?<![保府固])維修', r'(?<!原廠)零件', r'拆機', r'副廠', r'替換', r'更換', r'總成', r'排線', r'外殼',
+        r'(?<![a-z])[abcd]殼', r'(?<![a-z])(?:replacement|repair)(?![a-z])',
+    ],
+    'mount': [
+        r'支架', r'立架', r'散熱架', r'散熱座', r'散熱墊', r'掛繩', r'吊飾', r'指環', r'手機鏈', r'貼紙',
+        r'防塵塞',
+    ],
+}
+
+_ACCESSORY_RULES = {
+    category: re.compile('|'.join(patterns)) for category, patterns in ACCESSORY_PATTERNS.items()
+}
+
+# 贈品、抽獎、組合與「不含」用語：其後（到分隔符號為止）的配件名稱不算命中
+_GIFT_PATTERN = re.compile(
+    r'(?:加贈|贈送|加送|加購|不含|不附|送|贈|抽|附|含|加(?![厚硬大長強熱速寬])|\+)[^,，、/|()（）【】\[\]+]{0,12}'
+)
+
+# 主商品搭配配件的組合商品，配件字眼不代表商品本身是配件
+_BUNDLE_PATTERN = re.compile(r'超值組|配件組|組合|套組|套裝|全配')
+
+# 出現這些字眼時不直接保留（多半是「適用某商品」的配件），交給 Gemini 判斷
+_KEEP_BLOCKER_PATTERN = re.compile(r'適用|相容|專用|(?<![a-z])for(?![a-z])')
+
+# 價格異常判斷：至少要有這麼多個有效價格才計算中位數
+MIN_PRICES_FOR_MEDIAN = 10
+PRICE_OUTLIER_LOW_RATIO = 0.1
+
+# 直接保留的價格範圍（相對於中位數）
+KEEP_PRICE_LOW_RATIO = 0.4
+KEEP_PRICE_HIGH_RATIO = 3.0
+
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def _accessory_category(title: str) -> Optional[str]:
+    """標題命中的配件類別（已去除贈品用語）；沒有命中時返回 None"""
+    for category, pattern in _ACCESSORY_RULES.items():
+        if pattern.search(title):
+            return category
+    return None
+
+
+def _session_median_price(products: List[Dict[str, Any]]) -> Optional[float]:
+    prices = [p['price'] for p in products if p.get('price') and p['price'] > 0]
+    if len(prices) < MIN_PRICES_FOR_MEDIAN:
+        return None
+    return statistics.median(prices)
+
+
+def prefilter_products(products: List[Dict[str, Any]], keyword: str) -> Dict[str, Any]:
+    """
+    以規則預先分類任務中的商品
+
+    Args:
+        products: 商品列表（需要 id、title、price）
+        keyword: 搜索關鍵字
+
+    Returns:
+        Dict: removed（{'id', 'stage', 'reason'} 列表）、kept（直接保留的商品 ID）、
+              ambiguous（需要交給 Gemini 的商品，保持原順序）與 median_price
+    """
+    normalized_keyword = _normalize(keyword)
+    # 搜索的就是配件時，標題裡的配件字眼是正常的，不以關鍵字規則移除
+    accessory_rules_enabled = _accessory_category(normalized_keyword) is None
+    keyword_terms = [term.replace(' ', '') for term in word_tokens(keyword)]
+    median_price = _session_median_price(products)
+
+    removed = []
+    kept = []
+    ambiguous = []
+    for product in products:
+        title = _normalize(product['title'])
+        stripped_title = _GIFT_PATTERN.sub(' ', title)
+        price = product.get('price') or 0
+
+        category = None
+        if accessory_rules_enabled and not _BUNDLE_PATTERN.search(title):
+            category = _accessory_category(stripped_title)
+        if category:
+            removed.append({'id': product['id'], 'stage': STAGE_RULE, 'reason': category})
+            continue
+
+        if median_price and 0 < price < median_price * PRICE_OUTLIER_LOW_RATIO:
+            removed.append({
+                'id': product['id'], 'stage': STAGE_PRICE,
+                'reason': f'價格 {price:g} 低於中位數 {median_price:g} 的 {PRICE_OUTLIER_LOW_RATIO:g} 倍'
+            })
+            continue
+
+        compact_title = re.sub(r'\s+', '', title)
+        if (median_price and keyword_terms
+                and all(term in compact_title for term in keyword_terms)
+                and median_price * KEEP_PRICE_LOW_RATIO <= price <= median_price * KEEP_PRICE_HIGH_RATIO
+                and not _KEEP_BLOCKER_PATTERN.search(title)
+                and (not accessory_rules_enabled or _accessory_category(stripped_title) is None)):
+            kept.append(product['id'])
+            continue
+
+        ambiguous.append(product)
+
+    return {'removed': removed, 'kept': kept, 'ambiguous': ambiguous, 'median_price': median_price}
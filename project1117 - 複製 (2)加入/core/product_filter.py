@@ -1,7 +1,23 @@
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Callable, TypedDict
 import google.generativeai as genai
 import os
+from core.llm_gateway import get_llm_gateway
+from core.prefilter import STAGE_GEMINI, STAGE_PRICE, STAGE_RULE, prefilter_products
+from core.ranking import estimate_tokens
+from core.session_stats import refresh_session_stats
+from core.db_writer import get_db_writer
+
+# 分批過濾：每批商品清單的 token 預算與商品數上限（回應中的 ID 列表也要放得下）
+FILTER_CHUNK_TOKEN_BUDGET = 2500
+MAX_PRODUCTS_PER_CHUNK = 80
+
+# 同時送出的批次數與每批失敗後的重試次數
+MAX_PARALLEL_CHUNKS = 4
+CHUNK_MAX_RETRIES = 2
+RETRY_BACKOFF_SECONDS = 1.0
 
 # 使用 TypedDict 取代 Pydantic
 class ProductFilterRequest(TypedDict):
@@ -11,6 +27,15 @@ class ProductFilterRequest(TypedDict):
 class FilterResponse(TypedDict):
     products_to_remove: List[int]
     reasoning: str
+    chunk_count: int
+
+
+class FilterError(Exception):
+    """有批次在重試後仍然失敗；不寫入任何過濾結果，避免任務被誤認為已過濾"""
+
+    def __init__(self, message: str, failed_chunks: List[int]):
+        super().__init__(message)
+        self.failed_chunks = failed_chunks
 
 class ProductFilter:
     def __init__(self, db_connection_func: Callable):
@@ -41,32 +66,72 @@ class ProductFilter:
         conn.close()
         return [dict(p) for p in products]
 
-    def _update_filtered_status_in_db(self, product_ids: List[int]):
-        """在資料庫中更新商品的 is_filtered_out 狀態"""
+    def _update_filtered_status_in_db(self, session_id: int, product_ids: List[int]):
+        """在資料庫中更新商品的 is_filtered_out 狀態，並在同一交易中更新 session 統計"""
         if not product_ids:
             return
-        conn = self.get_db_connection()
-        cursor = conn.cursor()
-        ids_to_update = [(pid,) for pid in product_ids]
-        cursor.executemany(
-            "UPDATE products SET is_filtered_out = 1 WHERE id = ?",
-            ids_to_update
-        )
-        conn.commit()
-        conn.close()
+
+        def mark_filtered(conn):
+            cursor = conn.cursor()
+            ids_to_update = [(pid, session_id) for pid in product_ids]
+            cursor.executemany(
+                "UPDATE products SET is_filtered_out = 1 WHERE id = ? AND session_id = ?",
+                ids_to_update
+            )
+            refresh_session_stats(cursor, session_id)
+
+        get_db_writer().execute(mark_filtered)
         print(f"已在資料庫中標記 {len(product_ids)} 個商品為已過濾。")
 
-    def filter_products_with_gemini(self, products: List[ProductFilterRequest], keyword: str) -> FilterResponse:
-        """
-        使用Gemini API過濾商品
-        """
-        if not products:
-            return {"products_to_remove": [], "reasoning": "沒有商品可供過濾。"}
+    @staticmethod
+    def _format_product_line(product: ProductFilterRequest) -> str:
+        return f"ID: {product['id']}, 標題: {product['title']}"
 
-        if not self.model:
-            return {"products_to_remove": [], "reasoning": "Gemini API 未配置，無法進行過濾。"}
+    def _split_into_chunks(self, products: List[ProductFilterRequest]) -> List[List[ProductFilterRequest]]:
+        """依 token 預算與數量上限將商品切成批次（保持原順序）"""
+        chunks = []
+        current = []
+        used = 0
+        for product in products:
+            cost = estimate_tokens(self._format_product_line(product)) + 1
+            if current and (used + cost > FILTER_CHUNK_TOKEN_BUDGET or len(current) >= MAX_PRODUCTS_PER_CHUNK):
+                chunks.append(current)
+                current = []
+                used = 0
+            current.append(product)
+            used += cost
+        if current:
+            chunks.append(current)
+        return chunks
+
+    @staticmethod
+    def _parse_filter_response(response_text: str) -> Dict[str, Any]:
+        """解析過濾回應；格式不正確時拋出例外"""
+        response_text = response_text.strip()
+        if response_text.startswith('```json'):
+            response_text = response_text[7:-3]  # 移除```json和```
+        elif response_text.startswith('```'):
+            response_text = response_text[3:-3]  # 移除```
+        
+        parsed_json = json.loads(response_text)
+        if not isinstance(parsed_json.get('products_to_remove'), list):
+            raise ValueError('products_to_remove 不是列表')
+        return parsed_json
+
+    def _is_valid_filter_response(self, response_text: str) -> bool:
+        try:
+            self._parse_filter_response(response_text)
+            return True
+        except Exception:
+            return False
+
+    def _filter_chunk(self, products: List[ProductFilterRequest], keyword: str) -> FilterResponse:
+        """
+        過濾一批商品；回應無法解析（例如輸出被截斷）或呼叫失敗時重試，仍失敗則拋出例外
 
-        products_info = "\n".join([f"ID: {p['id']}, 標題: {p['title']}" for p in products])
+        只接受屬於這一批的商品 ID，模型回傳的其他 ID 會被忽略。
+        """
+        products_info = "\n".join(self._format_product_line(p) for p in products)
         
         prompt = f"""
         你是一個商品過濾專家。給定搜索關鍵字 "{keyword}" 和商品列表，請識別出哪些商品不是 "{keyword}" 的主體商品。
@@ -84,27 +149,76 @@ class ProductFilter:
         請分析每個商品標題，找出需要移除的商品ID。只有當商品明確不是 "{keyword}" 主體時才移除。
         請返回 JSON 格式，包含 'products_to_remove' (一個整數ID列表) 和 'reasoning' (字串)。
         """
-        
-        try:
-            response = self.model.generate_content(prompt)
-            
-            # 解析JSON回應
-            response_text = response.text.strip()
-            if response_text.startswith('```json'):
-                response_text = response_text[7:-3]  # 移除```json和```
-            elif response_text.startswith('```'):
-                response_text = response_text[3:-3]  # 移除```
-            
-            parsed_json: FilterResponse = json.loads(response_text)
-            return parsed_json
-            
-        except Exception as e:
-            print(f"Gemini API 調用失敗: {e}")
-            return {"products_to_remove": [], "reasoning": "API調用失敗，未進行過濾"}
+        chunk_ids = {p['id'] for p in products}
+
+        last_error = None
+        for attempt in range(CHUNK_MAX_RETRIES + 1):
+            if attempt:
+                time.sleep(RETRY_BACKOFF_SECONDS * (2 ** (attempt - 1)))
+            try:
+                # 相同的批次（商品與關鍵字都沒有變）直接使用快取的回應；無法解析的回應不會被快取
+                response = get_llm_gateway().generate_content(
+                    self.model, prompt, generation_config={'response_mime_type': 'application/json'},
+                    validate=self._is_valid_filter_response, feature='product_filter', attempt=attempt
+                )
+                parsed_json = self._parse_filter_response(response.text)
+                return {
+                    "products_to_remove": [int(pid) for pid in parsed_json['products_to_remove'] if int(pid) in chunk_ids],
+                    "reasoning": str(parsed_json.get('reasoning', '')),
+                    "chunk_count": 1,
+                }
+            except Exception as e:
+                last_error = e
+                print(f"Gemini 過濾批次失敗（第 {attempt + 1} 次，{len(products)} 個商品）: {e}")
+        raise last_error
+
+    def filter_products_with_gemini(self, products: List[ProductFilterRequest], keyword: str) -> FilterResponse:
+        """
+        使用Gemini API過濾商品
+
+        商品依 token 預算分批，以有限的並行數同時送出，每批各自重試，最後合併成一個結果。
+        任何一批重試後仍失敗時拋出 FilterError，不回傳部分結果。
+        """
+        if not products:
+            return {"products_to_remove": [], "reasoning": "沒有商品可供過濾。", "chunk_count": 0}
+
+        if not self.model:
+            return {"products_to_remove": [], "reasoning": "Gemini API 未配置，無法進行過濾。", "chunk_count": 0}
+
+        chunks = self._split_into_chunks(products)
+        print(f"分 {len(chunks)} 批過濾 {len(products)} 個商品（最多同時 {MAX_PARALLEL_CHUNKS} 批）")
+
+        results = [None] * len(chunks)
+        errors = {}
+        with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_CHUNKS, len(chunks))) as executor:
+            futures = {executor.submit(self._filter_chunk, chunk, keyword): i for i, chunk in enumerate(chunks)}
+            for future, index in futures.items():
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    errors[index] = e
+
+        if errors:
+            failed = sorted(errors)
+            raise FilterError(
+                f"{len(failed)} / {len(chunks)} 批商品過濾失敗（第 {', '.join(str(i + 1) for i in failed)} 批）: "
+                f"{errors[failed[0]]}",
+                failed
+            )
+
+        products_to_remove = sorted({pid for result in results for pid in result['products_to_remove']})
+        if len(results) == 1:
+            reasoning = results[0]['reasoning']
+        else:
+            reasoning = "\n".join(f"第 {i + 1} 批: {result['reasoning']}" for i, result in enumerate(results))
+        return {"products_to_remove": products_to_remove, "reasoning": reasoning, "chunk_count": len(chunks)}
 
     def filter_session_products(self, session_id: int) -> Dict[str, Any]:
         """
         過濾指定 session ID 的爬蟲結果
+
+        先以規則預過濾（配件關鍵字、價格異常、明確的主體商品），只把無法判斷的商品交給 Gemini；
+        結果中的 removed_products 標示每個被移除的商品是由哪個階段移除。
         """
         print(f"開始商品過濾流程，Session ID: {session_id}...")
         
@@ -124,21 +238,34 @@ class ProductFilter:
         print(f"搜索關鍵字: {keyword}")
         print(f"原始商品總數: {len(products_from_db)}")
 
+        prefiltered = prefilter_products(products_from_db, keyword)
+        print(f"規則預過濾: 移除 {len(prefiltered['removed'])} 個、直接保留 {len(prefiltered['kept'])} 個，"
+              f"{len(prefiltered['ambiguous'])} 個交給 Gemini")
+
+        # 依 ID 排序，相同的商品集合每次都切成相同的批次（提示詞相同才能命中 LLM 快取）
         products_for_filtering: List[ProductFilterRequest] = [
-            {"id": p["id"], "title": p["title"]} for p in products_from_db
+            {"id": p["id"], "title": p["title"]} for p in sorted(prefiltered['ambiguous'], key=lambda p: p["id"])
         ]
 
         print("使用Gemini API進行智能過濾...")
+        # 有批次失敗時 FilterError 會直接往上拋，不標記任何商品，任務之後仍會被列為待過濾
         filter_result = self.filter_products_with_gemini(products_for_filtering, keyword)
         
         print(f"過濾理由: {filter_result['reasoning']}")
         print(f"模型建議移除的商品數量: {len(filter_result['products_to_remove'])}")
 
-        self._update_filtered_status_in_db(filter_result['products_to_remove'])
+        removed_products = prefiltered['removed'] + [
+            {'id': pid, 'stage': STAGE_GEMINI, 'reason': ''} for pid in filter_result['products_to_remove']
+        ]
+        removed_ids = [item['id'] for item in removed_products]
+        self._update_filtered_status_in_db(session_id, removed_ids)
         
         original_count = len(products_from_db)
-        removed_count = len(filter_result['products_to_remove'])
+        removed_count = len(removed_ids)
         filtered_count = original_count - removed_count
+        stage_counts = {stage: 0 for stage in (STAGE_RULE, STAGE_PRICE, STAGE_GEMINI)}
+        for item in removed_products:
+            stage_counts[item['stage']] += 1
 
         print(f"過濾完成！總共移除 {removed_count} 個商品，剩餘 {filtered_count} 個。")
 
@@ -149,7 +276,12 @@ class ProductFilter:
             "filtered_count": filtered_count,
             "removed_count": removed_count,
             "reasoning": filter_result['reasoning'],
-            "removed_product_ids": filter_result['products_to_remove']
+            "removed_product_ids": removed_ids,
+            "removed_products": removed_products,
+            "removed_by_stage": stage_counts,
+            "kept_by_rule_count": len(prefiltered['kept']),
+            "sent_to_gemini_count": len(products_for_filtering),
+            "chunk_count": filter_result['chunk_count']
         }
 
 def main():
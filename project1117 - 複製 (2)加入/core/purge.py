@@ -0,0 +1,193 @@
+"""
+背景分段刪除（purge）任務
+清理舊資料或空任務時，不再用一個包含所有 ID 的 IN (...) 在單一交易中刪除：
+
+- 任務 ID 分批處理（每批最多 SESSION_BATCH_SIZE 個，遠低於 SQLite 的變數上限）
+- 商品以 session_id 索引分段刪除，每段一個短的寫入工作
+- 背景執行緒執行，可查詢進度並隨時取消（已完成的段落保留）
+"""
+
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from core.database import read_snapshot
+from core.db_writer import get_db_writer
+from core.embeddings import remove_from_embedding_index
+from core.minhash import SOURCE_PRODUCTS, delete_from_index
+from core.session_stats import delete_session_stats
+
+# 每批處理的任務數與每段刪除的商品數
+SESSION_BATCH_SIZE = 200
+PRODUCT_CHUNK_SIZE = 2000
+
+# 每段之間讓出的時間（秒），讓其他寫入工作有機會插隊
+CHUNK_PAUSE_SECONDS = 0.01
+
+# 保留在記憶體中的已結束任務數
+MAX_FINISHED_JOBS = 20
+
+
+def _delete_product_chunk(conn, session_ids: List[int], chunk_size: int) -> List[int]:
+    """寫入工作：刪除一段屬於指定任務的商品（連同標題索引），返回刪除的商品 ID"""
+    placeholders = ','.join('?' * len(session_ids))
+    product_ids = [row[0] for row in conn.execute(
+        f"SELECT id FROM products WHERE session_id IN ({placeholders}) LIMIT ?",
+        [*session_ids, chunk_size]
+    ).fetchall()]
+    if not product_ids:
+        return []
+    cursor = conn.cursor()
+    delete_from_index(cursor, SOURCE_PRODUCTS, product_ids)
+    cursor.execute(f"DELETE FROM products WHERE id IN ({','.join('?' * len(product_ids))})", product_ids)
+    return product_ids
+
+
+def _delete_session_rows(conn, session_ids: List[int]) -> int:
+    """寫入工作：刪除（商品已清空的）任務列與統計，返回刪除的任務數"""
+    placeholders = ','.join('?' * len(session_ids))
+    deleted = conn.execute(f'DELETE FROM crawl_sessions WHERE id IN ({placeholders})', session_ids).rowcount
+    delete_session_stats(conn.cursor(), session_ids)
+    return deleted
+
+
+class PurgeJob:
+    """一個背景刪除任務的狀態與進度"""
+
+    def __init__(self, description: str, session_ids: List[int]):
+        self.id = uuid.uuid4().hex[:12]
+        self.description = description
+        self.session_ids = session_ids
+        self.status = 'pending'
+        self.sessions_deleted = 0
+        self.products_deleted = 0
+        self.error = None
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self._done.is_set()
+
+    def cancel(self):
+        """要求取消（目前這一段完成後停止）"""
+        self._cancel.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """等待任務結束，返回是否已結束"""
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> Dict:
+        total = len(self.session_ids)
+        return {
+            'job_id': self.id,
+            'description': self.description,
+            'status': self.status,
+            'sessions_total': total,
+            'sessions_deleted': self.sessions_deleted,
+            'products_deleted': self.products_deleted,
+            'progress': round(self.sessions_deleted / total * 100, 1) if total else 100.0,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+    def run(self):
+        """依批次刪除任務；每一段都是獨立的短交易"""
+        writer = get_db_writer()
+        self.status = 'running'
+        self.started_at = datetime.now().isoformat()
+        try:
+            for offset in range(0, len(self.session_ids), SESSION_BATCH_SIZE):
+                batch = self.session_ids[offset:offset + SESSION_BATCH_SIZE]
+                while True:
+                    if self._cancel.is_set():
+                        self.status = 'cancelled'
+                        return
+                    product_ids = writer.execute(_delete_product_chunk, batch, PRODUCT_CHUNK_SIZE)
+                    # 交易提交後才移除向量（memmap 不會隨交易回滾）
+                    remove_from_embedding_index(product_ids)
+                    self.products_deleted += len(product_ids)
+                    if len(product_ids) < PRODUCT_CHUNK_SIZE:
+                        break
+                    time.sleep(CHUNK_PAUSE_SECONDS)
+
+                self.sessions_deleted += writer.execute(_delete_session_rows, batch)
+                time.sleep(CHUNK_PAUSE_SECONDS)
+
+            self.status = 'completed'
+        except Exception as e:
+            self.status = 'failed'
+            self.error = str(e)
+            print(f"❌ 背景刪除任務 {self.id} 失敗: {e}")
+        finally:
+            self.finished_at = datetime.now().isoformat()
+            self._done.set()
+            print(f"🧹 背景刪除任務 {self.id}（{self.description}）{self.status}："
+                  f"{self.sessions_deleted} 個任務、{self.products_deleted} 個商品")
+
+
+class PurgeManager:
+    """建立與追蹤背景刪除任務"""
+
+    def __init__(self):
+        self._jobs: Dict[str, PurgeJob] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, description: str, session_ids: List[int]) -> PurgeJob:
+        job = PurgeJob(description, session_ids)
+        with self._lock:
+            self._jobs[job.id] = job
+            finished = [j for j in self._jobs.values() if j.finished]
+            for old in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+                del self._jobs[old.id]
+        threading.Thread(target=job.run, name=f'purge-{job.id}', daemon=True).start()
+        return job
+
+    def purge_sessions_before(self, cutoff_str: str) -> PurgeJob:
+        """刪除指定時間之前的所有任務"""
+        with read_snapshot() as conn:
+            rows = conn.execute('SELECT id FROM crawl_sessions WHERE crawl_time < ? ORDER BY id', (cutoff_str,)).fetchall()
+        return self._start(f'清理 {cutoff_str} 之前的資料', [row['id'] for row in rows])
+
+    def purge_empty_sessions(self) -> PurgeJob:
+        """刪除沒有任何商品的任務"""
+        with read_snapshot() as conn:
+            rows = conn.execute('''
+                SELECT cs.id FROM crawl_sessions cs
+                WHERE NOT EXISTS (SELECT 1 FROM products p WHERE p.session_id = cs.id)
+                ORDER BY cs.id
+            ''').fetchall()
+        return self._start('清理空的搜尋結果', [row['id'] for row in rows])
+
+    def purge_session(self, session_id: int) -> PurgeJob:
+        """刪除單一任務"""
+        return self._start(f'刪除任務 {session_id}', [session_id])
+
+    def get_job(self, job_id: str) -> Optional[PurgeJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict() for job in sorted(jobs, key=lambda j: j.created_at, reverse=True)]
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_purge_manager() -> PurgeManager:
+    """取得全域共用的背景刪除管理器"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = PurgeManager()
+        return _manager
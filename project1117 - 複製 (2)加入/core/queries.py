@@ -0,0 +1,108 @@
+"""
+共用的彙總查詢
+統計與調試頁面需要的數量、最新時間等都在 SQL 中單次彙總完成，
+只回傳輕量的 namedtuple，不把整張表載入 Python。
+"""
+
+from collections import namedtuple
+from typing import List, Optional
+
+PlatformDealStats = namedtuple('PlatformDealStats', ['platform', 'deal_count', 'latest_crawl', 'refreshed_at'])
+DailyDealsSummary = namedtuple('DailyDealsSummary', ['total_deals', 'platforms'])
+DailyDealsStatus = namedtuple('DailyDealsStatus', ['total_deals', 'last_update'])
+DatabaseOverview = namedtuple('DatabaseOverview', [
+    'total_sessions', 'total_products', 'empty_sessions', 'oldest_session', 'newest_session'
+])
+
+_PLATFORM_DEALS_SQL = """
+    WITH active AS (
+        SELECT platform, crawl_time
+        FROM daily_deals
+        WHERE is_expired = 0 {platform_filter}
+    ),
+    per_platform AS (
+        SELECT platform, COUNT(*) AS deal_count, MAX(crawl_time) AS latest_crawl
+        FROM active
+        GROUP BY platform
+    )
+    SELECT p.platform, p.deal_count, p.latest_crawl, r.refreshed_at
+    FROM per_platform p
+    LEFT JOIN daily_deals_refresh r ON r.platform = p.platform
+    ORDER BY p.platform
+"""
+
+_DAILY_DEALS_STATUS_SQL = """
+    WITH active AS (
+        SELECT COUNT(*) AS total_deals, MAX(crawl_time) AS latest_crawl
+        FROM daily_deals
+        WHERE is_expired = 0
+    ),
+    refresh AS (
+        SELECT MAX(refreshed_at) AS latest_refresh FROM daily_deals_refresh
+    )
+    SELECT active.total_deals,
+           CASE
+               WHEN refresh.latest_refresh IS NULL THEN active.latest_crawl
+               WHEN active.latest_crawl IS NULL THEN refresh.latest_refresh
+               ELSE MAX(refresh.latest_refresh, active.latest_crawl)
+           END AS last_update
+    FROM active, refresh
+"""
+
+_DATABASE_OVERVIEW_SQL = """
+    WITH session_summary AS (
+        SELECT COUNT(*) AS total_sessions,
+               MIN(crawl_time) AS oldest_session,
+               MAX(crawl_time) AS newest_session
+        FROM crawl_sessions
+    ),
+    product_summary AS (
+        SELECT COUNT(*) AS total_products FROM products
+    ),
+    empty_summary AS (
+        SELECT COUNT(*) AS empty_sessions
+        FROM crawl_sessions cs
+        WHERE NOT EXISTS (SELECT 1 FROM products p WHERE p.session_id = cs.id)
+    )
+    SELECT s.total_sessions, p.total_products, e.empty_sessions, s.oldest_session, s.newest_session
+    FROM session_summary s, product_summary p, empty_summary e
+"""
+
+
+def daily_deals_by_platform(conn, platform: Optional[str] = None) -> DailyDealsSummary:
+    """
+    各平台有效促銷商品的數量、最新爬取時間與最後刷新時間
+
+    Args:
+        conn: 資料庫連線（建議在 read_snapshot 中）
+        platform (str): 只統計指定平台，None 表示全部
+
+    Returns:
+        DailyDealsSummary: total_deals 與 PlatformDealStats 列表
+    """
+    params = []
+    platform_filter = ''
+    if platform is not None:
+        platform_filter = 'AND platform = ?'
+        params.append(platform)
+    rows = conn.execute(_PLATFORM_DEALS_SQL.format(platform_filter=platform_filter), params).fetchall()
+    platforms = [PlatformDealStats(*row) for row in rows]
+    return DailyDealsSummary(sum(p.deal_count for p in platforms), platforms)
+
+
+def daily_deals_status(conn) -> DailyDealsStatus:
+    """有效促銷商品總數與最後更新時間（刷新紀錄與商品爬取時間取較新者）"""
+    return DailyDealsStatus(*conn.execute(_DAILY_DEALS_STATUS_SQL).fetchone())
+
+
+def recent_daily_deals(conn, limit: int = 10) -> List[dict]:
+    """最近爬取的有效促銷商品"""
+    rows = conn.execute(
+        "SELECT * FROM daily_deals WHERE is_expired = 0 ORDER BY crawl_time DESC LIMIT ?", (limit,)
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def database_overview(conn) -> DatabaseOverview:
+    """任務數、商品數、空任務數與任務時間範圍（單一查詢）"""
+    return DatabaseOverview(*conn.execute(_DATABASE_OVERVIEW_SQL).fetchone())
@@ -0,0 +1,127 @@
+"""
+候選商品的本地詞彙預排序
+送給 Gemini 比較之前，先以字元 n-gram 的 BM25 分數衡量候選商品與目標商品標題的相關程度：
+
+- 標題先做 NFKC 正規化與小寫，中文與英數混合的標題都以字元 n-gram 切分，不需要斷詞
+- 文件頻率在整個候選集合上一次計算，以倒排表累加分數，不逐對比較
+- 依分數排序後，在 token 預算內取前 K 個候選（K 由預算決定，不是固定數量）
+"""
+
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Sequence
+
+# n-gram 長度：中文標題以 2、3 字元組合最能區分品牌與型號
+NGRAM_SIZES = (2, 3)
+
+# BM25 參數
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 即使分數為 0（沒有任何共同 n-gram）也保留的最少候選數，避免把候選全部濾掉
+MIN_CANDIDATES = 5
+
+_NON_WORD_PATTERN = re.compile(r'[^0-9a-z\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]+')
+_CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]')
+
+
+def word_tokens(text: str) -> List[str]:
+    """將標題切成詞（NFKC 正規化、小寫，以非文字符號分隔；中文連續片段視為一個詞）"""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    return [segment for segment in _NON_WORD_PATTERN.split(text) if segment]
+
+
+def char_ngrams(text: str, sizes: Sequence[int] = NGRAM_SIZES) -> List[str]:
+    """
+    將標題切成字元 n-gram
+
+    非文字符號視為分隔，n-gram 不跨越分隔（避免「128g」與下一個詞黏在一起）；
+    長度不足最小 n 的片段整段保留。
+    """
+    grams = []
+    for segment in word_tokens(text):
+        if len(segment) < min(sizes):
+            grams.append(segment)
+            continue
+        for n in sizes:
+            grams.extend(segment[i:i + n] for i in range(len(segment) - n + 1))
+    return grams
+
+
+def bm25_scores(query_titles: Iterable[str], candidate_titles: Sequence[str]) -> List[float]:
+    """
+    以字元 n-gram BM25 計算每個候選標題的分數
+
+    Args:
+        query_titles: 目標商品標題（批量比較時有多個，取各目標分數的最大值）
+        candidate_titles: 候選商品標題
+
+    Returns:
+        List[float]: 與 candidate_titles 同順序的分數
+    """
+    docs = [Counter(char_ngrams(title)) for title in candidate_titles]
+    total = len(docs)
+    if not total:
+        return []
+
+    lengths = [sum(doc.values()) for doc in docs]
+    avg_length = (sum(lengths) / total) or 1.0
+
+    # 倒排表：n-gram -> [(候選索引, 次數)]
+    postings: Dict[str, List] = {}
+    for index, doc in enumerate(docs):
+        for gram, tf in doc.items():
+            postings.setdefault(gram, []).append((index, tf))
+
+    norms = [BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length) for length in lengths]
+    best = [0.0] * total
+    for query in query_titles:
+        scores = [0.0] * total
+        for gram in set(char_ngrams(query)):
+            posting = postings.get(gram)
+            if not posting:
+                continue
+            idf = math.log(1 + (total - len(posting) + 0.5) / (len(posting) + 0.5))
+            for index, tf in posting:
+                scores[index] += idf * tf * (BM25_K1 + 1) / (tf + norms[index])
+        best = [max(a, b) for a, b in zip(best, scores)]
+    return best
+
+
+def estimate_tokens(text: str) -> int:
+    """粗估文字的 token 數：中日韓字元約一字一 token，其餘約四個字元一 token"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def select_top_k(scores: Sequence[float], costs: Sequence[int], token_budget: int,
+                 max_candidates: int, min_candidates: int = MIN_CANDIDATES) -> List[int]:
+    """
+    依分數由高到低選取候選，直到用完 token 預算或達到數量上限
+
+    分數為 0 的候選只在數量不足 min_candidates 時補上（依原順序）。
+
+    Args:
+        scores: 每個候選的分數
+        costs: 每個候選在提示詞中佔用的 token 數
+        token_budget: 候選清單可用的 token 預算
+        max_candidates: 候選數量上限
+
+    Returns:
+        List[int]: 選中的候選索引（依分數排序）
+    """
+    ranked = sorted(range(len(scores)), key=lambda i: (-scores[i], i))
+    selected = []
+    used = 0
+    for index in ranked:
+        if len(selected) >= max_candidates:
+            break
+        if scores[index] <= 0 and len(selected) >= min_candidates:
+            break
+        if used + costs[index] > token_budget and len(selected) >= min_candidates:
+            break
+        selected.append(index)
+        used += costs[index]
+    return selected
@@ -14,11 +14,16 @@ project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(_
 sys.path.insert(0, project_root)
 
 from core.database import get_db_connection
+from core.daily_deals_merge import merge_daily_deals
+from core.db_writer import get_db_writer
+from core.minhash import get_title_indexer
 
 
 class DailyDealsService:
-    def __init__(self, crawler_manager):
+    def __init__(self, crawler_manager, deal_match_service=None):
         self.crawler_manager = crawler_manager
+        # 更新完成後在背景預先比對促銷商品（DealMatchService，可選）
+        self.deal_match_service = deal_match_service
         self.crawler_status = {
             'is_updating': False,
             'start_time': None,
@@ -71,9 +76,14 @@ class DailyDealsService:
                 'completion_time': datetime.now().isoformat()
             })
             print("爬蟲狀態已重置為非更新中")
+
+            # 3. 促銷商品與比較用的一般商品都已寫入，在背景預先比對
+            if self.deal_match_service is not None:
+                result = self.deal_match_service.start()
+                print(f"每日促銷預先比對: {result['message']}")
     
     def _run_and_save(self, crawler_name):
-        """執行並儲存爬蟲結果"""
+        """執行爬蟲並以增量合併方式儲存結果，返回新增/更新/過期數量"""
         try:
             print(f"開始執行 {crawler_name} 爬蟲...")
             # 修正路徑：從 core/services 到 crawlers 需要回到專案根目錄
@@ -93,23 +103,13 @@ class DailyDealsService:
             print(f"{crawler_name} 爬蟲獲取到 {len(products) if products else 0} 個商品")
             
             if products:
-                conn = get_db_connection()
-                cursor = conn.cursor()
-                # 先刪除該平台舊資料
-                cursor.execute("DELETE FROM daily_deals WHERE platform = ?", (crawler_name,))
-                print(f"已清除 {crawler_name} 平台的舊資料")
-                
-                products_to_insert = [
-                    (crawler_name, p.get('title') or p.get('name'), p.get('price'), p.get('url'), p.get('image_url'), datetime.now().isoformat())
-                    for p in products
-                ]
-                cursor.executemany(
-                    "INSERT OR IGNORE INTO daily_deals (platform, title, price, url, image_url, crawl_time) VALUES (?, ?, ?, ?, ?, ?)",
-                    products_to_insert
-                )
-                conn.commit()
-                conn.close()
-                print(f"{crawler_name} 爬蟲完成，{len(products)} 個商品已存入資料庫")
+                # 以 URL 為鍵增量合併：只更新有變動的商品，消失的商品標記為過期
+                counts = get_db_writer().execute(merge_daily_deals, crawler_name, products)
+                # 新增與標題變動的促銷在背景建立索引
+                get_title_indexer().notify()
+                print(f"{crawler_name} 爬蟲完成，新增 {counts['inserted']} 個、更新 {counts['updated']} 個、"
+                      f"過期 {counts['expired']} 個、未變動 {counts['unchanged']} 個商品")
+                return counts
             else:
                 print(f"{crawler_name} 爬蟲沒有獲取到任何商品")
         except Exception as e:
@@ -124,7 +124,7 @@ class DailyDealsService:
             
             # 從每日促銷商品中提取關鍵字作為搜尋條件
             conn = get_db_connection()
-            recent_deals = conn.execute("SELECT DISTINCT title FROM daily_deals ORDER BY crawl_time DESC LIMIT 10").fetchall()
+            recent_deals = conn.execute("SELECT DISTINCT title FROM daily_deals WHERE is_expired = 0 ORDER BY crawl_time DESC LIMIT 10").fetchall()
             conn.close()
             
             # 提取關鍵字（簡化版）
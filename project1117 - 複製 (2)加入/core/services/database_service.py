@@ -3,7 +3,54 @@
 負責各種資料庫操作的封裝和管理
 """
 
-from core.database import get_db_connection
+import base64
+import json
+from contextlib import contextmanager
+
+from core.archive import load_archived_session
+from core.database import get_db_connection, read_snapshot
+from core.purge import get_purge_manager
+from core.queries import daily_deals_by_platform, daily_deals_status, database_overview, recent_daily_deals
+from core.session_stats import get_session_stats
+
+# 分頁查詢的預設與最大每頁筆數
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(values):
+    """將排序鍵（如 crawl_time, id）編碼為不透明的分頁游標字串"""
+    raw = json.dumps(list(values), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解碼分頁游標，格式錯誤時拋出 ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except Exception:
+        raise ValueError(f'無效的分頁游標: {cursor}')
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError(f'無效的分頁游標: {cursor}')
+    return values
+
+
+def _clamp_limit(limit):
+    """限制每頁筆數在 1 到 MAX_PAGE_SIZE 之間"""
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+
+@contextmanager
+def _reader(conn=None):
+    """沿用呼叫端傳入的快照連線，沒有時自行開啟一個唯讀快照"""
+    if conn is not None:
+        yield conn
+    else:
+        with read_snapshot() as snapshot:
+            yield snapshot
 
 
 class DatabaseService:
@@ -20,58 +67,125 @@ class DatabaseService:
         except Exception as e:
             raise Exception(f'讀取爬取紀錄失敗: {str(e)}')
     
-    def get_session_detail(self, session_id):
-        """獲取特定任務的詳細內容"""
+    def get_crawl_sessions_page(self, limit=DEFAULT_PAGE_SIZE, after=None, conn=None):
+        """
+        以 keyset 分頁獲取爬蟲任務（依 crawl_time, id 由新到舊）
+
+        Args:
+            limit (int): 每頁筆數
+            after (str): 上一頁回傳的 next_cursor，None 表示第一頁
+            conn: 呼叫端的讀取快照（read_snapshot），None 時自行開啟
+
+        Returns:
+            Dict: items（任務列表）、next_cursor、has_more
+        """
+        limit = _clamp_limit(limit)
+        query = 'SELECT * FROM crawl_sessions'
+        params = []
+        if after:
+            crawl_time, session_id = decode_cursor(after)
+            # row value 比較可直接使用 (crawl_time, id) 複合索引做範圍掃描
+            query += ' WHERE (crawl_time, id) < (?, ?)'
+            params.extend([crawl_time, session_id])
+        query += ' ORDER BY crawl_time DESC, id DESC LIMIT ?'
+        params.append(limit + 1)  # 多取一筆用來判斷是否還有下一頁
+
+        try:
+            with _reader(conn) as reader:
+                rows = reader.execute(query, params).fetchall()
+        except Exception as e:
+            raise Exception(f'讀取爬取紀錄失敗: {str(e)}')
+
+        has_more = len(rows) > limit
+        items = [dict(row) for row in rows[:limit]]
+        next_cursor = encode_cursor([items[-1]['crawl_time'], items[-1]['id']]) if has_more else None
+        return {'items': items, 'next_cursor': next_cursor, 'has_more': has_more}
+
+    def get_session_products_page(self, session_id, limit=DEFAULT_PAGE_SIZE, after=None, conn=None):
+        """
+        以 keyset 分頁獲取特定任務的商品（依 price, id 由低到高）
+
+        價格為 NULL 的商品排在最前面（與 ORDER BY price 的行為一致）。
+
+        Args:
+            session_id (int): 爬取任務 ID
+            limit (int): 每頁筆數
+            after (str): 上一頁回傳的 next_cursor，None 表示第一頁
+            conn: 呼叫端的讀取快照（read_snapshot），None 時自行開啟
+
+        Returns:
+            Dict: items（商品列表）、next_cursor、has_more
+        """
+        limit = _clamp_limit(limit)
+        query = 'SELECT * FROM products WHERE session_id = ?'
+        params = [session_id]
+        if after:
+            price, product_id = decode_cursor(after)
+            if price is None:
+                query += ' AND ((price IS NULL AND id > ?) OR price IS NOT NULL)'
+                params.append(product_id)
+            else:
+                query += ' AND (price, id) > (?, ?)'
+                params.extend([price, product_id])
+        query += ' ORDER BY price, id LIMIT ?'
+        params.append(limit + 1)
+
+        try:
+            with _reader(conn) as reader:
+                rows = reader.execute(query, params).fetchall()
+        except Exception as e:
+            raise Exception(f'讀取商品列表失敗: {str(e)}')
+
+        has_more = len(rows) > limit
+        items = [dict(row) for row in rows[:limit]]
+        next_cursor = encode_cursor([items[-1]['price'], items[-1]['id']]) if has_more else None
+        return {'items': items, 'next_cursor': next_cursor, 'has_more': has_more}
+
+    def get_archived_session(self, session_id):
+        """讀取已歸檔的任務（session、statistics、products），未歸檔時返回 None"""
+        try:
+            return load_archived_session(session_id)
+        except Exception as e:
+            raise Exception(f'讀取歸檔任務失敗: {str(e)}')
+
+    def page_archived_products(self, products, limit=DEFAULT_PAGE_SIZE, after=None):
+        """
+        對歸檔商品套用與 get_session_products_page 相同的 keyset 分頁
+
+        Args:
+            products (list): 已依 price, id 排序的歸檔商品
+            limit (int): 每頁筆數
+            after (str): 上一頁回傳的 next_cursor
+
+        Returns:
+            Dict: items、next_cursor、has_more
+        """
+        limit = _clamp_limit(limit)
+        if after:
+            price, product_id = decode_cursor(after)
+            if price is None:
+                products = [p for p in products
+                            if (p['price'] is None and p['id'] > product_id) or p['price'] is not None]
+            else:
+                products = [p for p in products
+                            if p['price'] is not None and (p['price'], p['id']) > (price, product_id)]
+
+        has_more = len(products) > limit
+        items = products[:limit]
+        next_cursor = encode_cursor([items[-1]['price'], items[-1]['id']]) if has_more else None
+        return {'items': items, 'next_cursor': next_cursor, 'has_more': has_more}
+
+    def get_session_detail(self, session_id, conn=None):
+        """獲取特定任務的詳細統計（讀取 session_stats 預先計算好的一列資料）"""
         try:
             print(f"獲取任務 {session_id} 的詳情")
-            conn = get_db_connection()
-            session = conn.execute('SELECT * FROM crawl_sessions WHERE id = ?', (session_id,)).fetchone()
-            
-            if not session:
-                conn.close()
+            with _reader(conn) as reader:
+                stats = get_session_stats(reader, session_id)
+
+            if stats is None:
                 print(f"錯誤: 找不到ID為 {session_id} 的任務")
                 raise Exception('任務不存在')
-            
-            products = conn.execute('SELECT * FROM products WHERE session_id = ? ORDER BY price', (session_id,)).fetchall()
-            products_count = len(products)
-            print(f"找到 {products_count} 個商品")
-            
-            # 獲取各平台統計資料
-            platform_stats_rows = conn.execute("""
-                SELECT platform, COUNT(*) as 'COUNT(*)', AVG(price) as 'AVG(price)', 
-                       MIN(price) as 'MIN(price)', MAX(price) as 'MAX(price)'
-                FROM products WHERE session_id = ? GROUP BY platform
-            """, (session_id,)).fetchall()
-            
-            # 獲取整體價格統計
-            price_stats_row = conn.execute("""
-                SELECT COUNT(*) as 'COUNT(*)', AVG(price) as 'AVG(price)', 
-                       MIN(price) as 'MIN(price)', MAX(price) as 'MAX(price)'
-                FROM products WHERE session_id = ?
-            """, (session_id,)).fetchone()
-            
-            platform_stats = {
-                row['platform']: {
-                    'product_count': row['COUNT(*)'],
-                    'average_price': row['AVG(price)'],
-                    'min_price': row['MIN(price)'],
-                    'max_price': row['MAX(price)'],
-                } for row in platform_stats_rows
-            }
 
-            stats = {
-                'keyword': session['keyword'],
-                'total_products': session['total_products'],
-                'platforms': platform_stats,
-                'price_stats': {
-                    'min': price_stats_row['MIN(price)'] if price_stats_row and price_stats_row['COUNT(*)'] > 0 else 0,
-                    'max': price_stats_row['MAX(price)'] if price_stats_row and price_stats_row['COUNT(*)'] > 0 else 0,
-                    'average': price_stats_row['AVG(price)'] if price_stats_row and price_stats_row['COUNT(*)'] > 0 else 0,
-                    'total': price_stats_row['COUNT(*)'] if price_stats_row and price_stats_row['COUNT(*)'] > 0 else 0
-                }
-            }
-            
-            conn.close()
             return stats
         except Exception as e:
             print(f"獲取統計資料時出錯: {e}")
@@ -79,29 +193,57 @@ class DatabaseService:
             traceback.print_exc()
             raise Exception(f'獲取統計資料失敗: {str(e)}')
     
-    def get_daily_deals(self, platform_filter='all'):
-        """獲取每日促銷結果"""
+    def get_daily_deals(self, platform_filter='all', limit=DEFAULT_PAGE_SIZE, after=None):
+        """
+        以 keyset 分頁獲取每日促銷結果（依 crawl_time, id 由新到舊）
+
+        每次最多讀取 MAX_PAGE_SIZE 筆，前端依 next_cursor 逐頁載入；
+        總數與各平台更新時間由彙總查詢取得，不需讀完整個列表。
+
+        Args:
+            platform_filter (str): 平台名稱，'all' 表示全部
+            limit (int): 每頁筆數
+            after (str): 上一頁回傳的 next_cursor，None 表示第一頁
+
+        Returns:
+            Dict: daily_deals（本頁商品）、next_cursor、has_more、total_deals、last_update、platform_updates
+        """
+        limit = _clamp_limit(limit)
+        query = "SELECT * FROM daily_deals WHERE is_expired = 0"
+        params = []
+        if platform_filter != 'all':
+            query += " AND platform = ?"
+            params.append(platform_filter)
+        if after:
+            crawl_time, deal_id = decode_cursor(after)
+            query += " AND (crawl_time, id) < (?, ?)"
+            params.extend([crawl_time, deal_id])
+        query += " ORDER BY crawl_time DESC, id DESC LIMIT ?"
+        params.append(limit + 1)  # 多取一筆用來判斷是否還有下一頁
+
         try:
-            conn = get_db_connection()
-            query = "SELECT * FROM daily_deals"
-            params = []
-            if platform_filter != 'all':
-                query += " WHERE platform = ?"
-                params.append(platform_filter)
-            query += " ORDER BY crawl_time DESC"
-            
-            deals = conn.execute(query, params).fetchall()
-            
-            # 取得各平台最後更新時間
-            update_times_rows = conn.execute("SELECT platform, MAX(crawl_time) as last_update FROM daily_deals GROUP BY platform").fetchall()
-            conn.close()
+            # 商品頁與彙總在同一個快照中讀取，不會與背景同步交錯
+            with read_snapshot() as conn:
+                rows = conn.execute(query, params).fetchall()
+                summary = daily_deals_by_platform(conn)
+
+            has_more = len(rows) > limit
+            deals = [dict(row) for row in rows[:limit]]
+            next_cursor = encode_cursor([deals[-1]['crawl_time'], deals[-1]['id']]) if has_more else None
 
-            platform_updates = {row['platform']: row['last_update'] for row in update_times_rows}
+            # 各平台最後更新時間（增量合併後以刷新紀錄為準，沒有紀錄時退回商品爬取時間）
+            platform_updates = {p.platform: p.refreshed_at or p.latest_crawl for p in summary.platforms}
+            if platform_filter == 'all':
+                total_deals = summary.total_deals
+            else:
+                total_deals = sum(p.deal_count for p in summary.platforms if p.platform == platform_filter)
 
             return {
-                'daily_deals': [dict(row) for row in deals],
-                'total_deals': len(deals),
-                'last_update': deals[0]['crawl_time'] if deals else '',
+                'daily_deals': deals,
+                'next_cursor': next_cursor,
+                'has_more': has_more,
+                'total_deals': total_deals,
+                'last_update': max(platform_updates.values()) if total_deals and platform_updates else '',
                 'platform_updates': platform_updates
             }
         except Exception as e:
@@ -110,16 +252,14 @@ class DatabaseService:
     def get_daily_deals_status(self, crawler_status):
         """獲取每日促銷狀態"""
         try:
-            conn = get_db_connection()
-            count = conn.execute("SELECT COUNT(*) FROM daily_deals").fetchone()[0]
-            latest_update = conn.execute("SELECT MAX(crawl_time) FROM daily_deals").fetchone()[0]
-            conn.close()
+            with read_snapshot() as conn:
+                status = daily_deals_status(conn)
             
             return {
                 'status': 'updating' if crawler_status['is_updating'] else 'idle',
                 'is_updating': crawler_status['is_updating'],
-                'total_deals': count,
-                'last_update': latest_update,
+                'total_deals': status.total_deals,
+                'last_update': status.last_update,
                 'start_time': crawler_status.get('start_time'),
                 'completion_time': crawler_status.get('completion_time')
             }
@@ -127,33 +267,18 @@ class DatabaseService:
             raise Exception(f'獲取狀態失敗: {str(e)}')
     
     def debug_daily_deals(self, crawler_status):
-        """調試用：檢查每日促銷狀態"""
+        """調試用：檢查每日促銷狀態（數量與最新時間在 SQL 中彙總，只取最近 10 筆商品）"""
         try:
-            conn = get_db_connection()
-            
-            # 獲取每日促銷資料
-            deals = conn.execute("SELECT * FROM daily_deals ORDER BY crawl_time DESC").fetchall()
-            
-            # 統計各平台數量
-            platform_counts = {}
-            latest_updates = {}
-            
-            for deal in deals:
-                platform = deal['platform']
-                platform_counts[platform] = platform_counts.get(platform, 0) + 1
-                
-                # 記錄最新更新時間
-                if platform not in latest_updates or deal['crawl_time'] > latest_updates[platform]:
-                    latest_updates[platform] = deal['crawl_time']
-            
-            conn.close()
+            with read_snapshot() as conn:
+                summary = daily_deals_by_platform(conn)
+                recent_deals = recent_daily_deals(conn, limit=10)
             
             return {
                 'crawler_status': crawler_status,
-                'total_deals': len(deals),
-                'platform_counts': platform_counts,
-                'latest_updates': latest_updates,
-                'recent_deals': [dict(deal) for deal in deals[:10]]  # 最近10個商品
+                'total_deals': summary.total_deals,
+                'platform_counts': {p.platform: p.deal_count for p in summary.platforms},
+                'latest_updates': {p.platform: p.latest_crawl for p in summary.platforms},
+                'recent_deals': recent_deals  # 最近10個商品
             }
             
         except Exception as e:
@@ -162,6 +287,19 @@ class DatabaseService:
                 'crawler_status': crawler_status
             }
     
+    def get_database_overview(self, prefer_replica=True):
+        """
+        資料庫統計概覽（單一彙總查詢）
+
+        Returns:
+            DatabaseOverview: 任務數、商品數、空任務數與任務時間範圍
+        """
+        try:
+            with read_snapshot(prefer_replica=prefer_replica) as conn:
+                return database_overview(conn)
+        except Exception as e:
+            raise Exception(f'讀取資料庫統計失敗: {str(e)}')
+    
     def get_sessions_to_filter(self):
         """獲取需要過濾的爬蟲任務"""
         try:
@@ -180,3 +318,28 @@ class DatabaseService:
             return [dict(row) for row in sessions_to_filter]
         except Exception as e:
             raise Exception(f'獲取需要過濾的任務失敗: {str(e)}')
+
+    def delete_session(self, session_id, timeout=None):
+        """
+        刪除指定的搜尋會話及其所有商品（以背景刪除任務分段執行並等待完成）
+
+        Returns:
+            Dict | None: keyword、deleted_products 與 job，會話不存在時返回 None
+        """
+        try:
+            with read_snapshot() as conn:
+                session = conn.execute('SELECT keyword FROM crawl_sessions WHERE id = ?', (session_id,)).fetchone()
+            if not session:
+                return None
+
+            job = get_purge_manager().purge_session(session_id)
+            job.wait(timeout)
+            if job.status == 'failed':
+                raise Exception(job.error)
+            return {
+                'keyword': session['keyword'],
+                'deleted_products': job.products_deleted,
+                'job': job.to_dict(),
+            }
+        except Exception as e:
+            raise Exception(f'刪除會話失敗: {str(e)}')
@@ -0,0 +1,177 @@
+"""
+每日促銷預先比對服務
+每日促銷更新完成後，在背景為新增或有變動的促銷商品預先找出其他平台的同款商品：
+
+- 候選商品取自歷史商品索引（剛完成的一般商品爬取已寫入），不逐一即時爬取
+- 每 DEAL_BATCH_SIZE 個促銷商品共用一個候選池，以 batch_compare_products 一次比較
+- 結果存入 deal_matches 表，促銷頁面點擊比較時直接讀取，不需要等待爬取與 AI
+"""
+
+import json
+import threading
+from datetime import datetime, timedelta
+
+from core.database import read_snapshot
+from core.db_writer import get_db_writer
+
+# 每個批量提示詞包含的促銷商品數與每個促銷商品取用的歷史候選數
+DEAL_BATCH_SIZE = 8
+CANDIDATES_PER_DEAL = 15
+
+# 預先比對結果的有效時間（超過後下次更新時重新比對，納入新爬取的候選）
+MATCH_TTL_HOURS = 24
+
+
+def _store_deal_match(conn, deal, similar_products, total_candidates, total_matches, computed_at):
+    """寫入工作：儲存（或覆蓋）一個促銷商品的預先比對結果"""
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO deal_matches (
+            deal_id, deal_updated_at, similar_products, total_candidates, total_matches, computed_at
+        ) VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (
+            deal['id'], deal['updated_at'], json.dumps(similar_products, ensure_ascii=False),
+            total_candidates, total_matches, computed_at
+        )
+    )
+
+
+class DealMatchService:
+    """在背景為每日促銷商品預先計算跨平台比對結果"""
+
+    def __init__(self, comparison_service):
+        self.comparison_service = comparison_service
+        self._thread = None
+        self._lock = threading.Lock()
+        self.status = {
+            'is_running': False,
+            'start_time': None,
+            'completion_time': None,
+            'pending': 0,
+            'processed': 0,
+            'stored': 0,
+            'failed_batches': 0,
+            'error': None,
+        }
+
+    def get_status(self):
+        return self.status.copy()
+
+    def start(self):
+        """在背景開始預先比對（已在執行中時不重複啟動）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return {'status': 'warning', 'message': '預先比對正在執行中'}
+            if not self.comparison_service.model:
+                return {'status': 'error', 'message': 'AI 模型未配置，無法預先比對'}
+            self._thread = threading.Thread(target=self.run, name='deal-matches', daemon=True)
+            self._thread.start()
+        return {'status': 'success', 'message': '每日促銷預先比對已開始'}
+
+    def _pending_deals(self):
+        """尚未比對、商品內容有變動或結果已過期的有效促銷商品"""
+        stale_before = (datetime.now() - timedelta(hours=MATCH_TTL_HOURS)).isoformat()
+        with read_snapshot() as conn:
+            rows = conn.execute(
+                """
+                SELECT d.id, d.title, d.platform, d.price, d.updated_at
+                FROM daily_deals d
+                LEFT JOIN deal_matches m ON m.deal_id = d.id
+                WHERE d.is_expired = 0
+                  AND (m.deal_id IS NULL OR m.deal_updated_at IS NOT d.updated_at OR m.computed_at < ?)
+                ORDER BY d.id
+                """,
+                (stale_before,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _candidate_pool(self, deals):
+        """批次中各促銷商品的歷史候選（排除促銷商品自己的平台），依 URL 去重後合併"""
+        pool = []
+        seen_urls = set()
+        for deal in deals:
+            for candidate in self.comparison_service.find_history_candidates(
+                deal, CANDIDATES_PER_DEAL, exclude_platform=deal['platform']
+            ):
+                if candidate['url'] in seen_urls:
+                    continue
+                seen_urls.add(candidate['url'])
+                pool.append(candidate)
+        return pool
+
+    def _process_batch(self, deals):
+        """比較一批促銷商品並儲存結果；模型呼叫失敗時不儲存，下次更新時重試"""
+        computed_at = datetime.now().isoformat()
+        pool = self._candidate_pool(deals)
+        writer = get_db_writer()
+        if not pool:
+            for deal in deals:
+                writer.execute(_store_deal_match, deal, [], 0, 0, computed_at)
+            return len(deals)
+
+        batch_results = self.comparison_service.batch_compare_products(deals, pool, feature='deal_matches')
+        if not batch_results:
+            self.status['failed_batches'] += 1
+            return 0
+
+        stored = 0
+        for target_index, deal in enumerate(deals):
+            if target_index not in batch_results:
+                continue
+            matches = batch_results[target_index]
+            similar_products = self.comparison_service.build_similar_products(matches, pool)
+            writer.execute(_store_deal_match, deal, similar_products, len(pool), len(matches), computed_at)
+            stored += 1
+        return stored
+
+    def run(self):
+        """比對所有待處理的促銷商品（同步執行；start() 會在背景執行緒中呼叫）"""
+        self.status.update({
+            'is_running': True, 'start_time': datetime.now().isoformat(), 'completion_time': None,
+            'processed': 0, 'stored': 0, 'failed_batches': 0, 'error': None,
+        })
+        try:
+            deals = self._pending_deals()
+            self.status['pending'] = len(deals)
+            print(f"🧮 開始預先比對 {len(deals)} 個每日促銷商品")
+            for offset in range(0, len(deals), DEAL_BATCH_SIZE):
+                batch = deals[offset:offset + DEAL_BATCH_SIZE]
+                self.status['stored'] += self._process_batch(batch)
+                self.status['processed'] += len(batch)
+            print(f"✅ 每日促銷預先比對完成：{self.status['stored']} / {len(deals)} 個已儲存，"
+                  f"{self.status['failed_batches']} 個批次失敗")
+        except Exception as e:
+            self.status['error'] = str(e)
+            print(f"❌ 每日促銷預先比對失敗: {e}")
+            import traceback
+            traceback.print_exc()
+        finally:
+            self.status.update({'is_running': False, 'completion_time': datetime.now().isoformat()})
+
+    def get_deal_matches(self, deal_id):
+        """
+        讀取促銷商品的預先比對結果
+
+        Returns:
+            dict | None: 與即時比較相同格式的結果（source 為 'precomputed'）；尚未比對或商品已變動時返回 None
+        """
+        with read_snapshot() as conn:
+            row = conn.execute(
+                """
+                SELECT m.*, d.title, d.platform, d.price
+                FROM deal_matches m JOIN daily_deals d ON d.id = m.deal_id
+                WHERE m.deal_id = ? AND m.deal_updated_at IS d.updated_at
+                """,
+                (deal_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            'similarProducts': json.loads(row['similar_products']),
+            'totalCandidates': row['total_candidates'],
+            'totalMatches': row['total_matches'],
+            'targetProduct': {'title': row['title'], 'platform': row['platform'], 'price': row['price']},
+            'source': 'precomputed',
+            'computedAt': row['computed_at'],
+        }
@@ -1,45 +1,418 @@
 """
 商品比較服務模組
 使用 Gemini AI 進行智能商品比較
+
+比較結果快取在 product_comparison_cache 表：以正規化後的目標商品標題指紋為鍵，
+超過 TTL 視為過期。有新爬取的商品時，以下快取會失效：
+
+- 以同一個搜尋關鍵字取得候選的快取（在寫入商品的同一交易中）
+- 目標商品標題與任一新商品標題共用 MinHash/LSH bucket 的快取（目標標題寫入快取時一併建立索引；
+  在背景標題索引為新商品建立索引的同一交易中），
+  所以同款或近似標題的新商品也會讓快取失效，而不只限於關鍵字完全相同的爬取；
+  Jaccard 低於約 0.5 的標題不一定共用 bucket，這類快取仍以 TTL 到期為準
 """
 
+import hashlib
 import json
 import re
+import threading
+import unicodedata
+from datetime import datetime, timedelta
+
+from core.database import read_snapshot
+from core.db_writer import get_db_writer
+from core.embeddings import get_embedding_index, get_embedding_syncer
+from core.llm_gateway import get_llm_gateway
+from core.minhash import (SOURCE_COMPARISON_CACHE, SOURCE_PRODUCTS, delete_from_index, find_similar,
+                          index_buckets, title_buckets)
+from core.ranking import bm25_scores, estimate_tokens, select_top_k
+
+# 比較結果快取的有效時間
+COMPARISON_CACHE_TTL_HOURS = 24
+
+# 送給模型的候選清單 token 預算與數量上限（單一比較 / 批量比較）
+CANDIDATE_TOKEN_BUDGET = 1500
+BATCH_CANDIDATE_TOKEN_BUDGET = 3000
+MAX_CANDIDATES = 40
+BATCH_MAX_CANDIDATES = 100
+
+# 預排序前先將候選依標題等欄位排成固定順序（選出的候選也依此順序放進提示詞）：
+# 同一組候選不論爬取結果的順序如何，提示詞都相同，可以命中 LLM 回應快取
+CANONICAL_CANDIDATE_ORDER = True
+
+# 串流比較時，AI 結果出來之前先顯示的本地預排序候選數
+PREVIEW_SIZE = 12
+
+# 正規化標題時移除的促銷字詞與符號
+_PROMO_WORDS = ('限時', '特價', '促銷', '優惠', '折扣', '免運', '現貨', '熱銷',
+                '新款', '正品', '官方', '代理', '公司貨')
+_SYMBOLS_PATTERN = re.compile(r'[【】\[\]()（）★☆▶▷※◆◇■□|/\\,，、!！~～\-_+*#&]+')
+
+
+def normalize_title(title):
+    """正規化商品標題：全半形統一、轉小寫、移除促銷字詞與符號、合併空白"""
+    text = unicodedata.normalize('NFKC', title or '').lower()
+    for word in _PROMO_WORDS:
+        text = text.replace(word, ' ')
+    text = _SYMBOLS_PATTERN.sub(' ', text)
+    return ' '.join(text.split())
+
+
+def title_fingerprint(title):
+    """正規化標題的指紋（快取鍵）"""
+    return hashlib.sha1(normalize_title(title).encode('utf-8')).hexdigest()
+
+
+def invalidate_comparison_cache(cursor, search_keyword=None, fingerprint=None):
+    """
+    使比較快取失效（在呼叫端的交易中執行）
+
+    Args:
+        cursor: 資料庫 cursor
+        search_keyword (str): 刪除以此關鍵字取得候選商品的快取（該關鍵字有新商品時呼叫）
+        fingerprint (str): 刪除指定目標商品的快取
+        兩者都為 None 時清除全部
+
+    Returns:
+        int: 刪除的快取數
+    """
+    if search_keyword is not None:
+        cursor.execute("DELETE FROM product_comparison_cache WHERE search_keyword = ?", (search_keyword,))
+    elif fingerprint is not None:
+        cursor.execute("DELETE FROM product_comparison_cache WHERE fingerprint = ?", (fingerprint,))
+    else:
+        cursor.execute("DELETE FROM product_comparison_cache")
+    deleted = cursor.rowcount
+    if deleted:
+        _prune_cache_index(cursor)
+    return deleted
+
+
+def invalidate_similar_comparisons(cursor, bucket_lists):
+    """
+    使目標商品標題與新商品標題共用 LSH bucket 的比較快取失效（在為新商品建立標題索引的交易中執行）
+
+    Args:
+        cursor: 資料庫 cursor
+        bucket_lists: 每個新商品標題的 title_buckets 結果
+
+    Returns:
+        int: 刪除的快取數
+    """
+    # 快取筆數遠少於新商品數，以快取目標的 bucket 建立查找表，逐一比對新商品的 bucket
+    cached = {}
+    for bucket, item_id in cursor.execute(
+        "SELECT bucket, item_id FROM title_lsh_buckets WHERE source = ?", (SOURCE_COMPARISON_CACHE,)
+    ).fetchall():
+        cached.setdefault(bucket, set()).add(item_id)
+    if not cached:
+        return 0
+
+    stale_ids = set()
+    for buckets in bucket_lists:
+        for bucket in buckets:
+            if bucket in cached:
+                stale_ids.update(cached[bucket])
+    if not stale_ids:
+        return 0
+
+    stale_ids = sorted(stale_ids)
+    deleted = 0
+    for offset in range(0, len(stale_ids), 500):
+        chunk = stale_ids[offset:offset + 500]
+        cursor.execute(
+            f"DELETE FROM product_comparison_cache WHERE id IN ({','.join('?' * len(chunk))})", chunk
+        )
+        deleted += cursor.rowcount
+    delete_from_index(cursor, SOURCE_COMPARISON_CACHE, stale_ids)
+    return deleted
+
+
+def _prune_cache_index(cursor):
+    """移除已不存在的快取的標題索引"""
+    cursor.execute(
+        """
+        DELETE FROM title_lsh_buckets
+        WHERE source = ? AND item_id NOT IN (SELECT id FROM product_comparison_cache)
+        """,
+        (SOURCE_COMPARISON_CACHE,)
+    )
 
 
 class ProductComparisonService:
     """商品比較服務類別"""
     
-    def __init__(self, gemini_model=None):
+    def __init__(self, gemini_model=None, cache_ttl_hours=COMPARISON_CACHE_TTL_HOURS):
         self.model = gemini_model
         self.similarity_threshold = 0.80
+        self.cache_ttl = timedelta(hours=cache_ttl_hours)
+        self._metrics_lock = threading.Lock()
+        self.cache_metrics = {'hits': 0, 'misses': 0, 'expired': 0, 'stores': 0, 'invalidations': 0}
+
+    def _count(self, key, amount=1):
+        with self._metrics_lock:
+            self.cache_metrics[key] += amount
+
+    def get_cached_comparison(self, target_product):
+        """
+        讀取目標商品的比較快取
+
+        Returns:
+            dict | None: 與即時比較相同格式的結果（source 為 'cache'），沒有或已過期時返回 None
+        """
+        fingerprint = title_fingerprint(target_product.get('title', ''))
+        now = datetime.now().isoformat()
+        with read_snapshot() as conn:
+            row = conn.execute(
+                "SELECT * FROM product_comparison_cache WHERE fingerprint = ?", (fingerprint,)
+            ).fetchone()
+
+        if row is None:
+            self._count('misses')
+            return None
+        if row['expires_at'] <= now:
+            self._count('misses')
+            self._count('expired')
+            return None
+
+        self._count('hits')
+        get_db_writer().submit(
+            lambda conn: conn.execute(
+                "UPDATE product_comparison_cache SET hit_count = hit_count + 1 WHERE fingerprint = ?", (fingerprint,)
+            )
+        )
+        return {
+            'similarProducts': json.loads(row['similar_products']),
+            'totalCandidates': row['total_candidates'],
+            'totalMatches': row['total_matches'],
+            'targetProduct': target_product,
+            'source': 'cache',
+            'cachedAt': row['cache_time'],
+            'expiresAt': row['expires_at'],
+        }
+
+    def store_comparison(self, target_product, search_keyword, result):
+        """寫入（或覆蓋）目標商品的比較結果快取，並順便清除已過期的快取"""
+        title = target_product.get('title', '')
+        now = datetime.now()
+        fingerprint = title_fingerprint(title)
+        # 目標標題的 LSH bucket 在寫入執行緒之外算好，新商品與它相近時用來使快取失效
+        buckets = title_buckets(title)
+
+        def write(conn):
+            cursor = conn.cursor()
+            if cursor.execute("DELETE FROM product_comparison_cache WHERE expires_at <= ?",
+                              (now.isoformat(),)).rowcount:
+                _prune_cache_index(cursor)
+            conn.execute("""
+                INSERT INTO product_comparison_cache (
+                    fingerprint, normalized_title, target_title, search_keyword, similar_products,
+                    total_candidates, total_matches, hit_count, cache_time, expires_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?, ?)
+                ON CONFLICT(fingerprint) DO UPDATE SET
+                    target_title = excluded.target_title,
+                    search_keyword = excluded.search_keyword,
+                    similar_products = excluded.similar_products,
+                    total_candidates = excluded.total_candidates,
+                    total_matches = excluded.total_matches,
+                    hit_count = 0,
+                    cache_time = excluded.cache_time,
+                    expires_at = excluded.expires_at
+            """, (
+                fingerprint, normalize_title(title), title, search_keyword,
+                json.dumps(result['similarProducts'], ensure_ascii=False),
+                result.get('totalCandidates', 0), result.get('totalMatches', 0),
+                now.isoformat(), (now + self.cache_ttl).isoformat(),
+            ))
+            cache_id = conn.execute(
+                "SELECT id FROM product_comparison_cache WHERE fingerprint = ?", (fingerprint,)
+            ).fetchone()[0]
+            index_buckets(cursor, SOURCE_COMPARISON_CACHE, [(cache_id, buckets)])
+
+        get_db_writer().execute(write)
+        self._count('stores')
+
+    def invalidate_cache(self, search_keyword=None, target_title=None):
+        """使比較快取失效（依關鍵字、目標商品，或全部），返回刪除的快取數"""
+        fingerprint = title_fingerprint(target_title) if target_title else None
+        deleted = get_db_writer().execute(
+            lambda conn: invalidate_comparison_cache(conn.cursor(), search_keyword, fingerprint)
+        )
+        self._count('invalidations', deleted)
+        return deleted
+
+    def get_cache_metrics(self):
+        """快取命中率與目前的快取筆數"""
+        with self._metrics_lock:
+            metrics = dict(self.cache_metrics)
+        lookups = metrics['hits'] + metrics['misses']
+        metrics['hit_rate'] = round(metrics['hits'] / lookups, 4) if lookups else None
+        with read_snapshot() as conn:
+            row = conn.execute("""
+                SELECT COUNT(*) AS entries,
+                       SUM(CASE WHEN expires_at > ? THEN 1 ELSE 0 END) AS live_entries,
+                       COALESCE(SUM(hit_count), 0) AS stored_hits
+                FROM product_comparison_cache
+            """, (datetime.now().isoformat(),)).fetchone()
+        metrics.update({
+            'entries': row['entries'],
+            'live_entries': row['live_entries'] or 0,
+            'stored_hits': row['stored_hits'],
+            'ttl_hours': self.cache_ttl.total_seconds() / 3600,
+        })
+        return metrics
     
+    def find_history_candidates(self, target_product, k=MAX_CANDIDATES, exclude_platform=None):
+        """
+        從歷史商品中找出與目標商品標題相近的候選（不爬取、不呼叫 AI）
+
+        有 NumPy 且向量索引已建立時使用標題向量 IVF 索引（新寫入的商品由背景同步，查詢不等待），
+        否則退回 MinHash/LSH 索引。
+
+        Returns:
+            list: 與即時爬取候選相同格式的商品（source_table 為 'history'），含 similarity，依相似度排序
+        """
+        title = target_product.get('title', '')
+        index = get_embedding_index()
+        if index is not None:
+            get_embedding_syncer().notify()
+        if index is None or not index.count:
+            matches = find_similar(title, k, sources=(SOURCE_PRODUCTS,), exclude_platform=exclude_platform)
+        else:
+            with read_snapshot() as conn:
+                # 多取一些，扣除已刪除、同 URL 與排除平台的商品後仍有 k 個
+                hits = index.search(title, k * 3)
+                scores = dict(hits)
+                rows = conn.execute(
+                    f"SELECT id, platform, title, price, url, image_url FROM products WHERE id IN ({','.join('?' * len(hits))})",
+                    [pid for pid, _ in hits]
+                ).fetchall() if hits else []
+            matches = []
+            seen_urls = set()
+            for row in sorted(rows, key=lambda r: scores[r['id']], reverse=True):
+                if row['url'] in seen_urls or (exclude_platform and row['platform'] == exclude_platform):
+                    continue
+                seen_urls.add(row['url'])
+                matches.append({**dict(row), 'similarity': round(scores[row['id']], 4)})
+                if len(matches) >= k:
+                    break
+
+        return [{
+            'title': match['title'],
+            'platform': match['platform'],
+            'price': match['price'],
+            'url': match['url'],
+            'image_url': match.get('image_url', ''),
+            'similarity': match['similarity'],
+            'source_table': 'history',
+        } for match in matches]
+
+    def _prerank_candidates(self, target_titles, candidate_products, token_budget, max_candidates):
+        """
+        以本地 BM25 預排序候選商品，在 token 預算內保留最相關的前 K 個
+
+        Returns:
+            list: 選中的原始候選索引（依相關度排序；CANONICAL_CANDIDATE_ORDER 時依候選內容排序）
+        """
+        order = list(range(len(candidate_products)))
+        if CANONICAL_CANDIDATE_ORDER:
+            order.sort(key=lambda i: self._candidate_sort_key(candidate_products[i]))
+        products = [candidate_products[i] for i in order]
+
+        titles = [product.get('title', '') or product.get('name', '') for product in products]
+        scores = bm25_scores(target_titles, titles)
+        costs = [estimate_tokens(self._format_candidate_line(i, product)) for i, product in enumerate(products)]
+        selected = select_top_k(scores, costs, token_budget, max_candidates)
+        print(f"📉 候選預排序: {len(candidate_products)} → {len(selected)} 個，"
+              f"候選清單約 {sum(costs[i] for i in selected)} / {sum(costs)} tokens")
+        if CANONICAL_CANDIDATE_ORDER:
+            selected.sort()
+        return [order[i] for i in selected]
+
+    @staticmethod
+    def _candidate_sort_key(product):
+        return (
+            product.get('title', '') or product.get('name', ''), str(product.get('platform', '')),
+            str(product.get('price', '')), str(product.get('url', ''))
+        )
+
+    @staticmethod
+    def _remap_matches(matches, selected):
+        """把模型回傳的索引（預排序後清單中的位置）換回原始候選索引，丟棄超出範圍的結果"""
+        remapped = []
+        for match in matches:
+            index = match.get('index')
+            if isinstance(index, int) and 0 <= index < len(selected):
+                remapped.append({**match, 'index': selected[index]})
+        return remapped
+
+    def preview_candidates(self, target_product, candidate_products, limit=PREVIEW_SIZE):
+        """
+        只以本地 BM25 分數排序候選商品（不呼叫模型），供 AI 比對完成前先行顯示
+
+        Returns:
+            list: 分數大於 0 的前 limit 個候選（附 score），依分數排序
+        """
+        titles = [product.get('title', '') or product.get('name', '') for product in candidate_products]
+        scores = bm25_scores([target_product.get('title', '')], titles)
+        ranked = sorted(range(len(candidate_products)), key=lambda i: (-scores[i], i))
+        return [
+            {**candidate_products[i], 'score': round(scores[i], 3)}
+            for i in ranked[:limit] if scores[i] > 0
+        ]
+
+    def build_similar_products(self, matches, candidate_products):
+        """將模型的匹配結果轉為相似度達門檻的候選商品列表（含相似度與理由），依相似度排序"""
+        similar_products = []
+        for match in matches:
+            similarity = match.get('similarity', 0)
+            if similarity >= self.similarity_threshold:
+                try:
+                    product_index = match['index']
+                    if 0 <= product_index < len(candidate_products):
+                        product = dict(candidate_products[product_index])
+                        product['similarity'] = similarity
+                        product['reason'] = match.get('reason', '')
+                        product['confidence'] = match.get('confidence', '')
+                        product['category'] = match.get('category', '')
+                        similar_products.append(product)
+                except (IndexError, KeyError, TypeError) as parse_error:
+                    print(f"解析比較結果時發生錯誤: {parse_error}")
+                    continue
+
+        similar_products.sort(key=lambda x: x.get('similarity', 0), reverse=True)
+        return similar_products
+
     def compare_products(self, target_product, candidate_products):
-        """比較單個目標商品與候選商品"""
+        """
+        比較單個目標商品與候選商品
+
+        候選商品先經本地預排序，只有最相關的前 K 個送給模型；
+        回傳的 index 仍對應傳入的 candidate_products。
+        """
         if not self.model: 
             print("❌ AI 模型未初始化")
             return []
         
-        max_candidates = 40
-    
-        if len(candidate_products) > max_candidates:
-            print(f"候選商品數量 {len(candidate_products)} 超過限制，僅取前 {max_candidates} 個")
-            candidate_products = candidate_products[:max_candidates]
+        selected = self._prerank_candidates(
+            [target_product.get('title', '')], candidate_products, CANDIDATE_TOKEN_BUDGET, MAX_CANDIDATES
+        )
+        candidate_products = [candidate_products[i] for i in selected]
         
         try:
             print(f"🤖 開始 AI 比較，目標商品: {target_product.get('title', '')[:50]}...")
             prompt = self._create_comparison_prompt(target_product, candidate_products)
             print(f"📝 提示詞長度: {len(prompt)} 字元")
             
-            response = self.model.generate_content(prompt)
+            # 無法解析的回應由閘道記錄為 parse_error 且不快取（token 與延遲見 /api/metrics/llm）
+            response = get_llm_gateway().generate_content(
+                self.model, prompt, validate=self._is_valid_comparison_response, feature='compare'
+            )
             response_text = response.text
-            print(f"🤖 AI 原始回應長度: {len(response_text)} 字元")
-            print(f"🤖 AI 原始回應內容:\n{response_text}")
-            # # 顯示消耗tokens total_token_count
-            # total_token_count = response.usage.total_tokens
-            print(f"🪙 消耗 tokens: {response.usage_metadata.total_token_count}")
+            print(f"🤖 AI 回應長度: {len(response_text)} 字元")
             
-            matches = self._parse_comparison_result(response_text)
+            matches = self._remap_matches(self._parse_comparison_result(response_text), selected)
             print(f"✅ 解析結果: {len(matches)} 個匹配項目")
             return matches
         except Exception as e:
@@ -48,27 +421,34 @@ class ProductComparisonService:
             traceback.print_exc()
             return []
     
-    def batch_compare_products(self, target_products, candidate_products):
-        """批量比較多個目標商品與候選商品"""
+    def batch_compare_products(self, target_products, candidate_products, feature='batch_compare'):
+        """批量比較多個目標商品與候選商品（feature 為記錄 LLM 指標時的功能名稱）"""
         if not self.model: 
             print("❌ AI 模型未初始化")
             return {}
         
-        max_candidates = 100  # 批量處理時稍微提高限制
-        if len(candidate_products) > max_candidates:
-            print(f"候選商品數量 {len(candidate_products)} 超過限制，僅取前 {max_candidates} 個")
-            candidate_products = candidate_products[:max_candidates]
+        # 批量處理時預算與上限稍微提高，分數取各目標商品中的最高者
+        selected = self._prerank_candidates(
+            [target.get('title', '') for target in target_products], candidate_products,
+            BATCH_CANDIDATE_TOKEN_BUDGET, BATCH_MAX_CANDIDATES
+        )
+        candidate_products = [candidate_products[i] for i in selected]
         
         try:
             print(f"🤖 開始批量 AI 比較，目標商品數: {len(target_products)}")
             prompt = self._create_batch_comparison_prompt(target_products, candidate_products)
             print(f"📝 批量提示詞長度: {len(prompt)} 字元")
             
-            response = self.model.generate_content(prompt)
+            response = get_llm_gateway().generate_content(
+                self.model, prompt, validate=self._is_valid_batch_comparison_response, feature=feature
+            )
             response_text = response.text
             print(f"🤖 AI 批量回應長度: {len(response_text)} 字元")
             
-            batch_results = self._parse_batch_comparison_result(response_text)
+            batch_results = {
+                target_index: self._remap_matches(matches, selected)
+                for target_index, matches in self._parse_batch_comparison_result(response_text).items()
+            }
             print(f"✅ 批量解析結果: {len(batch_results)} 個目標商品的比較結果")
             return batch_results
         except Exception as e:
@@ -150,99 +530,81 @@ class ProductComparisonService:
 必須為每個目標商品回傳至少1個匹配結果，除非候選商品完全無關。重要：請確保返回的index值在0到{len(candidate_products)-1}之間。"""
         return prompt
 
+    def _format_candidate_line(self, index, product):
+        """格式化單一候選商品（預排序估算 token 時也使用同一格式）"""
+        title = product.get('title', '') or product.get('name', '')
+        platform = product.get('platform', '')
+        price = product.get('price', 0)
+        
+        # 截取標題但保留重要信息
+        if len(title) > 100:
+            title = title[:100] + "..."
+        
+        return f"{index}. {title} | {platform} | ${price}\n"
+
     def _format_candidate_products(self, products):
         """格式化候選商品列表"""
-        formatted = []
-        for i, product in enumerate(products):
-            title = product.get('title', '') or product.get('name', '')
-            platform = product.get('platform', '')
-            price = product.get('price', 0)
-            
-            # 截取標題但保留重要信息
-            if len(title) > 100:
-                title = title[:100] + "..."
-            
-            product_info = f"{i}. {title} | {platform} | ${price}\n"
-            formatted.append(product_info)
-        return "".join(formatted)
+        return "".join(self._format_candidate_line(i, product) for i, product in enumerate(products))
+
+    @staticmethod
+    def _parse_comparison_result(response_text):
+        """解析 AI 比較結果；格式不正確時拋出例外"""
+        clean_text = response_text.strip().replace('```json', '').replace('```', '')
+        if not clean_text.startswith('{'):
+            start_brace = clean_text.find('{')
+            end_brace = clean_text.rfind('}')
+            if start_brace == -1 or end_brace <= start_brace:
+                raise ValueError('無法找到 JSON 格式')
+            clean_text = clean_text[start_brace:end_brace+1]
 
-    def _parse_comparison_result(self, response_text):
-        """解析 AI 比較結果"""
         try:
-            print(f"🔧 開始解析 AI 回應...")
-            
-            # 儲存完整回應到檔案以便調試
-            with open('debug_ai_response.txt', 'w', encoding='utf-8') as f:
-                f.write(response_text)
-            print(f"🔧 AI 完整回應已儲存到 debug_ai_response.txt")
-            
-            clean_text = response_text.strip().replace('```json', '').replace('```', '')
-            print(f"🔧 清理後文本前200字元: {clean_text[:200]}")
-            
-            if not clean_text.startswith('{'):
-                start_brace = clean_text.find('{')
-                end_brace = clean_text.rfind('}')
-                if start_brace != -1 and end_brace != -1:
-                    clean_text = clean_text[start_brace:end_brace+1]
-                    print(f"🔧 提取的 JSON 部分前200字元: {clean_text[:200]}")
-                else:
-                    print(f"❌ 無法找到 JSON 格式")
-                    return []
-                    
             result = json.loads(clean_text)
-            matches = result.get('matches', [])
-            print(f"✅ JSON 解析成功，找到 {len(matches)} 個匹配項目")
-            for i, match in enumerate(matches):
-                print(f"   {i+1}. 索引:{match.get('index')}, 相似度:{match.get('similarity')}")
-            return matches
-        except json.JSONDecodeError as e:
-            print(f"❌ JSON 解析失敗: {e}")
-            print(f"❌ 嘗試解析的文本前500字元: {response_text[:500]}")
-            
-            # 嘗試修復常見的 JSON 格式問題
-            try:
-                # 移除可能的前綴文字
-                if '{"matches":' in response_text:
-                    start_idx = response_text.find('{"matches":')
-                    end_idx = response_text.rfind('}')
-                    if end_idx > start_idx:
-                        fixed_json = response_text[start_idx:end_idx+1]
-                        result = json.loads(fixed_json)
-                        matches = result.get('matches', [])
-                        print(f"✅ 修復後 JSON 解析成功，找到 {len(matches)} 個匹配項目")
-                        return matches
-            except Exception as fix_error:
-                print(f"❌ JSON 修復嘗試失敗: {fix_error}")
-            
-            return []
-        except Exception as e:
-            print(f"❌ 其他解析錯誤: {e}")
-            return []
+        except json.JSONDecodeError:
+            # 移除可能的前綴文字後再試一次
+            start_idx = response_text.find('{"matches":')
+            end_idx = response_text.rfind('}')
+            if start_idx == -1 or end_idx <= start_idx:
+                raise
+            result = json.loads(response_text[start_idx:end_idx+1])
 
-    def _parse_batch_comparison_result(self, response_text):
-        """解析批量比較結果"""
-        batch_results = {}
+        if not isinstance(result, dict) or not isinstance(result.get('matches'), list):
+            raise ValueError('matches 不是列表')
+        return result['matches']
+
+    def _is_valid_comparison_response(self, response_text):
         try:
-            # 清理回應內容
-            response_text = response_text.strip()
-            if response_text.startswith('```json'):
-                response_text = response_text[7:]
-            if response_text.endswith('```'):
-                response_text = response_text[:-3]
-            
-            # 解析JSON
-            data = json.loads(response_text)
-            
-            # 轉換為我們需要的格式
-            for key, value in data.items():
-                if key.startswith('target_'):
-                    target_index = int(key.split('_')[1]) - 1  # 轉換為0-based index
-                    matches = value.get('matches', [])
-                    batch_results[target_index] = matches
-                    
-        except Exception as e:
-            print(f"❌ 批量比較結果解析失敗: {e}")
-            print(f"原始回應: {response_text}")
-            batch_results = {}
-        
+            self._parse_comparison_result(response_text)
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _parse_batch_comparison_result(response_text):
+        """解析批量比較結果（target_N -> matches）；格式不正確時拋出例外"""
+        response_text = response_text.strip()
+        if response_text.startswith('```json'):
+            response_text = response_text[7:]
+        if response_text.endswith('```'):
+            response_text = response_text[:-3]
+
+        data = json.loads(response_text)
+        if not isinstance(data, dict):
+            raise ValueError('批量比較結果不是 JSON 物件')
+
+        # 轉換為我們需要的格式
+        batch_results = {}
+        for key, value in data.items():
+            if key.startswith('target_'):
+                target_index = int(key.split('_')[1]) - 1  # 轉換為0-based index
+                matches = value.get('matches', [])
+                if not isinstance(matches, list):
+                    raise ValueError(f'{key} 的 matches 不是列表')
+                batch_results[target_index] = matches
         return batch_results
+
+    def _is_valid_batch_comparison_response(self, response_text):
+        try:
+            self._parse_batch_comparison_result(response_text)
+            return True
+        except Exception:
+            return False
@@ -0,0 +1,196 @@
+"""
+爬取任務統計快取
+在寫入商品時同步維護 session_stats 表，讓統計頁面只需讀取一列資料
+"""
+
+import json
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import core.database as database
+from core.db_writer import get_db_writer
+
+# 預先計算的價格百分位數
+PERCENTILES = (25, 50, 75, 90)
+
+
+def _percentile(sorted_prices: List[int], pct: int) -> Optional[float]:
+    """以線性內插計算已排序價格列表的百分位數"""
+    if not sorted_prices:
+        return None
+    if len(sorted_prices) == 1:
+        return float(sorted_prices[0])
+    rank = (len(sorted_prices) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_prices) - 1)
+    weight = rank - lower
+    return sorted_prices[lower] + (sorted_prices[upper] - sorted_prices[lower]) * weight
+
+
+def _summarize(prices: List[int]) -> Dict:
+    """計算一組（已排序）價格的數量、最小、最大、平均與百分位數"""
+    count = len(prices)
+    return {
+        'product_count': count,
+        'min_price': prices[0] if count else None,
+        'max_price': prices[-1] if count else None,
+        'average_price': sum(prices) / count if count else None,
+        'percentiles': {f'p{pct}': _percentile(prices, pct) for pct in PERCENTILES},
+    }
+
+
+def refresh_session_stats(cursor, session_id: int):
+    """
+    重新計算指定 session 的統計並寫入 session_stats
+
+    必須使用呼叫端的 cursor，讓統計與商品寫入落在同一個交易中，
+    由呼叫端負責 commit。
+
+    Args:
+        cursor: 資料庫 cursor（與商品寫入共用同一個連線）
+        session_id (int): 爬取任務 ID
+    """
+    rows = cursor.execute(
+        "SELECT platform, price, is_filtered_out FROM products WHERE session_id = ? ORDER BY price",
+        (session_id,)
+    ).fetchall()
+
+    all_prices = []
+    platform_prices: Dict[str, List[int]] = {}
+    platform_counts: Dict[str, int] = {}
+    filtered_count = 0
+    for platform, price, is_filtered_out in rows:
+        # 與原本 SQL 聚合一致：NULL 價格計入數量但不參與價格統計
+        platform_prices.setdefault(platform, [])
+        platform_counts[platform] = platform_counts.get(platform, 0) + 1
+        if price is not None:
+            all_prices.append(price)
+            platform_prices[platform].append(price)
+        if is_filtered_out:
+            filtered_count += 1
+
+    overall = _summarize(all_prices)
+    platform_stats = {}
+    for platform, prices in platform_prices.items():
+        summary = _summarize(prices)
+        summary['product_count'] = platform_counts[platform]
+        platform_stats[platform] = summary
+
+    cursor.execute(
+        """
+        INSERT OR REPLACE INTO session_stats (
+            session_id, product_count, filtered_count, min_price, max_price, avg_price,
+            p25_price, p50_price, p75_price, p90_price, platform_stats, updated_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            session_id,
+            len(rows),
+            filtered_count,
+            overall['min_price'],
+            overall['max_price'],
+            overall['average_price'],
+            overall['percentiles']['p25'],
+            overall['percentiles']['p50'],
+            overall['percentiles']['p75'],
+            overall['percentiles']['p90'],
+            json.dumps(platform_stats, ensure_ascii=False),
+            datetime.now().isoformat()
+        )
+    )
+
+
+def delete_session_stats(cursor, session_ids: List[int]):
+    """刪除指定 session 的統計（與刪除 session 在同一交易中執行）"""
+    if not session_ids:
+        return
+    cursor.executemany(
+        "DELETE FROM session_stats WHERE session_id = ?",
+        [(sid,) for sid in session_ids]
+    )
+
+
+def _fetch_stats_row(conn, session_id: int):
+    return conn.execute(
+        """
+        SELECT s.keyword, s.total_products, st.*
+        FROM crawl_sessions s
+        LEFT JOIN session_stats st ON st.session_id = s.id
+        WHERE s.id = ?
+        """,
+        (session_id,)
+    ).fetchone()
+
+
+def get_session_stats(conn, session_id: int) -> Optional[Dict]:
+    """
+    讀取 session 的統計資料
+
+    若統計列尚未建立（例如舊資料），會即時補算一次並寫回。
+
+    Returns:
+        Dict | None: 統計資料，session 不存在時返回 None
+    """
+    row = _fetch_stats_row(conn, session_id)
+
+    if row is None:
+        return None
+
+    if row['updated_at'] is None:
+        get_db_writer().execute(lambda write_conn: refresh_session_stats(write_conn.cursor(), session_id))
+        row = _fetch_stats_row(conn, session_id)
+        if row is not None and row['updated_at'] is None:
+            # 呼叫端的連線處於讀取快照中，看不到剛寫入的統計，改用新連線讀回
+            fresh_conn = database.get_db_connection()
+            try:
+                row = _fetch_stats_row(fresh_conn, session_id)
+            finally:
+                fresh_conn.close()
+        if row is None or row['updated_at'] is None:
+            return None
+
+    product_count = row['product_count'] or 0
+    return {
+        'keyword': row['keyword'],
+        'total_products': row['total_products'],
+        'platforms': json.loads(row['platform_stats'] or '{}'),
+        'price_stats': {
+            'min': row['min_price'] if product_count > 0 else 0,
+            'max': row['max_price'] if product_count > 0 else 0,
+            'average': row['avg_price'] if product_count > 0 else 0,
+            'total': product_count,
+            'percentiles': {
+                'p25': row['p25_price'],
+                'p50': row['p50_price'],
+                'p75': row['p75_price'],
+                'p90': row['p90_price'],
+            },
+        },
+        'filtered_count': row['filtered_count'] or 0,
+        'stats_updated_at': row['updated_at'],
+    }
+
+
+def rebuild_all_session_stats(cursor) -> int:
+    """為所有缺少統計的 session 補算統計（命令列工具使用；平常由 get_session_stats 在讀取時補算）"""
+    missing = cursor.execute(
+        """
+        SELECT s.id FROM crawl_sessions s
+        LEFT JOIN session_stats st ON st.session_id = s.id
+        WHERE st.session_id IS NULL
+        """
+    ).fetchall()
+    for (session_id,) in missing:
+        refresh_session_stats(cursor, session_id)
+    return len(missing)
+
+
+def main():
+    """命令列工具：一次補算所有缺少統計的 session（python -m core.session_stats）"""
+    database.init_db()
+    count = get_db_writer().execute(lambda conn: rebuild_all_session_stats(conn.cursor()))
+    print(f"✅ 已補算 {count} 個任務的統計資料")
+
+
+if __name__ == '__main__':
+    main()
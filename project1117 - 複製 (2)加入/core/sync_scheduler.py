@@ -0,0 +1,188 @@
+"""
+GitHub 資料背景同步排程
+取代在頁面請求與啟動流程中同步呼叫 auto_sync_if_needed 的做法（stale-while-revalidate）：
+
+- 請求一律立即讀取本地資料，不等待網路
+- 背景執行緒依固定間隔（加上隨機抖動）以條件式請求同步，遠端未變更時只花一個小請求
+- 失敗時以指數退避重試，不會在網路異常時持續重試
+- 頁面可以要求「資料過期時儘快在背景更新」，但不會等待更新完成
+"""
+
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from core.github_sync import sync_latest_database
+
+# 排程參數
+SYNC_INTERVAL_SECONDS = 3600   # 正常情況下的同步間隔
+JITTER_RATIO = 0.1             # 間隔的隨機抖動比例（避免多個實例同時請求）
+STARTUP_DELAY_SECONDS = 10     # 啟動後第一次同步前的等待（讓伺服器先開始服務）
+RETRY_BASE_SECONDS = 60        # 失敗後第一次重試的等待
+MAX_BACKOFF_SECONDS = 3600     # 退避等待的上限
+
+
+def _default_sync() -> Dict:
+    """預設的同步工作：有設定 DAILY_DEALS_DELTA_URL 時只取 daily_deals 變更集，否則條件式下載整個資料庫"""
+    delta_url = os.environ.get('DAILY_DEALS_DELTA_URL')
+    if delta_url:
+        from core.delta_sync import pull_changes
+        result = pull_changes(delta_url)
+        return {'status': 'updated' if result.get('inserted') or result.get('updated') else 'not_modified',
+                'version': result['watermark']}
+    return sync_latest_database()
+
+
+class SyncScheduler:
+    """在背景定期從 GitHub 同步資料的執行緒"""
+
+    def __init__(self, sync_func: Callable[[], Dict] = None,
+                 interval: float = SYNC_INTERVAL_SECONDS,
+                 jitter_ratio: float = JITTER_RATIO,
+                 startup_delay: float = STARTUP_DELAY_SECONDS,
+                 retry_base: float = RETRY_BASE_SECONDS,
+                 max_backoff: float = MAX_BACKOFF_SECONDS):
+        self.sync_func = sync_func or _default_sync
+        self.interval = interval
+        self.jitter_ratio = jitter_ratio
+        self.startup_delay = startup_delay
+        self.retry_base = retry_base
+        self.max_backoff = max_backoff
+        self._thread = None
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._sync_lock = threading.Lock()
+        self._next_run = None
+        self.syncing = False
+        self.consecutive_failures = 0
+        self.sync_count = 0
+        self.last_attempt: Optional[str] = None
+        self.last_success: Optional[str] = None
+        self._last_success_monotonic: Optional[float] = None
+        self.last_result: Optional[Dict] = None
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        """啟動背景執行緒（重複呼叫不會建立多個執行緒）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._next_run = time.monotonic() + self.startup_delay
+        self._thread = threading.Thread(target=self._run, name='github-sync', daemon=True)
+        self._thread.start()
+        print("🔄 GitHub 背景同步排程已啟動")
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def trigger(self):
+        """要求儘快在背景同步一次（不等待結果）"""
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        self._next_run = time.monotonic()
+        self._wakeup.set()
+
+    def is_stale(self, max_age_seconds: float = None) -> bool:
+        """距離上次成功同步是否已超過 max_age_seconds（預設為同步間隔）"""
+        if self._last_success_monotonic is None:
+            return True
+        max_age = self.interval if max_age_seconds is None else max_age_seconds
+        return time.monotonic() - self._last_success_monotonic > max_age
+
+    def refresh_if_stale(self, max_age_seconds: float = None) -> bool:
+        """
+        資料過期且目前沒有在同步、也不在失敗退避中時，要求背景同步
+
+        Returns:
+            bool: 是否觸發了背景同步
+        """
+        if self.syncing or self.consecutive_failures or not self.is_stale(max_age_seconds):
+            return False
+        self.trigger()
+        return True
+
+    def sync_now(self) -> Dict:
+        """
+        立即同步並等待結果（手動同步用）；與背景同步共用鎖，不會同時進行兩次同步
+
+        Returns:
+            Dict: 同步函式的結果（status 為 updated / not_modified / error）
+        """
+        with self._sync_lock:
+            self.syncing = True
+            self.last_attempt = datetime.now().isoformat()
+            try:
+                result = self.sync_func()
+            except Exception as e:
+                result = {'status': 'error', 'error': str(e)}
+            finally:
+                self.syncing = False
+
+            self.sync_count += 1
+            self.last_result = result
+            if result.get('status') == 'error':
+                self.consecutive_failures += 1
+                self.last_error = f"{self.last_attempt} {result.get('error')}"
+            else:
+                self.consecutive_failures = 0
+                self.last_success = datetime.now().isoformat()
+                self._last_success_monotonic = time.monotonic()
+            self._next_run = time.monotonic() + self._next_delay()
+            return result
+
+    def _next_delay(self) -> float:
+        """下一次同步前的等待秒數：成功時為間隔加抖動，失敗時指數退避"""
+        if self.consecutive_failures:
+            delay = min(self.max_backoff, self.retry_base * (2 ** (self.consecutive_failures - 1)))
+        else:
+            delay = self.interval
+        jitter = delay * self.jitter_ratio
+        return max(1.0, delay + random.uniform(-jitter, jitter))
+
+    def get_status(self) -> Dict:
+        """同步排程狀態"""
+        next_in = None if self._next_run is None else max(0.0, self._next_run - time.monotonic())
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'syncing': self.syncing,
+            'interval_seconds': self.interval,
+            'next_sync_in_seconds': None if next_in is None else round(next_in, 1),
+            'consecutive_failures': self.consecutive_failures,
+            'sync_count': self.sync_count,
+            'last_attempt': self.last_attempt,
+            'last_success': self.last_success,
+            'last_result': self.last_result,
+            'last_error': self.last_error,
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            wait = self._next_run - time.monotonic()
+            if wait > 0:
+                self._wakeup.wait(wait)
+                self._wakeup.clear()
+                continue
+            if self._stop.is_set():
+                break
+
+            result = self.sync_now()
+            if result.get('status') == 'error':
+                print(f"⚠️ 背景同步失敗（連續 {self.consecutive_failures} 次），"
+                      f"{self._next_run - time.monotonic():.0f} 秒後重試: {result.get('error')}")
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_sync_scheduler() -> SyncScheduler:
+    """取得全域共用的背景同步排程"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = SyncScheduler()
+        return _scheduler
@@ -21,20 +21,28 @@ if os.path.exists(config_path):
 # 啟動Flask應用
 if __name__ == '__main__':
     try:
-        # 自動同步 GitHub 資料庫
-        print("🔄 檢查資料庫更新...")
-        try:
-            from core.github_sync import auto_sync_if_needed
-            auto_sync_if_needed(max_age_hours=2)  # 如果超過2小時沒更新就同步
-        except Exception as e:
-            print(f"⚠️ 資料庫同步檢查失敗，將使用本地資料庫: {e}")
-        
         # 導入並啟動web應用
         from app.web_app import app, init_db
+        from core.maintenance import get_maintenance_scheduler
+        from core.embeddings import get_embedding_syncer
+        from core.minhash import get_title_indexer
+        from core.sync_scheduler import get_sync_scheduler
         
         # 初始化資料庫
         init_db()
         
+        # 啟動背景資料庫維護（閒置時分段回收空間、更新統計）
+        get_maintenance_scheduler().start()
+        
+        # 啟動背景標題索引（補建尚未建立索引的商品，之後處理新寫入的商品）
+        get_title_indexer().start()
+        
+        # 啟動背景標題向量索引同步
+        get_embedding_syncer().start()
+        
+        # 啟動 GitHub 背景同步（伺服器先以本地資料開始服務，不等待下載）
+        get_sync_scheduler().start()
+        
         print("🚀 爬蟲結果展示網站啟動中...")
         print("📁 請訪問: http://localhost:5000")
         print("💡 提示: 網站會自動從 GitHub 同步最新的促銷資料")
@@ -17,7 +17,7 @@ def main():
     print("=" * 40)
     
     try:
-        from core.github_sync import download_latest_database, check_database_update_time
+        from core.github_sync import sync_latest_database, check_database_update_time
         
         # 檢查當前資料庫狀態
         print("📊 檢查當前資料庫狀態...")
@@ -29,9 +29,11 @@ def main():
         
         if choice in ['y', 'yes']:
             print()
-            success = download_latest_database()
+            result = sync_latest_database()
             
-            if success:
+            if result['status'] == 'not_modified':
+                print("\n✅ 本地資料庫已是最新版本，無需下載。")
+            elif result['status'] == 'updated':
                 print("\n✅ 同步完成！現在可以啟動網站查看最新資料。")
                 print("💡 執行 'python main.py' 啟動網站")
             else: